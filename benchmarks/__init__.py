@@ -0,0 +1,4 @@
+"""Performance benchmarks of the scraper
+
+Run from the repository root with ``python -m benchmarks``, see
+``python -m benchmarks --help`` for the options."""
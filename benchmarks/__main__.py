@@ -0,0 +1,74 @@
+import argparse
+import json
+import os
+import re
+import sys
+
+from . import harness, suite
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _format(result: dict) -> str:
+    if 'error' in result:
+        return 'error: ' + result['error']
+    if result['kind'] == 'memory':
+        return 'peak %8.1f KiB  retained %8.1f KiB' % (result['peak'] / 1024, result['retained'] / 1024)
+    text = 'median %9.3f ms  min %9.3f ms' % (result['median'] * 1000, result['min'] * 1000)
+    if 'throughput' in result:
+        text += '  %8.2f MiB/s' % (result['throughput'] / 1024 / 1024)
+    return text
+
+
+def _report(name: str, result: dict) -> None:
+    print('%-60s %s' % (name, _format(result)), flush=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmark parsing, extraction, formatting and memory use.')
+    parser.add_argument('--filter', type=str, help='Only run the benchmarks whose name matches this regex')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs per timing benchmark')
+    parser.add_argument('--chapters', type=str, default=','.join(str(count) for count in suite.SYNTHETIC_CHAPTERS),
+                        help='Comma separated chapter counts of the synthetic stories')
+    parser.add_argument('--history', type=str, default=os.path.join(RESULTS, 'history.jsonl'),
+                        help='File every run is appended to')
+    parser.add_argument('--baseline', type=str,
+                        help='Compare against the results of this file (default: the last run in the history)')
+    parser.add_argument('--save-baseline', type=str, help='Also write the results of this run to this file')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with 1 when a regression is found')
+    args = parser.parse_args(argv)
+
+    benchmarks = suite.collect(tuple(int(count) for count in args.chapters.split(',') if count != ''))
+    if args.filter is not None:
+        pattern = re.compile(args.filter)
+        benchmarks = [benchmark for benchmark in benchmarks if pattern.search(benchmark.name)]
+
+    if args.baseline is not None:
+        baseline = harness.load_history(args.baseline)
+    else:
+        baseline = harness.load_history(args.history)
+    baseline = baseline[-1]['results'] if len(baseline) > 0 else {}
+
+    results = harness.run(benchmarks, repeat=args.repeat, report=_report)
+    record = harness.run_record(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    harness.append_history(args.history, record)
+    if args.save_baseline is not None:
+        # a baseline file holds a single run
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            baseline_file.write(json.dumps(record, sort_keys=True) + '\n')
+
+    regressions = harness.compare(results, baseline, threshold=args.threshold)
+    for regression in regressions:
+        print('REGRESSION %-49s %+.1f%% (%.6g -> %.6g)' % (regression['name'], regression['change'] * 100,
+                                                         regression['baseline'], regression['current']),
+              file=sys.stderr)
+    if len(baseline) == 0:
+        print('No baseline to compare against, this run is the baseline of the next one', file=sys.stderr)
+    return 1 if args.fail_on_regression and len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Timing, memory measurement, result history and regression detection"""
+from datetime import datetime, timezone
+from statistics import median
+from typing import Callable, Dict, List, NamedTuple, Optional
+import gc
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+
+class Benchmark(NamedTuple):
+    """A measured operation
+
+    ``setup`` runs before every measured call and its return value is passed to
+    ``function``, so state consumed by the function can be rebuilt untimed.
+    ``size`` is the number of input bytes, used to report throughput. Memory
+    benchmarks measure the peak allocation of one call and the size of what it
+    returns."""
+    name: str
+    function: Callable
+    setup: Optional[Callable] = None
+    size: int = 0
+    kind: str = 'time'
+
+
+def _prepare(benchmark: Benchmark) -> Callable:
+    if benchmark.setup is None:
+        return benchmark.function
+    argument = benchmark.setup()
+    return lambda: benchmark.function(argument)
+
+
+def measure(benchmark: Benchmark, repeat: int = 5, warmup: int = 1) -> dict:
+    if benchmark.kind == 'memory':
+        return _measure_memory(benchmark)
+    timings = []
+    for iteration in range(warmup + repeat):
+        function = _prepare(benchmark)
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        if iteration >= warmup:
+            timings.append(elapsed)
+    result = {'kind': 'time', 'median': median(timings), 'min': min(timings), 'repeat': repeat}
+    if benchmark.size > 0:
+        result['size'] = benchmark.size
+        result['throughput'] = benchmark.size / result['median']
+    return result
+
+
+def _measure_memory(benchmark: Benchmark) -> dict:
+    function = _prepare(benchmark)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = function()
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del kept
+    return {'kind': 'memory', 'peak': peak - before, 'retained': retained - before}
+
+
+def run(benchmarks: List[Benchmark], repeat: int = 5, report: Callable[[str, dict], None] = None) -> Dict[str, dict]:
+    """Measures every benchmark, a benchmark that raises is recorded with its error"""
+    results = {}
+    for benchmark in benchmarks:
+        try:
+            result = measure(benchmark, repeat=repeat)
+        except Exception as error:
+            result = {'kind': benchmark.kind, 'error': '%s: %s' % (type(error).__name__, error)}
+        results[benchmark.name] = result
+        if report is not None:
+            report(benchmark.name, result)
+    return results
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_record(results: Dict[str, dict]) -> dict:
+    """A history entry: the results with when and where they were measured"""
+    return {
+        'time': datetime.now(timezone.utc).isoformat(),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'node': platform.node(),
+        'results': results,
+    }
+
+
+def append_history(file_path: str, record: dict) -> None:
+    with open(file_path, 'a', encoding='utf-8') as history:
+        history.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def load_history(file_path: str) -> List[dict]:
+    records = []
+    try:
+        with open(file_path, 'r', encoding='utf-8') as history:
+            for line in history:
+                if line.strip() != '':
+                    records.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _value(result: dict) -> Optional[float]:
+    if 'error' in result:
+        return None
+    return result['median'] if result['kind'] == 'time' else result['peak']
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = 0.10,
+            min_delta: float = 0.0005) -> List[dict]:
+    """Lists the benchmarks that got slower or bigger than the baseline by more than ``threshold``
+
+    Time differences below ``min_delta`` seconds are ignored as noise."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        current, previous = _value(result), _value(baseline[name])
+        if current is None or previous is None or previous <= 0:
+            continue
+        if result['kind'] == 'time' and current - previous < min_delta:
+            continue
+        change = current / previous - 1
+        if change > threshold:
+            regressions.append({'name': name, 'baseline': previous, 'current': current, 'change': change})
+    return regressions
@@ -0,0 +1,98 @@
+"""Load test of the scraper against the local fake site server
+
+Scrapes synthetic stories of every site concurrently through one fetcher, as a
+batch run does, while the fake site injects latency, rate limiting and
+failures. Reports the stories per second, how every story ended and how many
+requests and retries it took, next to how the server answered.
+
+    python -m benchmarks.load --stories 20 --jobs 8 --latency lognormal:0.05,0.5 --unavailable 0.05"""
+from concurrent.futures import ThreadPoolExecutor
+from ff_scrape.fetch import DomainLimits, Fetcher
+from ff_scrape.storybase import Story
+from ff_scrape.testing.fakesite import FakeSiteServer, FakeSiteTransport, Faults, latency
+from ff_scrape.testing.synthetic import STORIES, synthetic_story
+from typing import Dict, List
+import argparse
+import logging
+import sys
+import time
+
+from .suite import site_class
+
+
+def scrape(site: str, url: str, fetcher: Fetcher, pause: float) -> Story:
+    processor = site_class(site)()
+    processor._chapter_sleep_time = pause
+    processor.fetcher = fetcher
+    processor.url = url
+    try:
+        processor.get_story()
+    except Exception:
+        fanfic = processor.fanfic if processor.fanfic is not None else Story(url)
+        fanfic.scrape_status = 'failed'
+        fanfic.metrics = processor.metrics
+        return fanfic
+    return processor.fanfic
+
+
+def run(server: FakeSiteServer, stories: List[tuple], jobs: int, fetcher: Fetcher, pause: float) -> Dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        scraped = list(pool.map(lambda story: scrape(story[0], story[1], fetcher, pause), stories))
+    seconds = time.perf_counter() - started
+
+    statuses: Dict[str, int] = {}
+    counts: Dict[str, int] = {}
+    for fanfic in scraped:
+        statuses[fanfic.scrape_status] = statuses.get(fanfic.scrape_status, 0) + 1
+        for name, count in fanfic.metrics.counts.items():
+            counts[name] = counts.get(name, 0) + count
+    return {'seconds': seconds, 'stories': len(scraped), 'statuses': statuses, 'counts': counts,
+            'server': dict(server.stats)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load',
+                                     description='Scrape synthetic stories from the fake site server under load.')
+    parser.add_argument('--sites', type=str, default=','.join(sorted(STORIES)), help='Comma separated sites')
+    parser.add_argument('--stories', type=int, default=10, help='Stories per site')
+    parser.add_argument('--chapters', type=int, default=10, help='Chapters per story')
+    parser.add_argument('--words', type=int, default=2000, help='Words per chapter')
+    parser.add_argument('--jobs', type=int, default=8, help='Stories scraped at the same time')
+    parser.add_argument('--per-domain', type=int, default=2, help='Concurrent requests per host')
+    parser.add_argument('--interval', type=float, default=0.0, help='Seconds between requests to a host')
+    parser.add_argument('--pause', type=float, default=0.0, help='Seconds the sites wait between chapters')
+    parser.add_argument('--retries', type=int, default=2, help='Retries of the fetcher')
+    parser.add_argument('--latency', type=str, help='Latency distribution, e.g. constant:0.1 or lognormal:0.05,0.5')
+    parser.add_argument('--rate-limit', type=float, help='Requests per second per host before answering 429')
+    parser.add_argument('--unavailable', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After of the 429 and 503 answers')
+    parser.add_argument('--truncate', type=float, default=0.0, help='Share of bodies cut off halfway')
+    parser.add_argument('--reset', type=float, default=0.0, help='Share of connections reset')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the injected faults')
+    args = parser.parse_args(argv)
+
+    logging.getLogger('ff_scrape').setLevel(logging.CRITICAL)
+    faults = Faults(latency=latency(args.latency) if args.latency is not None else None, rate_limit=args.rate_limit,
+                    unavailable=args.unavailable, retry_after=args.retry_after, truncate=args.truncate,
+                    reset=args.reset, seed=args.seed)
+    with FakeSiteServer(faults=faults) as server:
+        stories = []
+        for site in args.sites.split(','):
+            for story_id in range(1, args.stories + 1):
+                story = synthetic_story(site, story_id=story_id, chapters=args.chapters, words=args.words)
+                server.add_story(story)
+                stories.append((site, story.url))
+        fetcher = Fetcher(limits=DomainLimits(concurrency=args.per_domain, interval=args.interval),
+                          transport=FakeSiteTransport(server), retries=args.retries)
+        result = run(server, stories, args.jobs, fetcher, args.pause)
+
+    print('%d stories in %.2f s, %.2f stories/s' % (result['stories'], result['seconds'],
+                                                     result['stories'] / result['seconds']))
+    for group in ['statuses', 'counts', 'server']:
+        print('%-9s %s' % (group, ', '.join('%s %d' % item for item in sorted(result[group].items()))))
+    return 0 if result['statuses'].get('failed', 0) == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
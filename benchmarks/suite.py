@@ -0,0 +1,247 @@
+"""Benchmarks over the HTML fixtures of the site tests
+
+For every fixture page this measures how fast each parser backend reads it,
+how fast the site extracts the metadata, how fast a whole story is scraped when
+every request is answered with the page and how much memory the resulting
+Story takes, plus the throughput of the formatters on that story. Scaled
+variants repeat the scraped chapters up to a fixed amount of text to show
+how memory grows with story size.
+Pages a site can not scrape whole (index pages without chapter text) only get
+the parse and metadata benchmarks.
+
+The synthetic benchmarks scrape generated stories of every site at growing
+chapter counts, giving time and memory scaling curves beyond the fixtures. Archives of real
+traffic in benchmarks/archives, recorded with ``ff_scrape --record``, are
+replayed as whole story scrapes."""
+from ff_scrape.fetch import Fetcher
+from ff_scrape.storybase import Story, Chapter
+from ff_scrape.testing.replay import Cassette, ReplaySession
+from ff_scrape.testing.synthetic import STORIES, SyntheticSession, SyntheticStory, synthetic_story
+from glob import glob
+from importlib import import_module
+from os import path
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import logging
+
+from .harness import Benchmark
+
+FIXTURES = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'tests')
+ARCHIVES = path.join(path.dirname(path.abspath(__file__)), 'archives')
+
+# fixture directory: (site class, story URL the fixture pages are served for)
+SITES = {
+    'fanfiction': ('ff_scrape.sites.fanfiction:Fanfiction', 'https://www.fanfiction.net/s/1/1'),
+    'archiveofourown': ('ff_scrape.sites.archiveofourown:ArchiveofOurOwn', 'https://archiveofourown.org/works/1'),
+    'ficwad': ('ff_scrape.sites.ficwad:Ficwad', 'https://ficwad.com/story/1'),
+    'fanficauthors': ('ff_scrape.sites.fanficauthors:FanficAuthors', 'https://author.fanficauthors.net/Story/index'),
+    'hpfanficarchive': ('ff_scrape.sites.hpfanficarchive:HPFanficArchive',
+                        'http://www.hpfanficarchive.com/stories/viewstory.php?sid=1'),
+    'animationsource': ('ff_scrape.sites.animationsource:AnimationSource',
+                        'https://www.animationsource.org/fandom/en/view_fanfic/story/1.html'),
+}
+
+# the scaled memory benchmarks repeat the scraped chapters up to this many bytes of text
+SCALED_SIZE = 16 * 1024 * 1024
+
+# chapter counts and words per chapter of the synthetic stories
+SYNTHETIC_CHAPTERS = (10, 100)
+SYNTHETIC_WORDS = 2000
+
+
+class _Response(object):
+    def __init__(self, text: str):
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class FixtureSession(object):
+    """Stands in for a requests session, answering every request with the same page"""
+    realtime = False
+
+    def __init__(self, text: str):
+        self._text = text
+        self.requests = 0
+
+    def get(self, url, cookies=None, timeout=None) -> _Response:
+        self.requests += 1
+        return _Response(self._text)
+
+
+def site_class(name: str):
+    module, class_name = SITES[name][0].split(':')
+    return getattr(import_module(module), class_name)
+
+
+def fixture_pages() -> List[Tuple[str, str, str]]:
+    """(site, fixture name, page) of every story fixture"""
+    pages = []
+    for site in sorted(SITES):
+        for file_path in sorted(glob(path.join(FIXTURES, site, 'data', 'good_story*.html'))):
+            with open(file_path, 'r', encoding='utf-8') as page:
+                pages.append((site, path.splitext(path.basename(file_path))[0], page.read()))
+    return pages
+
+
+def parser_backends() -> List[str]:
+    backends = ['html.parser', 'html5lib']
+    try:
+        import lxml  # noqa: F401
+        backends.append('lxml')
+    except ImportError:
+        pass
+    return backends
+
+
+def formatters() -> List[Tuple[str, Callable[[Story], None]]]:
+    from ff_scrape.formatters.text import Text
+
+    found = [('text', Text.format)]
+    try:
+        import html2bbcode  # noqa: F401
+        from ff_scrape.formatters.bbcode import BBCode
+
+        found.append(('bbcode', BBCode.format))
+    except ImportError:
+        pass
+    return found
+
+
+def scrape(site: str, page: str) -> Story:
+    """Runs the whole get_story path of the site with every request answered by the page"""
+    processor = site_class(site)()
+    processor._chapter_sleep_time = 0
+    processor.fetcher = Fetcher(transport=FixtureSession(page))
+    processor.url = SITES[site][1]
+    processor.get_story()
+    return processor.fanfic
+
+
+def scrape_synthetic(story: SyntheticStory, session: SyntheticSession = None) -> Story:
+    processor = site_class(story.site)()
+    processor._chapter_sleep_time = 0
+    processor.fetcher = Fetcher(transport=SyntheticSession(story) if session is None else session)
+    processor.url = story.url
+    processor.get_story()
+    return processor.fanfic
+
+
+def scrape_replay(site: str, cassette: Cassette, url: str) -> Story:
+    processor = site_class(site)()
+    processor.fetcher = Fetcher(transport=ReplaySession(cassette))
+    processor.url = url
+    processor.get_story()
+    return processor.fanfic
+
+
+def _archive_site(url: str) -> Optional[str]:
+    hostname = urlsplit(url).hostname or ''
+    for site, (_, site_url) in SITES.items():
+        site_host = urlsplit(site_url).hostname.split('.')[-2:]
+        if hostname.split('.')[-2:] == site_host:
+            return site
+    return None
+
+
+def _replayed() -> List[Benchmark]:
+    benchmarks = []
+    for archive in sorted(glob(path.join(ARCHIVES, '*.zip'))):
+        cassette = Cassette.load(archive)
+        if len(cassette) == 0:
+            continue
+        # the first request of a recorded scrape is the story URL
+        url = cassette.urls[0]
+        site = _archive_site(url)
+        if site is None:
+            continue
+        size = sum(len(response.content) for recorded in cassette.urls for response in cassette.interactions(recorded))
+        name = 'replay/%s/%s' % (site, path.splitext(path.basename(archive))[0])
+        benchmarks.append(Benchmark(name, lambda argument=None, site=site, cassette=cassette, url=url:
+                                    scrape_replay(site, cassette, url), size=size))
+    return benchmarks
+
+
+def _extract_metadata(site: str, page: str) -> Callable:
+    def extract(argument=None) -> Story:
+        from bs4 import BeautifulSoup
+
+        processor = site_class(site)()
+        processor.url = SITES[site][1]
+        processor._fanfic = Story(processor.url)
+        processor._soup = BeautifulSoup(page, features='html5lib')
+        processor.record_story_metadata()
+        return processor._fanfic
+    return extract
+
+
+def _parse(page: str, backend: str) -> Callable:
+    def parse(argument=None):
+        from bs4 import BeautifulSoup
+
+        return BeautifulSoup(page, features=backend)
+    return parse
+
+
+def _copy_chapters(fanfic: Story, size: int = None) -> Callable[[], Story]:
+    """Builds a copy of the story, with its chapters repeated until they hold ``size`` bytes of text"""
+    def build() -> Story:
+        story = Story(fanfic.url)
+        copied = 0
+        while copied == 0 or (size is not None and copied < size):
+            for chapter in fanfic.chapters:
+                copied += len(chapter.raw_body) + len(chapter.processed_body)
+                duplicate = Chapter()
+                duplicate.name = chapter.name
+                # build new strings so every copy really takes memory
+                duplicate.raw_body = ''.join(list(chapter.raw_body))
+                duplicate.processed_body = ''.join(list(chapter.processed_body))
+                duplicate.word_count = chapter.word_count
+                story.add_chapter(duplicate)
+        return story
+    return build
+
+
+def _synthetic(chapters: Tuple[int, ...]) -> List[Benchmark]:
+    benchmarks = []
+    for site in sorted(STORIES):
+        for count in chapters:
+            story = synthetic_story(site, chapters=count, words=SYNTHETIC_WORDS)
+            name = 'synthetic/%s/%dx%d' % (site, count, SYNTHETIC_WORDS)
+            # a warm-up scrape tells which pages the site really fetches
+            session = SyntheticSession(story)
+            scrape_synthetic(story, session)
+            pages = [page for page in map(story.page, session.requested) if page is not None]
+            size = sum(len(page if isinstance(page, bytes) else page.encode('utf-8')) for page in pages)
+            benchmarks.append(Benchmark(name, lambda argument=None, story=story: scrape_synthetic(story), size=size))
+            benchmarks.append(Benchmark('memory/' + name, lambda story=story: scrape_synthetic(story), kind='memory'))
+    return benchmarks
+
+
+def collect(chapters: Tuple[int, ...] = SYNTHETIC_CHAPTERS) -> List[Benchmark]:
+    # the sites log every chapter, keep the measurements free of logging
+    logging.getLogger('ff_scrape').setLevel(logging.CRITICAL)
+    benchmarks = []
+    for site, fixture, page in fixture_pages():
+        size = len(page.encode('utf-8'))
+        prefix = '%s/%s' % (site, fixture)
+        for backend in parser_backends():
+            benchmarks.append(Benchmark('parse/%s/%s' % (prefix, backend), _parse(page, backend), size=size))
+        benchmarks.append(Benchmark('metadata/' + prefix, _extract_metadata(site, page), size=size))
+
+        try:
+            fanfic = scrape(site, page)
+        except Exception:
+            # an index page without chapter text, the site can only read its metadata
+            continue
+        if fanfic.chapter_count == 0:
+            continue
+        benchmarks.append(Benchmark('story/' + prefix, lambda argument=None, site=site, page=page: scrape(site, page),
+                                    size=size))
+        story_size = sum(len(chapter.processed_body.encode('utf-8')) for chapter in fanfic.chapters)
+        for name, format_story in formatters():
+            benchmarks.append(Benchmark('format/%s/%s' % (prefix, name), format_story,
+                                        setup=_copy_chapters(fanfic), size=story_size))
+        benchmarks.append(Benchmark('memory/' + prefix, _copy_chapters(fanfic), kind='memory'))
+        benchmarks.append(Benchmark('memory/%s/%dMiB' % (prefix, SCALED_SIZE // 1024 // 1024),
+                                    _copy_chapters(fanfic, SCALED_SIZE), kind='memory'))
+    return benchmarks + _synthetic(chapters) + _replayed()
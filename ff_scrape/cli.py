@@ -1,11 +1,160 @@
-from ff_scrape.scraper import ff_scrape
+from ff_scrape.scraper import iter_scrape, queue_urls, run_queue_workers
+from ff_scrape.fetch import default_fetcher
+from ff_scrape.metrics import registry, json_line
+from typing import Iterable, Iterator, List
 import argparse
+import sys
+import time
 
-def scrape():
+
+def _read_urls(lines: Iterable[str]) -> Iterator[str]:
+    """Yields the URLs of an input file, one per line, skipping blank lines and # comments"""
+    for line in lines:
+        line = line.strip()
+        if line != '' and not line.startswith('#'):
+            yield line
+
+
+def _input_urls(args) -> Iterator[str]:
+    if args.url is not None:
+        yield from args.url
+    if args.input == '-':
+        yield from _read_urls(sys.stdin)
+    elif args.input is not None:
+        with open(args.input, 'r', encoding='utf-8') as input_file:
+            yield from _read_urls(input_file)
+
+
+def _size(count: float) -> str:
+    for unit in ['B', 'KiB', 'MiB']:
+        if count < 1024:
+            return '%.1f %s' % (count, unit)
+        count /= 1024
+    return '%.1f GiB' % count
+
+
+def main(argv: List[str] = None) -> int:
     parser = argparse.ArgumentParser(description='Scrape fanfiction websites to obtain the story text.')
-    parser.add_argument('--url', type=str, help='URL to obtain the details for', required=True, action='append')
+    parser.add_argument('--url', type=str, help='URL to obtain the details for', action='append')
+    parser.add_argument('--input', type=str, help='File with one URL per line, - reads standard input')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of stories scraped at the same time')
     parser.add_argument('--formatter', type=str, help='Formatter for after scrape processing')
+    parser.add_argument('--recorder', type=str, default='epub',
+                        help='Recorder used to write the story to disk while it is scraped, none turns it off '
+                             '(default: epub)')
+    parser.add_argument('--output', type=str, help='Directory the recorder writes to (default: archive_path)')
+    parser.add_argument('--backup', type=str, help='Directory replaced files are kept in (default: backup_path)')
+    parser.add_argument('--story-timeout', type=float, help='Seconds after which a story is stopped')
+    parser.add_argument('--batch-timeout', type=float, help='Seconds after which the whole run is stopped')
+    parser.add_argument('--metrics-file', type=str, help='Write the metrics in the Prometheus text format to this file')
+    parser.add_argument('--metrics-log', type=str, help='Append the metrics of every story as a JSON line to this file')
+    parser.add_argument('--record', type=str, help='Save every response to this archive for later replay')
+    parser.add_argument('--replay', type=str, help='Answer every request from this archive instead of the network')
+
+    args = parser.parse_args(argv)
+    if args.url is None and args.input is None:
+        parser.error('one of --url or --input is required')
+    recorder = None if args.recorder.lower() == 'none' else args.recorder
+
+    fetcher = default_fetcher()
+    transport = fetcher.transport
+    cassette = None
+    if args.replay is not None:
+        from ff_scrape.testing.replay import ReplaySession
+
+        fetcher.transport = ReplaySession.load(args.replay)
+    elif args.record is not None:
+        from ff_scrape.testing.replay import Cassette, RecordingSession
+
+        cassette = Cassette()
+        fetcher.transport = RecordingSession(cassette)
+    bytes_before = fetcher.bytes_received
+    started = time.monotonic()
+    counts = {}
+    chapters = 0
+    metrics_log = open(args.metrics_log, 'a', encoding='utf-8') if args.metrics_log is not None else None
+    try:
+        for fanfic in iter_scrape(_input_urls(args), formatter=args.formatter, recorder=recorder,
+                                  output_dir=args.output, jobs=args.jobs, story_timeout=args.story_timeout,
+                                  batch_timeout=args.batch_timeout, backup_dir=args.backup):
+            counts[fanfic.scrape_status] = counts.get(fanfic.scrape_status, 0) + 1
+            chapters += fanfic.chapter_count
+            print('%s\t%d\t%s' % (fanfic.scrape_status, fanfic.chapter_count, fanfic.url), flush=True)
+            if metrics_log is not None:
+                metrics_log.write(json_line(fanfic.url, fanfic.scrape_status, fanfic.metrics) + '\n')
+                metrics_log.flush()
+    finally:
+        if metrics_log is not None:
+            metrics_log.close()
+        if args.metrics_file is not None:
+            registry.write_prometheus(args.metrics_file)
+        if cassette is not None:
+            cassette.save(args.record)
+        fetcher.transport = transport
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    stories = sum(counts.values())
+    received = fetcher.bytes_received - bytes_before
+    print('%d stories (%s), %d chapters, %s downloaded in %.1fs: %.2f stories/s, %.2f chapters/s, %s/s' % (
+        stories, ', '.join('%d %s' % (count, status) for status, count in sorted(counts.items())) or 'none',
+        chapters, _size(received), elapsed, stories / elapsed, chapters / elapsed, _size(received / elapsed)),
+        file=sys.stderr)
+    return 0 if counts.get('complete', 0) == stories else 1
+
+
+def worker(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Work the scrape jobs of a shared job queue.')
+    parser.add_argument('--queue', type=str, help='Job queue database shared by all workers', required=True)
+    parser.add_argument('--add', type=str, help='Only add the URLs of this file (- reads standard input) to the queue')
+    parser.add_argument('--threads', type=int, default=1, help='Number of jobs worked on at the same time')
+    parser.add_argument('--recorder', type=str, default='epub', help='Recorder used to write the stories to disk')
+    parser.add_argument('--output', type=str, help='Directory the recorder writes to (default: archive_path)')
+    parser.add_argument('--story-timeout', type=float, help='Seconds after which a story is stopped and retried')
+
+    args = parser.parse_args(argv)
+    if args.add is not None:
+        args.url = None
+        args.input = args.add
+        print('%d stories queued' % queue_urls(args.queue, _input_urls(args)), file=sys.stderr)
+        return 0
+    try:
+        run_queue_workers(args.queue, threads=args.threads, recorder=args.recorder, output_dir=args.output,
+                          story_timeout=args.story_timeout)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def server(argv: List[str] = None) -> int:
+    from ff_scrape.server import ScrapeService, ScrapeHTTPServer
+
+    parser = argparse.ArgumentParser(description='Serve scrape requests over a local HTTP API.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8750, help='TCP port to listen on')
+    parser.add_argument('--socket', type=str, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--jobs', type=int, default=4, help='Number of stories scraped at the same time')
+    parser.add_argument('--recorder', type=str, default='epub', help='Recorder used to write the stories to disk')
+    parser.add_argument('--output', type=str, help='Directory the recorder writes to (default: archive_path)')
+    parser.add_argument('--story-timeout', type=float, help='Seconds after which a story is stopped')
+
+    args = parser.parse_args(argv)
+    service = ScrapeService(jobs=args.jobs, recorder=args.recorder, output_dir=args.output,
+                            story_timeout=args.story_timeout)
+    if args.socket is not None:
+        from ff_scrape.server import ScrapeUnixServer
+
+        httpd = ScrapeUnixServer(args.socket, service)
+    else:
+        httpd = ScrapeHTTPServer((args.host, args.port), service)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+    return 0
 
-    args = parser.parse_args()
-    ff_scrape(args.url, formatter=args.formatter)
 
+# the console script used to be called scrape
+scrape = main
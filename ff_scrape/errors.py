@@ -11,3 +11,13 @@ class ParameterError(Exception):
 class StoryError(Exception):
     def __init__(self, value):
         self.value = value
+
+
+class DeadlineError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+class ReplayError(Exception):
+    def __init__(self, value):
+        self.value = value
@@ -0,0 +1,372 @@
+"""Shared page fetching for all sites
+
+Every site fetches its pages through a Fetcher. The fetcher keeps a requests
+session per thread so connections are reused, and coalesces concurrent requests
+for the same page: while a page is being downloaded, other threads asking for
+it wait for that download and share its response instead of starting their own.
+Optional per domain limits cap the concurrent requests to, and the request rate
+of, every host. Every request has connect and read timeouts, shortened further
+when the caller passes a deadline that is about to pass. Requests answered with
+429 or 503, or whose connection breaks, are retried after the Retry-After the
+site asked for, or an exponential backoff when it gave none.
+
+A transport can take the place of the network: any object with the ``get``
+method of a requests session, shared by all threads. Transports that are not
+``realtime`` (replayed or generated pages) skip the domain limits and the
+pauses sites take between requests."""
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from typing import Callable, Dict, Hashable, Optional, Tuple, TYPE_CHECKING
+from ff_scrape.errors import DeadlineError
+from ff_scrape.metrics import StoryMetrics
+
+if TYPE_CHECKING:
+    from requests import Response, Session
+
+# statuses sites answer with when they want the request repeated later
+RETRY_STATUSES = (429, 503)
+
+
+class Deadline(object):
+    """Point in time by which a story or a batch of stories has to be done"""
+
+    def __init__(self, seconds: float):
+        self._expires = time.monotonic() + seconds
+
+    @classmethod
+    def earliest(cls, *deadlines: Optional['Deadline']) -> Optional['Deadline']:
+        """The deadline that passes first, ignoring missing ones"""
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if len(deadlines) == 0:
+            return None
+        return min(deadlines, key=lambda deadline: deadline._expires)
+
+    def remaining(self) -> float:
+        return max(self._expires - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self._expires
+
+    def check(self) -> None:
+        if self.expired:
+            raise DeadlineError("Deadline exceeded")
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Runs a function once per key for all callers that overlap in time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, function: Callable, deadline: Deadline = None):
+        return self.call(key, function, deadline)[0]
+
+    def call(self, key: Hashable, function: Callable, deadline: Deadline = None) -> Tuple[object, bool]:
+        """Like do, also returning whether the result came from another caller's run
+
+        A caller waiting on another caller's run gives up once its own deadline
+        passes, and runs the function again when that run hit its deadline."""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.coalesced += 1
+                    leader = False
+                else:
+                    call = _Call()
+                    self._calls[key] = call
+                    leader = True
+            if leader:
+                break
+
+            if not call.done.wait(None if deadline is None else deadline.remaining()):
+                raise DeadlineError("Deadline exceeded waiting for %s" % (key,))
+            if isinstance(call.error, DeadlineError):
+                # the other caller ran out of time, this one may still have some
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _Domain(object):
+    def __init__(self, concurrency: int):
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+
+
+class DomainLimits(object):
+    """Caps concurrent requests per host and spaces out request starts
+
+    ``interval`` is the minimum number of seconds between two requests to the
+    same host, ``overrides`` maps hostnames to their own (concurrency, interval)."""
+
+    def __init__(self, concurrency: int = 2, interval: float = 0.0, overrides: Dict[str, tuple] = None):
+        self._concurrency = concurrency
+        self._interval = interval
+        self._overrides = overrides or {}
+        self._domains = {}
+        self._lock = threading.Lock()
+
+    def _domain(self, hostname: str) -> _Domain:
+        with self._lock:
+            if hostname not in self._domains:
+                concurrency, interval = self._overrides.get(hostname, (self._concurrency, self._interval))
+                self._domains[hostname] = _Domain(concurrency)
+            return self._domains[hostname]
+
+    def interval(self, hostname: str) -> float:
+        return self._overrides.get(hostname, (self._concurrency, self._interval))[1]
+
+    @contextmanager
+    def slot(self, hostname: str):
+        """Blocks until a request to the host may start"""
+        domain = self._domain(hostname)
+        with domain.slots:
+            with domain.lock:
+                now = time.monotonic()
+                wait = domain.next_start - now
+                domain.next_start = max(now, domain.next_start) + self.interval(hostname)
+            if wait > 0:
+                time.sleep(wait)
+            yield
+
+
+def retry_after(response: 'Response', default: float) -> float:
+    """Seconds the response asks to wait before the next request, ``default`` if it does not say"""
+    value = (getattr(response, 'headers', None) or {}).get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def _transient(error: Exception) -> bool:
+    """Whether the request failed on a broken or timed out connection and may succeed when repeated"""
+    import requests
+
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+class Fetcher(object):
+    """Fetches pages with pooled connections and in-flight request coalescing
+
+    ``timeout`` is the (connect, read) timeout in seconds of every request,
+    ``transport`` replaces the requests sessions when given. A request is tried
+    again up to ``retries`` times, waiting ``backoff`` seconds doubled on every
+    retry unless the site sends a Retry-After, and never more than ``max_wait``."""
+
+    def __init__(self, limits: DomainLimits = None, timeout: Tuple[float, float] = (10.0, 60.0), transport=None,
+                 retries: int = 2, backoff: float = 1.0, max_wait: float = 60.0):
+        self._local = threading.local()
+        self._transport = transport
+        self._flight = SingleFlight()
+        self._limits = limits
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._bytes_received = 0
+        self.retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self._retried = 0
+        self._cookies: Dict[Tuple[str, str], str] = {}
+        self._cookie_version = 0
+
+    @property
+    def session(self) -> 'Session':
+        """The requests session of the calling thread, or the transport"""
+        if self._transport is not None:
+            return self._transport
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            self._local.session = session
+        if getattr(self._local, 'cookie_version', 0) != self._cookie_version:
+            with self._lock:
+                cookies = dict(self._cookies)
+                self._local.cookie_version = self._cookie_version
+            for (domain, name), value in cookies.items():
+                session.cookies.set(name, value, domain=domain)
+        return session
+
+    def set_cookie(self, name: str, value: str, domain: str) -> None:
+        """Keeps a cookie in the session of every thread, so all later requests to the domain send it
+
+        Transports keep their own cookies and do not get it."""
+        with self._lock:
+            if self._cookies.get((domain, name)) == value:
+                return
+            self._cookies[(domain, name)] = value
+            self._cookie_version += 1
+
+    @property
+    def limits(self) -> Optional[DomainLimits]:
+        return self._limits
+
+    @limits.setter
+    def limits(self, limits: Optional[DomainLimits]) -> None:
+        self._limits = limits
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @transport.setter
+    def transport(self, transport) -> None:
+        self._transport = transport
+
+    @property
+    def realtime(self) -> bool:
+        """Whether requests take real time, False when pages come from a replaying or generating transport"""
+        return getattr(self._transport, 'realtime', True)
+
+    def sleep(self, seconds: float) -> None:
+        """Waits between two requests of a site, returns at once when not realtime"""
+        if self.realtime:
+            time.sleep(seconds)
+
+    @property
+    def coalesced(self) -> int:
+        """Number of requests that were answered by another in-flight request"""
+        return self._flight.coalesced
+
+    @property
+    def retried(self) -> int:
+        """Number of requests that had to be repeated"""
+        return self._retried
+
+    @property
+    def bytes_received(self) -> int:
+        """Total size of the response bodies downloaded so far"""
+        return self._bytes_received
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout: Tuple[float, float]) -> None:
+        self._timeout = timeout
+
+    def get(self, url: str, cookies=None, deadline: Deadline = None, metrics: StoryMetrics = None) -> 'Response':
+        """Fetch a page, raising DeadlineError if the deadline passes first
+
+        With ``metrics`` the request is counted as a request or, when another
+        in-flight request answered it, as a cache hit. Every retry and every
+        redirect followed is counted as well."""
+        if deadline is not None:
+            deadline.check()
+        # requests carrying different cookies may see different pages, only share identical ones
+        key = (url, id(cookies)) if cookies is not None else url
+        response, shared = self._flight.call(key, lambda: self._get(url, cookies, deadline, metrics), deadline)
+        if metrics is not None:
+            if shared:
+                metrics.count('cache_hits')
+            else:
+                metrics.count('requests')
+                metrics.add_bytes('in', len(response.content))
+                redirects = len(getattr(response, 'history', None) or [])
+                if redirects > 0:
+                    metrics.count('redirects', redirects)
+        return response
+
+    def _request_timeout(self, deadline: Optional[Deadline]) -> Tuple[float, float]:
+        if deadline is None:
+            return self._timeout
+        deadline.check()
+        remaining = deadline.remaining()
+        return min(self._timeout[0], remaining), min(self._timeout[1], remaining)
+
+    def _send(self, url: str, cookies, deadline: Optional[Deadline]) -> 'Response':
+        try:
+            response = self.session.get(url, cookies=cookies, timeout=self._request_timeout(deadline))
+            with self._lock:
+                self._bytes_received += len(response.content)
+            return response
+        except DeadlineError:
+            raise
+        except Exception as error:
+            # a timeout cut short by the deadline is reported as the deadline passing
+            if deadline is not None and deadline.expired:
+                raise DeadlineError("Deadline exceeded while fetching %s" % url) from error
+            raise
+
+    def _attempt(self, url: str, cookies, deadline: Optional[Deadline]) -> 'Response':
+        if self._limits is None or not self.realtime:
+            return self._send(url, cookies, deadline)
+        with self._limits.slot(urlsplit(url).hostname):
+            return self._send(url, cookies, deadline)
+
+    def _get(self, url: str, cookies, deadline: Optional[Deadline] = None,
+             metrics: StoryMetrics = None) -> 'Response':
+        attempt = 0
+        while True:
+            try:
+                response = self._attempt(url, cookies, deadline)
+            except DeadlineError:
+                raise
+            except Exception as error:
+                if attempt >= self.retries or not _transient(error):
+                    raise
+                wait = self.backoff * 2 ** attempt
+            else:
+                if getattr(response, 'status_code', 200) not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                wait = retry_after(response, self.backoff * 2 ** attempt)
+            wait = min(wait, self.max_wait)
+            if deadline is not None and deadline.remaining() < wait:
+                raise DeadlineError("Deadline exceeded waiting to retry %s" % url)
+            self.sleep(wait)
+            attempt += 1
+            with self._lock:
+                self._retried += 1
+            if metrics is not None:
+                metrics.count('retries')
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher() -> Fetcher:
+    """The fetcher shared by every site that was not given its own"""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+    return _default_fetcher
@@ -1,13 +1,15 @@
 from .base import Formatter
 from ff_scrape.sites.base import Story
 import re
-from html2bbcode.parser import HTML2BBCode
 
 
 class BBCode(Formatter):
 
     @classmethod
     def format(cls, fanfic: Story) -> None:
+        # html2bbcode is only needed by this formatter, keep it out of the import path
+        from html2bbcode.parser import HTML2BBCode
+
         new_line_regex = re.compile("\n")
         for chapter in fanfic.chapters:
             story_text = chapter.processed_body
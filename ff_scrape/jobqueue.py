@@ -0,0 +1,250 @@
+"""Durable scrape job queue shared by worker processes
+
+Jobs live in a SQLite database. A worker leases a job for a limited time and
+keeps extending the lease with heartbeats while it scrapes; a job whose lease
+runs out (because its worker died) is handed to the next worker. Finished jobs
+are acknowledged and removed, failed ones are retried with exponential backoff
+and moved to the dead letter table once they used up their attempts.
+
+Every change runs in its own immediate transaction, so any number of workers in
+any number of processes can share the database. Workers on other machines can
+share it over a network mount as long as that file system implements locking
+(the default rollback journal is used for that reason, WAL needs shared memory).
+Lease times use the wall clock, keep the clocks of the machines in sync."""
+from ff_scrape.routing import CanonicalizationReport, CanonicalURL
+from ff_scrape.storybase import Story
+from typing import Callable, Dict, List, NamedTuple, Optional
+from contextlib import contextmanager
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site TEXT NOT NULL,
+    story_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    UNIQUE (site, story_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_available ON jobs (state, available_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    story_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class Job(NamedTuple):
+    id: int
+    site: str
+    story_id: str
+    url: str
+    attempts: int
+
+    @property
+    def canonical(self) -> CanonicalURL:
+        return CanonicalURL(self.site, self.story_id, self.url)
+
+
+def worker_name() -> str:
+    """Identifies the calling thread across machines and processes"""
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), threading.get_ident())
+
+
+class JobQueue(object):
+    """Scrape jobs with leases, retries and a dead letter table
+
+    A failed job becomes available again after ``backoff`` seconds, doubled for
+    every further attempt up to ``max_backoff``. After ``max_attempts`` attempts
+    (an expired lease counts as one) it is moved to the dead letters."""
+
+    def __init__(self, path: str, lease_time: float = 300.0, max_attempts: int = 5, backoff: float = 60.0,
+                 max_backoff: float = 3600.0, busy_timeout: float = 30.0):
+        # autocommit mode, transactions are started explicitly
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.lease_time = lease_time
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never lease the same job
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def add(self, report: CanonicalizationReport, now: float = None) -> int:
+        """Queues the stories of a canonicalization report, returns how many were not queued yet"""
+        now = time.time() if now is None else now
+        added = 0
+        with self._transaction() as db:
+            for canonical in report.unique:
+                cursor = db.execute("INSERT OR IGNORE INTO jobs (site, story_id, url, available_at) VALUES (?, ?, ?, ?)",
+                                    (canonical.site, canonical.story_id, canonical.url, now))
+                added += cursor.rowcount
+        return added
+
+    def _bury(self, db: sqlite3.Connection, job_id: int, error: str, now: float) -> None:
+        db.execute("INSERT INTO dead_letters (id, site, story_id, url, attempts, last_error, failed_at) "
+                   "SELECT id, site, story_id, url, attempts, ?, ? FROM jobs WHERE id = ?", (error, now, job_id))
+        db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def lease(self, owner: str, now: float = None, limit: int = 1) -> List[Job]:
+        """Hands out up to ``limit`` available jobs, including ones whose lease expired"""
+        now = time.time() if now is None else now
+        jobs = []
+        with self._transaction() as db:
+            # jobs whose worker vanished after their last attempt go to the dead letters
+            for job_id, in db.execute("SELECT id FROM jobs WHERE state = 'leased' AND lease_expires <= ? "
+                                      "AND attempts >= ?", (now, self._max_attempts)).fetchall():
+                self._bury(db, job_id, 'Lease expired', now)
+            rows = db.execute("SELECT id, site, story_id, url, attempts FROM jobs "
+                              "WHERE (state = 'queued' AND available_at <= ?) "
+                              "OR (state = 'leased' AND lease_expires <= ?) "
+                              "ORDER BY available_at, id LIMIT ?", (now, now, limit)).fetchall()
+            for job_id, site, story_id, url, attempts in rows:
+                db.execute("UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                           "WHERE id = ?", (owner, now + self.lease_time, job_id))
+                jobs.append(Job(job_id, site, story_id, url, attempts + 1))
+        return jobs
+
+    def heartbeat(self, job: Job, owner: str, now: float = None) -> bool:
+        """Extends the lease of a job, returns False if the job was taken over in the meantime"""
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                                (now + self.lease_time, job.id, owner))
+            return cursor.rowcount > 0
+
+    def ack(self, job: Job, owner: str) -> bool:
+        """Removes a finished job, returns False if the job was taken over in the meantime"""
+        with self._transaction() as db:
+            cursor = db.execute("DELETE FROM jobs WHERE id = ? AND owner = ? AND state = 'leased'", (job.id, owner))
+            return cursor.rowcount > 0
+
+    def fail(self, job: Job, owner: str, error: str, now: float = None) -> bool:
+        """Schedules a retry of a failed job, or buries it once it used up its attempts
+
+        Returns False if the job was taken over in the meantime."""
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM jobs WHERE id = ? AND owner = ? AND state = 'leased'",
+                             (job.id, owner)).fetchone()
+            if row is None:
+                return False
+            attempts = row[0]
+            if attempts >= self._max_attempts:
+                self._bury(db, job.id, error, now)
+            else:
+                delay = min(self._backoff * 2 ** (attempts - 1), self._max_backoff)
+                db.execute("UPDATE jobs SET state = 'queued', owner = NULL, lease_expires = NULL, available_at = ?, "
+                           "last_error = ? WHERE id = ?", (now + delay, error, job.id))
+        return True
+
+    def dead_letters(self) -> List[tuple]:
+        """The (url, attempts, last error) of every buried job"""
+        with self._lock:
+            return self._db.execute("SELECT url, attempts, last_error FROM dead_letters ORDER BY failed_at").fetchall()
+
+    def requeue_dead_letters(self, now: float = None) -> int:
+        """Gives every buried job a fresh set of attempts"""
+        now = time.time() if now is None else now
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO jobs (site, story_id, url, available_at) "
+                       "SELECT site, story_id, url, ? FROM dead_letters", (now,))
+            return db.execute("DELETE FROM dead_letters").rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Number of queued, leased and dead jobs"""
+        counts = {'queued': 0, 'leased': 0}
+        with self._lock:
+            for state, count in self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall():
+                counts[state] = count
+            counts['dead'] = self._db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return counts
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class Worker(object):
+    """Leases jobs one at a time and scrapes them, heartbeating while a scrape runs
+
+    ``scrape`` receives the canonical URL of the job and returns the scraped
+    story. A story that is not complete (for example stopped by a deadline) is
+    retried like a failure."""
+
+    def __init__(self, queue: JobQueue, scrape: Callable[[CanonicalURL], Story], owner: str = None,
+                 heartbeat_interval: float = None):
+        self._queue = queue
+        self._scrape = scrape
+        self._owner = owner
+        self._heartbeat_interval = heartbeat_interval or queue.lease_time / 3
+        self._logger = logging.getLogger('ff_scrape.jobqueue')
+
+    @property
+    def owner(self) -> str:
+        if self._owner is None:
+            self._owner = worker_name()
+        return self._owner
+
+    def _heartbeat(self, job: Job, done: threading.Event) -> None:
+        while not done.wait(self._heartbeat_interval):
+            if not self._queue.heartbeat(job, self.owner):
+                self._logger.warning("Lost the lease on: %s" % job.url)
+                return
+
+    def run_once(self) -> Optional[Job]:
+        """Scrapes one job, returns it or None when no job was available"""
+        jobs = self._queue.lease(self.owner)
+        if len(jobs) == 0:
+            return None
+        job = jobs[0]
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            fanfic = self._scrape(job.canonical)
+        except Exception as error:
+            self._logger.error("Scrape failed for: %s (%s)" % (job.url, getattr(error, 'value', error)))
+            fanfic = None
+            reason = str(getattr(error, 'value', error))
+        finally:
+            done.set()
+            heartbeat.join()
+        if fanfic is not None and fanfic.scrape_status == 'complete':
+            self._queue.ack(job, self.owner)
+        else:
+            if fanfic is not None:
+                reason = "Story %s" % fanfic.scrape_status
+            self._queue.fail(job, self.owner, reason)
+        return job
+
+    def run_forever(self, stop: threading.Event = None, poll_interval: float = 5.0) -> None:
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if self.run_once() is None:
+                stop.wait(poll_interval)
@@ -0,0 +1,107 @@
+"""Chapter checkpoints for resumable story downloads
+
+Every downloaded chapter is appended to a journal file named after the
+canonical story key. When a scrape of the same story is retried, chapters whose
+position and chapter list entry still match the current chapter list are taken
+from the journal instead of being downloaded again. The journal is removed
+once the story completes. Only the chapter list entries and file offsets of the
+records are kept in memory, the chapter bodies are read back when a chapter is
+taken from the journal."""
+from ff_scrape.storybase import Chapter
+from typing import Dict, Optional, Tuple
+from os import makedirs, path, remove, fsync
+import json
+import re
+
+_unsafe_characters = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+class StoryCheckpoint(object):
+    """The journal of a single story"""
+
+    # chapter index: (chapter list entry, byte offset of the record)
+    _records: Dict[int, Tuple[dict, int]]
+
+    def __init__(self, file_path: str):
+        self._path = file_path
+        self._records = {}
+        # byte offset after the last complete record
+        good = 0
+        if path.exists(file_path):
+            ended = True
+            with open(file_path, 'r+b') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # the last line may be cut short if the process died while writing it
+                        break
+                    self._records[record['index']] = (record['entry'], good)
+                    good += len(line)
+                    ended = line.endswith(b'\n')
+                # drop a torn record so the next one starts on its own line
+                journal.truncate(good)
+                if not ended:
+                    journal.seek(good)
+                    journal.write(b'\n')
+                    good += 1
+        self._size = good
+        self._file = open(file_path, 'ab')
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self, index: int, entry: dict) -> Optional[Chapter]:
+        """Returns the checkpointed chapter if it was recorded for the same chapter list entry"""
+        found = self._records.get(index)
+        if found is None or found[0] != entry:
+            return None
+        with open(self._path, 'rb') as journal:
+            journal.seek(found[1])
+            record = json.loads(journal.readline().decode('utf-8'))
+        chapter = Chapter()
+        chapter.name = record['name']
+        chapter.word_count = record['word_count']
+        chapter.raw_body = record['raw_body']
+        chapter.processed_body = record['processed_body']
+        return chapter
+
+    def save(self, index: int, entry: dict, chapter: Chapter) -> None:
+        record = {
+            'index': index,
+            'entry': entry,
+            'name': chapter.name,
+            'word_count': chapter.word_count,
+            'raw_body': chapter.raw_body,
+            'processed_body': chapter.processed_body,
+        }
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        self._file.write(line)
+        self._file.flush()
+        fsync(self._file.fileno())
+        self._records[index] = (entry, self._size)
+        self._size += len(line)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def discard(self) -> None:
+        """Closes and removes the journal after the story completed"""
+        self._file.close()
+        if path.exists(self._path):
+            remove(self._path)
+
+
+class ChapterJournal(object):
+    """Directory holding one checkpoint file per story"""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        makedirs(directory, exist_ok=True)
+
+    def path(self, key: Tuple[str, str]) -> str:
+        name = '-'.join(_unsafe_characters.sub('_', part) for part in key)
+        return path.join(self._directory, name + '.jsonl')
+
+    def open(self, key: Tuple[str, str]) -> StoryCheckpoint:
+        return StoryCheckpoint(self.path(key))
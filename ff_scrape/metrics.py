@@ -0,0 +1,151 @@
+"""Timings, counts and byte sizes of scrapes
+
+Every scrape fills a StoryMetrics object with the time spent per phase
+(network, sleep, parse, extract, prettify, format, record), the number of
+requests and of requests answered by an identical in-flight request (cache
+hits) and the bytes downloaded and written. Phases are exclusive: time spent
+fetching a page while extracting a chapter counts as network, not extract.
+
+The metrics of finished stories are summed per site in a MetricsRegistry that
+can be exported in the Prometheus text format or as JSON lines."""
+from contextlib import contextmanager
+from typing import Dict, List
+from os import path, replace
+import json
+import tempfile
+import threading
+import time
+
+
+class StoryMetrics(object):
+    """Measurements of a single story scrape"""
+
+    def __init__(self, site: str = None):
+        self.site = site
+        self.started = time.time()
+        self.duration = 0.0
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def add_bytes(self, direction: str, amount: int) -> None:
+        with self._lock:
+            self.bytes[direction] = self.bytes.get(direction, 0) + amount
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times a block, pausing the enclosing phase while it runs"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        now = time.perf_counter()
+        if len(stack) > 0:
+            outer = stack[-1]
+            self.add_time(outer[0], now - outer[1])
+        current = [name, now]
+        stack.append(current)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.add_time(name, now - current[1])
+            stack.pop()
+            if len(stack) > 0:
+                stack[-1][1] = now
+
+    def finish(self) -> None:
+        self.duration = time.time() - self.started
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'site': self.site,
+                'started': self.started,
+                'duration': self.duration,
+                'timings': dict(self.timings),
+                'counts': dict(self.counts),
+                'bytes': dict(self.bytes),
+            }
+
+
+class MetricsRegistry(object):
+    """Sums the metrics of finished stories per site"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites: Dict[str, dict] = {}
+
+    def add(self, status: str, metrics: StoryMetrics) -> None:
+        values = metrics.as_dict()
+        with self._lock:
+            totals = self._sites.setdefault(metrics.site or 'unknown', {
+                'stories': {}, 'seconds': 0.0, 'timings': {}, 'counts': {}, 'bytes': {}})
+            totals['stories'][status] = totals['stories'].get(status, 0) + 1
+            totals['seconds'] += values['duration']
+            for group in ['timings', 'counts', 'bytes']:
+                for name, value in values[group].items():
+                    totals[group][name] = totals[group].get(name, 0) + value
+
+    def prometheus(self) -> str:
+        """The totals in the Prometheus text exposition format"""
+        families = [
+            ('ff_scrape_stories_total', 'counter', 'Scraped stories by scrape status'),
+            ('ff_scrape_story_seconds_total', 'counter', 'Wall clock time spent scraping stories'),
+            ('ff_scrape_phase_seconds_total', 'counter', 'Time spent per scrape phase'),
+            ('ff_scrape_events_total', 'counter', 'Requests, cache hits, chapters and other counted events'),
+            ('ff_scrape_bytes_total', 'counter', 'Bytes downloaded (in) and written (out)'),
+        ]
+        samples: Dict[str, List[str]] = {name: [] for name, _, _ in families}
+        with self._lock:
+            for site in sorted(self._sites):
+                totals = self._sites[site]
+                for status, count in sorted(totals['stories'].items()):
+                    samples['ff_scrape_stories_total'].append(_sample(count, site=site, status=status))
+                samples['ff_scrape_story_seconds_total'].append(_sample(totals['seconds'], site=site))
+                for phase, seconds in sorted(totals['timings'].items()):
+                    samples['ff_scrape_phase_seconds_total'].append(_sample(seconds, site=site, phase=phase))
+                for event, count in sorted(totals['counts'].items()):
+                    samples['ff_scrape_events_total'].append(_sample(count, site=site, event=event))
+                for direction, count in sorted(totals['bytes'].items()):
+                    samples['ff_scrape_bytes_total'].append(_sample(count, site=site, direction=direction))
+        lines = []
+        for name, metric_type, description in families:
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            lines.extend(name + sample for sample in samples[name])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_path: str) -> None:
+        """Atomically replaces file_path, for the textfile collector of the node exporter"""
+        handle = tempfile.NamedTemporaryFile('w', dir=path.dirname(path.abspath(file_path)), suffix='.tmp',
+                                             delete=False, encoding='utf-8')
+        with handle:
+            handle.write(self.prometheus())
+        replace(handle.name, file_path)
+
+
+def _sample(value: float, **labels: str) -> str:
+    label_text = ','.join('%s="%s"' % (name, str(label).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, label in labels.items())
+    return '{%s} %s' % (label_text, repr(float(value)) if isinstance(value, float) else value)
+
+
+def json_line(url: str, status: str, metrics: StoryMetrics) -> str:
+    """One JSON line describing the metrics of a story"""
+    record = {'url': url, 'scrape_status': status}
+    record.update(metrics.as_dict())
+    return json.dumps(record, sort_keys=True)
+
+
+# metrics of every story scraped by this process
+registry = MetricsRegistry()
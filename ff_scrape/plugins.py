@@ -0,0 +1,86 @@
+"""Lazy discovery of the plugins registered through entry points
+
+Entry points are only looked up the first time a group is used and a plugin is
+only imported (and, for sites, instantiated) the first time it is requested, so
+importing the scraper stays cheap no matter how many plugins are installed."""
+from collections.abc import Mapping
+from typing import Callable, Iterator
+
+
+def _group_entry_points(group: str) -> dict:
+    from importlib.metadata import entry_points
+
+    try:
+        found = entry_points(group=group)
+    except TypeError:
+        # python < 3.10 only offers the dict interface
+        found = entry_points().get(group, [])
+    return {entry_point.name: entry_point for entry_point in found}
+
+
+class LazyPlugins(Mapping):
+    """Maps plugin names to loaded plugins, importing each on first access
+
+    ``factory`` turns the loaded object into the stored value, for example to
+    instantiate a Site class with its configuration. ``version`` changes with
+    every register and unregister, so anything built from the plugins knows
+    when to rebuild."""
+
+    def __init__(self, group: str, factory: Callable = None):
+        self._group = group
+        self._factory = factory
+        self._entry_points = None
+        self._classes = {}
+        self._instances = {}
+        self._shadowed = {}
+        self.version = 0
+
+    def _discover(self) -> dict:
+        if self._entry_points is None:
+            self._entry_points = _group_entry_points(self._group)
+        return self._entry_points
+
+    def register(self, name: str, plugin) -> None:
+        """Adds a plugin without going through the installed entry points"""
+        entry_points = self._discover()
+        if name not in self._shadowed:
+            self._shadowed[name] = entry_points.get(name)
+        entry_points[name] = None
+        self._classes[name] = plugin
+        self._instances.pop(name, None)
+        self.version += 1
+
+    def unregister(self, name: str) -> None:
+        """Removes a registered plugin, bringing back the installed one it replaced"""
+        entry_points = self._discover()
+        self._classes.pop(name, None)
+        self._instances.pop(name, None)
+        entry_point = self._shadowed.pop(name, None)
+        if entry_point is not None:
+            entry_points[name] = entry_point
+        else:
+            entry_points.pop(name, None)
+        self.version += 1
+
+    def load(self, name: str):
+        """Returns the plugin object (usually a class) without running the factory"""
+        if name not in self._classes:
+            self._classes[name] = self._discover()[name].load()
+        return self._classes[name]
+
+    def __getitem__(self, name: str):
+        if name not in self._instances:
+            plugin = self.load(name)
+            if self._factory is not None:
+                plugin = self._factory(name, plugin)
+            self._instances[name] = plugin
+        return self._instances[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self._discover()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._discover()))
+
+    def __len__(self) -> int:
+        return len(self._discover())
@@ -0,0 +1,44 @@
+"""Cheap checks for whether a story changed
+
+A probe fetches only the smallest page that carries the update time and the
+chapter count of a story and reduces them to a Fingerprint. Comparing the
+fingerprint with the one from the last check tells whether a full scrape is
+needed."""
+from datetime import datetime
+from hashlib import sha1
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class Fingerprint(NamedTuple):
+    url: str
+    updated: Optional[datetime]
+    chapter_count: Optional[int]
+
+    @property
+    def digest(self) -> str:
+        """Short stable value that changes whenever the story is updated"""
+        updated = self.updated.isoformat() if self.updated is not None else ''
+        value = "%s|%s" % (updated, self.chapter_count if self.chapter_count is not None else '')
+        return sha1(value.encode('utf-8')).hexdigest()[0:16]
+
+
+class ProbeReport(object):
+    """Result of probing a batch of URLs"""
+
+    fingerprints: Dict[Tuple[str, str], Fingerprint]
+    failures: List[Tuple[str, str]]
+
+    def __init__(self):
+        self.fingerprints = {}
+        self.failures = []
+
+    def changed(self, digests: Dict[Tuple[str, str], str]) -> List[Tuple[str, str]]:
+        """Returns the keys whose digest differs from the previously recorded one"""
+        changed = []
+        for key, fingerprint in self.fingerprints.items():
+            if digests.get(key) != fingerprint.digest:
+                changed.append(key)
+        return changed
+
+    def __repr__(self):
+        return '%s(probed:%d, failures:%d)' % (self.__class__.__name__, len(self.fingerprints), len(self.failures))
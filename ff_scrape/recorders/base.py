@@ -0,0 +1,82 @@
+from abc import ABC
+from ff_scrape.storybase import Story, Chapter
+from datetime import datetime
+from os import makedirs, path, replace, link
+import shutil
+import re
+
+
+class Recorder(ABC):
+    """Writes a fanfic to disk while it is being scraped
+
+    A recorder is created for a single story. ``start`` is called once the
+    metadata has been recorded, ``add_chapter`` for every chapter as soon as the
+    site produces it and ``finish`` after the last chapter. ``abort`` is called
+    instead of ``finish`` if the scrape fails so partial output can be removed.
+
+    When ``backup_directory`` is set, a file about to be replaced by a newer
+    copy of the story is kept there first."""
+
+    extension = ''
+
+    def __init__(self, directory: str = '.', filename: str = None, release_bodies: bool = True,
+                 backup_directory: str = None):
+        self._directory = directory
+        self._filename = filename
+        self._backup_directory = backup_directory
+        # drop the chapter bodies once written so memory does not grow with the chapter count
+        self._release_bodies = release_bodies
+        self._fanfic = None
+        makedirs(directory, exist_ok=True)
+
+    @property
+    def filename(self) -> str:
+        if self._filename is None and self._fanfic is not None:
+            self._filename = story_filename(self._fanfic) + self.extension
+        return self._filename
+
+    def start(self, fanfic: Story) -> None:
+        self._fanfic = fanfic
+
+    def add_chapter(self, chapter: Chapter) -> None:
+        with self._fanfic.metrics.phase('record'):
+            self.write_chapter(chapter)
+        self._fanfic.metrics.add_bytes('out', len(chapter.processed_body.encode('utf-8')))
+        if self._release_bodies:
+            chapter.raw_body = ""
+            chapter.processed_body = ""
+
+    def write_chapter(self, chapter: Chapter) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        pass
+
+    def _install(self, temp_path: str, destination: str) -> None:
+        """Renames a finished file into place, backing up the copy it replaces"""
+        if self._backup_directory is not None and path.exists(destination):
+            makedirs(self._backup_directory, exist_ok=True)
+            name, extension = path.splitext(path.basename(destination))
+            backup = path.join(self._backup_directory,
+                               '{} {}{}'.format(name, datetime.now().strftime('%Y%m%d-%H%M%S'), extension))
+            # link rather than move so the destination never goes missing, copy across file systems
+            try:
+                link(destination, backup)
+            except OSError:
+                shutil.copy2(destination, backup)
+        replace(temp_path, destination)
+
+
+_unsafe_characters = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def story_filename(fanfic: Story) -> str:
+    """Builds a file name (without extension) that is safe on all platforms"""
+    name = fanfic.title or 'Untitled'
+    if len(fanfic.authors) > 0:
+        name += ' - ' + fanfic.authors[0].name
+    name = _unsafe_characters.sub('', name).strip(' .')
+    return name[0:200] or 'Untitled'
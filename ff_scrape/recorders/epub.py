@@ -0,0 +1,155 @@
+"""Streaming EPUB 3 writer
+
+The container is written incrementally: the mimetype and container entries
+when the story starts, every chapter as soon as it is recorded and the package
+document and navigation once the last chapter is done. The archive is written
+to a temporary file next to the destination and renamed into place so readers
+never see a half written book."""
+from .base import Recorder
+from ff_scrape.storybase import Story, Chapter
+from xml.sax.saxutils import escape
+from datetime import datetime, timezone
+from os import path, remove, close
+import tempfile
+import zipfile
+
+CONTAINER = """<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+CHAPTER = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+  <title>{title}</title>
+</head>
+<body>
+  <h2>{title}</h2>
+"""
+
+CHAPTER_END = """
+</body>
+</html>
+"""
+
+
+class Epub(Recorder):
+    """Writes the fanfic as an EPUB 3 book"""
+
+    extension = '.epub'
+
+    _zip: zipfile.ZipFile
+    _temp_path: str
+    _chapters: list
+
+    def __init__(self, directory: str = '.', filename: str = None, release_bodies: bool = True,
+                 backup_directory: str = None):
+        super().__init__(directory, filename=filename, release_bodies=release_bodies,
+                         backup_directory=backup_directory)
+        self._zip = None
+        self._temp_path = None
+        self._chapters = []
+
+    @property
+    def destination(self) -> str:
+        return path.join(self._directory, self.filename)
+
+    def start(self, fanfic: Story) -> None:
+        super().start(fanfic)
+        handle, self._temp_path = tempfile.mkstemp(dir=self._directory, suffix='.part')
+        close(handle)
+        self._zip = zipfile.ZipFile(self._temp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        # mimetype must be the first entry and must not be compressed
+        self._zip.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr('META-INF/container.xml', CONTAINER)
+
+    def write_chapter(self, chapter: Chapter) -> None:
+        number = len(self._chapters) + 1
+        name = chapter.name or "Chapter {}".format(number)
+        file_name = 'chapter_{:04d}.xhtml'.format(number)
+        self._chapters.append((file_name, name))
+        with self._zip.open('OEBPS/' + file_name, 'w') as entry:
+            entry.write(CHAPTER.format(title=escape(name)).encode('utf-8'))
+            entry.write(chapter.processed_body.encode('utf-8'))
+            entry.write(CHAPTER_END.encode('utf-8'))
+
+    def finish(self) -> None:
+        self._zip.writestr('OEBPS/nav.xhtml', self._nav())
+        self._zip.writestr('OEBPS/content.opf', self._package())
+        self._zip.close()
+        self._zip = None
+        self._install(self._temp_path, self.destination)
+        self._temp_path = None
+
+    def abort(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._temp_path is not None and path.exists(self._temp_path):
+            remove(self._temp_path)
+        self._temp_path = None
+
+    def _nav(self) -> str:
+        items = []
+        for file_name, name in self._chapters:
+            items.append('      <li><a href="{}">{}</a></li>'.format(file_name, escape(name)))
+        return """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head>
+  <title>{title}</title>
+</head>
+<body>
+  <nav epub:type="toc" id="toc">
+    <h1>{title}</h1>
+    <ol>
+{items}
+    </ol>
+  </nav>
+</body>
+</html>
+""".format(title=escape(self._fanfic.title or ''), items='\n'.join(items))
+
+    def _package(self) -> str:
+        fanfic = self._fanfic
+        metadata = ['<dc:identifier id="uid">{}</dc:identifier>'.format(escape(fanfic.url or '')),
+                    '<dc:title>{}</dc:title>'.format(escape(fanfic.title or '')),
+                    '<dc:language>en</dc:language>']
+        for author in fanfic.authors:
+            metadata.append('<dc:creator>{}</dc:creator>'.format(escape(author.name)))
+        if fanfic.domain is not None:
+            metadata.append('<dc:publisher>{}</dc:publisher>'.format(escape(fanfic.domain)))
+        if fanfic.summary is not None:
+            metadata.append('<dc:description>{}</dc:description>'.format(escape(fanfic.summary)))
+        for subject in fanfic.universe + fanfic.genres + fanfic.categories:
+            metadata.append('<dc:subject>{}</dc:subject>'.format(escape(subject)))
+        if fanfic.published is not None:
+            metadata.append('<dc:date>{}</dc:date>'.format(fanfic.published.date().isoformat()))
+        modified = fanfic.updated
+        if modified is None:
+            modified = datetime.now(timezone.utc)
+        metadata.append('<meta property="dcterms:modified">{}</meta>'.format(modified.strftime('%Y-%m-%dT%H:%M:%SZ')))
+
+        manifest = ['<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>']
+        spine = []
+        for index, (file_name, name) in enumerate(self._chapters, start=1):
+            manifest.append('<item id="c{}" href="{}" media-type="application/xhtml+xml"/>'.format(index, file_name))
+            spine.append('<itemref idref="c{}"/>'.format(index))
+
+        return """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    {metadata}
+  </metadata>
+  <manifest>
+    {manifest}
+  </manifest>
+  <spine>
+    {spine}
+  </spine>
+</package>
+""".format(metadata='\n    '.join(metadata), manifest='\n    '.join(manifest), spine='\n    '.join(spine))
@@ -0,0 +1,109 @@
+"""Routing of story URLs to the site that handles them
+
+Sites are indexed by hostname so finding the handler for a URL is a dictionary
+lookup instead of asking every site in turn. The router also turns raw URLs,
+for example from bookmark exports, into canonical ``(site, story id)`` keys and
+fetch URLs, collecting the inputs it can not use into a report."""
+from ff_scrape.sites.base import split_url
+from ff_scrape.errors import URLError
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class CanonicalURL(NamedTuple):
+    site: str
+    story_id: str
+    url: str
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.site, self.story_id
+
+
+class CanonicalizationReport(object):
+    """Result of canonicalizing a batch of URLs"""
+
+    results: List[Tuple[str, CanonicalURL]]
+    errors: List[Tuple[str, str]]
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+
+    @property
+    def unique(self) -> List[CanonicalURL]:
+        """The distinct stories in input order"""
+        stories = {}
+        for raw, canonical in self.results:
+            stories.setdefault(canonical.key, canonical)
+        return list(stories.values())
+
+    @property
+    def duplicates(self) -> int:
+        return len(self.results) - len(self.unique)
+
+    def __repr__(self):
+        return '%s(resolved:%d, unique:%d, errors:%d)' % (self.__class__.__name__, len(self.results),
+                                                          len(self.unique), len(self.errors))
+
+
+class Router(object):
+    """Maps hostnames to site names
+
+    ``sites`` maps site names to Site classes, a LazyPlugins instance can be
+    passed as is and only has its classes loaded, not instantiated."""
+
+    def __init__(self, sites: Mapping):
+        self._classes = {}
+        self._hosts = {}
+        for name in sites:
+            site_class = sites.load(name) if hasattr(sites, 'load') else sites[name]
+            self._classes[name] = site_class
+            for hostname in site_class.hostnames:
+                self._hosts[hostname] = name
+
+    def route(self, hostname: str) -> Optional[str]:
+        """Returns the name of the site serving the host or any of its parent domains"""
+        if hostname is None:
+            return None
+        hostname = hostname.lower()
+        while True:
+            if hostname in self._hosts:
+                return self._hosts[hostname]
+            dot = hostname.find('.')
+            if dot == -1:
+                return None
+            hostname = hostname[dot + 1:]
+
+    def canonicalize(self, url: str) -> CanonicalURL:
+        """Returns the canonical form of one URL, raising URLError if it is not a story URL"""
+        try:
+            parts = split_url(url)
+            hostname = parts.hostname
+        except ValueError:
+            raise URLError('Unknown URL format')
+        site = self.route(hostname)
+        if site is None:
+            raise URLError('Unknown site')
+        story_id, canonical_url = self._classes[site].canonicalize(parts)
+        return CanonicalURL(site, story_id, canonical_url)
+
+    def iter_canonical(self, urls: Iterable[str]) -> Iterator[Tuple[str, Optional[CanonicalURL], Optional[str]]]:
+        """Yields (raw url, canonical url, error) for every non blank input without stopping on errors"""
+        for raw in urls:
+            url = raw.strip()
+            if url == '':
+                continue
+            try:
+                yield url, self.canonicalize(url), None
+            except URLError as error:
+                yield url, None, error.value
+
+    def canonicalize_all(self, urls: Iterable[str]) -> CanonicalizationReport:
+        report = CanonicalizationReport()
+        for raw, canonical, error in self.iter_canonical(urls):
+            if canonical is None:
+                report.errors.append((raw, error))
+            else:
+                report.results.append((raw, canonical))
+        return report
@@ -1,16 +1,23 @@
-from pkg_resources import iter_entry_points
 from os import environ
 from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Callable, Iterable, Iterator
 import logging
+import threading
 from ff_scrape.sites.base import Site
 from ff_scrape.storybase import Story
-from ff_scrape.errors import ParameterError
+from ff_scrape.errors import ParameterError, DeadlineError
 from ff_scrape.formatters.base import Formatter
+from ff_scrape.recorders.base import Recorder
+from ff_scrape.plugins import LazyPlugins
+from ff_scrape.routing import Router, CanonicalizationReport, CanonicalURL
+from ff_scrape.fetch import SingleFlight, Fetcher, DomainLimits, Deadline, default_fetcher
+from ff_scrape.probe import ProbeReport
+from ff_scrape.journal import ChapterJournal
+from ff_scrape import metrics
 
 
 cfg = {}
-processors: dict[str, Site] = {}
-formatters: dict[str, Formatter] = {}
 
 if 'SCRAPER_CONFIG' in environ:
     config = ConfigParser()
@@ -19,22 +26,54 @@ if 'SCRAPER_CONFIG' in environ:
     for section in config.sections():
         cfg[section] = dict(config.items(section))
 
-for site_processor in iter_entry_points('ff_scrape.sites'):
-    site_params = []
-    if site_processor.name in cfg:
-        site_params = cfg[site_processor.name]
-    processor_class = site_processor.load()
-    processors[site_processor.name] = processor_class(site_params=site_params)
+_timeouts = cfg.get('Timeouts', {})
+if 'connect' in _timeouts or 'read' in _timeouts:
+    default_fetcher().timeout = (float(_timeouts.get('connect', default_fetcher().timeout[0])),
+                                 float(_timeouts.get('read', default_fetcher().timeout[1])))
+if 'retries' in _timeouts:
+    default_fetcher().retries = int(_timeouts['retries'])
+if 'max_retry_wait' in _timeouts:
+    default_fetcher().max_wait = float(_timeouts['max_retry_wait'])
 
-for site_formatters in iter_entry_points('ff_scrape.formatters'):
-    formatters[site_formatters.name] = site_formatters.load()
+
+def _create_processor(name: str, processor_class) -> Site:
+    site_params = {}
+    if name in cfg:
+        site_params = cfg[name]
+    return processor_class(site_params=site_params)
+
+
+# plugins are discovered on first use and sites are only instantiated once a URL needs them
+processors: LazyPlugins = LazyPlugins('ff_scrape.sites', factory=_create_processor)
+formatters: LazyPlugins = LazyPlugins('ff_scrape.formatters')
+recorders: LazyPlugins = LazyPlugins('ff_scrape.recorders')
+
+# sites keep per story state, so every worker thread gets its own instances
+_thread_state = threading.local()
+# concurrent scrapes of the same story share one download
+_story_flight = SingleFlight()
+# (processors version, router) so the site classes are only loaded again after a plugin change
+_routing = (None, None)
+_routing_lock = threading.Lock()
+
+
+def _thread_processor(name: str) -> Site:
+    if not hasattr(_thread_state, 'processors'):
+        _thread_state.processors = {}
+    if name not in _thread_state.processors:
+        _thread_state.processors[name] = _create_processor(name, processors.load(name))
+    return _thread_state.processors[name]
+
+
+_log_handler = None
+_log_lock = threading.Lock()
 
 
 def _setup_logger(loglevel=None):
-    logger = logging.getLogger('FanficDownloader')
+    global _log_handler
     formatter = logging.Formatter('%(asctime)-15s - %(name)s - %(levelname)s - %(message)s')
 
-    if 'SCRAPE_LOG_LEVEL' in environ:
+    if 'SCRAPER_LOG_LEVEL' in environ:
         if environ.get('SCRAPER_LOG_LEVEL').lower() == 'debug':
             loglevel = logging.DEBUG
         elif environ.get('SCRAPER_LOG_LEVEL').lower() == 'info':
@@ -53,34 +92,273 @@ def _setup_logger(loglevel=None):
         loglevel = logging.INFO
     logger = logging.getLogger('ff_scrape')
 
-    if 'SCRAPE_LOG_FILE' in environ:
-        handler = logging.FileHandler(environ.get("SCRAPER_LOG_FILE"))
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-    else:
-        ch = logging.StreamHandler()
-        ch.setLevel(loglevel)
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
+    # the handler is attached once, later calls (every batch of a long running process) only change its level
+    with _log_lock:
+        if _log_handler is None:
+            if 'SCRAPER_LOG_FILE' in environ:
+                _log_handler = logging.FileHandler(environ.get("SCRAPER_LOG_FILE"))
+            else:
+                _log_handler = logging.StreamHandler()
+            _log_handler.setFormatter(formatter)
+            logger.addHandler(_log_handler)
+        _log_handler.setLevel(loglevel)
     return logger
 
-def ff_scrape(urls: [str], loglevel=None, formatter=None) -> [Story]:
-    logger = _setup_logger(loglevel=loglevel)
-    stories: [Story] = []
+
+def _router() -> Router:
+    """The router over the site plugins, built once per set of registered plugins"""
+    global _routing
+    with _routing_lock:
+        if _routing[0] != processors.version:
+            _routing = (processors.version, Router(processors))
+        return _routing[1]
+
+
+def canonicalize_urls(urls: [str]) -> CanonicalizationReport:
+    """Maps raw URLs to canonical (site, story id) keys and fetch URLs, reporting unusable inputs"""
+    return _router().canonicalize_all(urls)
+
+
+def _scrape_story(canonical: CanonicalURL, processor: Site, formatter=None, recorder=None, output_dir=None,
+                  journal: ChapterJournal = None, deadline: Deadline = None, backup_dir=None) -> Story:
+    processor.url = canonical.url
+    processor.journal = journal
+    story_recorders: [Recorder] = []
+    if recorder is not None:
+        # the formatter runs on the whole story afterwards, so the recorder must leave it the bodies
+        story_recorders.append(recorders[recorder](output_dir, release_bodies=formatter is None,
+                                                   backup_directory=backup_dir))
+    try:
+        processor.get_story(recorders=story_recorders, deadline=deadline)
+    except DeadlineError:
+        processor.log_warn("Deadline passed, returning the partial story")
+        fanfic = processor.fanfic
+        if fanfic is None:
+            # the deadline passed before the metadata was in
+            fanfic = Story(canonical.url)
+            fanfic.scrape_status = 'cancelled'
+            fanfic.metrics = processor.metrics
+        metrics.registry.add(fanfic.scrape_status, fanfic.metrics)
+        return fanfic
+    except Exception:
+        metrics.registry.add('failed', processor.metrics)
+        raise
+    fanfic = processor.fanfic
     if formatter is not None:
-        if formatter not in site_formatters:
+        # the recorders wrote the chapters as they arrived, the formatter only changes the returned story
+        with fanfic.metrics.phase('format'):
+            formatters[formatter].format(fanfic)
+        fanfic.metrics.finish()
+    metrics.registry.add(fanfic.scrape_status, fanfic.metrics)
+    return fanfic
+
+
+def _story_scraper(formatter=None, recorder=None, output_dir=None, journal_dir=None, story_timeout: float = None,
+                   batch_timeout: float = None, backup_dir=None) -> Callable[[CanonicalURL], Story]:
+    """Checks the scrape options and returns the function scraping a single canonical URL"""
+    if formatter is not None:
+        if formatter not in formatters:
             raise ParameterError("Unknown formatter")
+    if recorder is not None:
+        if recorder not in recorders:
+            raise ParameterError("Unknown recorder")
+        if output_dir is None:
+            output_dir = cfg.get('Archive', {}).get('archive_path', '.')
+        if backup_dir is None:
+            backup_dir = cfg.get('Archive', {}).get('backup_path')
+
+    if journal_dir is None:
+        journal_dir = cfg.get('Archive', {}).get('journal_path')
+    journal = ChapterJournal(journal_dir) if journal_dir is not None else None
+    if story_timeout is None and 'story' in _timeouts:
+        story_timeout = float(_timeouts['story'])
+    if batch_timeout is None and 'batch' in _timeouts:
+        batch_timeout = float(_timeouts['batch'])
+    batch_deadline = Deadline(batch_timeout) if batch_timeout is not None else None
+
+    def scrape(canonical: CanonicalURL) -> Story:
+        # the story clock starts once a worker picks the story up
+        deadline = Deadline.earliest(Deadline(story_timeout) if story_timeout is not None else None, batch_deadline)
+        # only the site matching the URL gets instantiated
+        return _story_flight.do(canonical.key, lambda: _scrape_story(
+            canonical, _thread_processor(canonical.site), formatter=formatter, recorder=recorder, output_dir=output_dir,
+            journal=journal, deadline=deadline, backup_dir=backup_dir))
+    return scrape
+
+
+def ff_scrape(urls: [str], loglevel=None, formatter=None, recorder=None, output_dir=None, jobs: int = 1,
+              journal_dir=None, story_timeout: float = None, batch_timeout: float = None,
+              backup_dir=None) -> [Story]:
+    """Scrapes the stories behind the URLs, returning one story per usable URL
+
+    URLs that resolve to the same story (chapter links, mobile or http variants)
+    are scraped once and share the resulting Story. With ``jobs`` above one the
+    distinct stories are scraped concurrently. Downloaded chapters are checkpointed
+    in ``journal_dir`` (default: the journal_path of the Archive configuration) so
+    a failed story resumes where it stopped when it is scraped again. Recorded
+    files replaced by a newer copy are kept in ``backup_dir`` (default: the
+    backup_path of the Archive configuration).
+
+    ``story_timeout`` limits the seconds spent on each story and ``batch_timeout``
+    the seconds spent on all of them (defaults: story and batch of the Timeouts
+    configuration). A story stopped by either is returned with the chapters it
+    got so far and a scrape_status of partial, or cancelled if it never started."""
+    logger = _setup_logger(loglevel=loglevel)
+    stories: [Story] = []
+    scrape = _story_scraper(formatter=formatter, recorder=recorder, output_dir=output_dir, journal_dir=journal_dir,
+                            story_timeout=story_timeout, batch_timeout=batch_timeout, backup_dir=backup_dir)
 
-    for url in urls:
-        for processor in processors:
-            if processors[processor].can_handle(url):
-                processors[processor].url = url
-                processors[processor].get_story()
-                fanfic = processors[processor].fanfic
-                if formatter is not None:
-                    formatters[formatter].format(fanfic)
-                stories.append(fanfic)
-                break  # abort processor loop if a match was found
-        else:
-            logger.error("Unknown URL format for: " + url)
+    report = canonicalize_urls(urls)
+    for url, error in report.errors:
+        logger.error("Unknown URL format for: %s (%s)" % (url, error))
+    if report.duplicates > 0:
+        logger.info("Collapsed %d duplicate URLs" % report.duplicates)
+
+    unique = report.unique
+    if jobs > 1 and len(unique) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            scraped = list(pool.map(scrape, unique))
+    else:
+        scraped = [scrape(canonical) for canonical in unique]
+    by_key = {canonical.key: fanfic for canonical, fanfic in zip(unique, scraped)}
+
+    for url, canonical in report.results:
+        stories.append(by_key[canonical.key])
     return stories
+
+
+def iter_scrape(urls: Iterable[str], loglevel=None, formatter=None, recorder=None, output_dir=None, jobs: int = 1,
+                journal_dir=None, story_timeout: float = None, batch_timeout: float = None,
+                backup_dir=None) -> Iterator[Story]:
+    """Scrapes the stories behind the URLs as they are read, yielding each story once it is done
+
+    Unlike ff_scrape the URLs may be an endless stream: at most twice ``jobs``
+    stories are queued at a time, stories come back in the order they finish,
+    duplicates of an already seen story are skipped and a story that fails is
+    logged and yielded with a scrape_status of failed instead of stopping the
+    run. The other options are those of ff_scrape."""
+    logger = _setup_logger(loglevel=loglevel)
+    scrape = _story_scraper(formatter=formatter, recorder=recorder, output_dir=output_dir, journal_dir=journal_dir,
+                            story_timeout=story_timeout, batch_timeout=batch_timeout, backup_dir=backup_dir)
+
+    def scrape_safely(canonical: CanonicalURL) -> Story:
+        try:
+            return scrape(canonical)
+        except Exception as error:
+            logger.error("Scrape failed for: %s (%s)" % (canonical.url, getattr(error, 'value', error)))
+            fanfic = Story(canonical.url)
+            fanfic.scrape_status = 'failed'
+            return fanfic
+
+    seen = set()
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        pending = set()
+        for url, canonical, error in _router().iter_canonical(urls):
+            if canonical is None:
+                logger.error("Unknown URL format for: %s (%s)" % (url, error))
+                continue
+            if canonical.key in seen:
+                logger.debug("Skipping duplicate URL: %s" % url)
+                continue
+            seen.add(canonical.key)
+            pending.add(pool.submit(scrape_safely, canonical))
+            if len(pending) >= 2 * max(jobs, 1):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def probe_stories(urls: [str], jobs: int = 16, per_domain: int = 2, interval: float = 0.5,
+                  loglevel=None) -> ProbeReport:
+    """Fingerprints the stories behind the URLs without downloading their chapters
+
+    Requests run on ``jobs`` threads while each host sees at most ``per_domain``
+    concurrent requests, started at least ``interval`` seconds apart. Unusable
+    URLs and failed probes are collected in the report instead of raised."""
+    logger = _setup_logger(loglevel=loglevel)
+    report = ProbeReport()
+    canonical_report = canonicalize_urls(urls)
+    report.failures.extend(canonical_report.errors)
+    fetcher = Fetcher(limits=DomainLimits(concurrency=per_domain, interval=interval))
+    probe_state = threading.local()
+
+    def probe(canonical: CanonicalURL):
+        if not hasattr(probe_state, 'sites'):
+            probe_state.sites = {}
+        if canonical.site not in probe_state.sites:
+            site = _create_processor(canonical.site, processors.load(canonical.site))
+            site.fetcher = fetcher
+            probe_state.sites[canonical.site] = site
+        site = probe_state.sites[canonical.site]
+        site.url = canonical.url
+        try:
+            return canonical, site.probe(), None
+        except Exception as error:
+            return canonical, None, str(getattr(error, 'value', error))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for canonical, fingerprint, error in pool.map(probe, canonical_report.unique):
+            if fingerprint is None:
+                logger.warning("Probe failed for: %s (%s)" % (canonical.url, error))
+                report.failures.append((canonical.url, error))
+            else:
+                report.fingerprints[canonical.key] = fingerprint
+    return report
+
+
+def refresh_daemon(watchlist_path: str, budgets: dict = None, per_domain: int = 2, interval: float = 0.5,
+                   recorder=None, output_dir=None):
+    """Builds a RefreshDaemon that probes with probe_stories and re-scrapes changed stories with ff_scrape"""
+    from ff_scrape.watchlist import Watchlist, RefreshDaemon
+
+    return RefreshDaemon(Watchlist(watchlist_path),
+                         probe=lambda urls: probe_stories(urls, per_domain=per_domain, interval=interval),
+                         rescrape=lambda urls: ff_scrape(urls, recorder=recorder, output_dir=output_dir),
+                         budgets=budgets)
+
+
+def queue_urls(queue_path: str, urls: Iterable[str], loglevel=None) -> int:
+    """Adds the stories behind the URLs to the job queue at queue_path, returns how many were new"""
+    from ff_scrape.jobqueue import JobQueue
+
+    logger = _setup_logger(loglevel=loglevel)
+    report = canonicalize_urls(urls)
+    for url, error in report.errors:
+        logger.error("Unknown URL format for: %s (%s)" % (url, error))
+    queue = JobQueue(queue_path)
+    try:
+        return queue.add(report)
+    finally:
+        queue.close()
+
+
+def run_queue_workers(queue_path: str, threads: int = 1, stop: threading.Event = None, poll_interval: float = 5.0,
+                      loglevel=None, formatter=None, recorder=None, output_dir=None, journal_dir=None,
+                      story_timeout: float = None, backup_dir=None) -> None:
+    """Scrapes the jobs of the queue at queue_path on ``threads`` workers until ``stop`` is set
+
+    Any number of processes, on this or other machines, can work the same queue.
+    The scrape options are those of ff_scrape; retried jobs resume from the
+    chapter journal when one is configured."""
+    from ff_scrape.jobqueue import JobQueue, Worker
+
+    _setup_logger(loglevel=loglevel)
+    stop = stop or threading.Event()
+    scrape = _story_scraper(formatter=formatter, recorder=recorder, output_dir=output_dir, journal_dir=journal_dir,
+                            story_timeout=story_timeout, backup_dir=backup_dir)
+    queue = JobQueue(queue_path)
+    workers = [threading.Thread(target=Worker(queue, scrape).run_forever, args=(stop, poll_interval))
+               for _ in range(threads)]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        stop.set()
+        for worker in workers:
+            if worker.is_alive():
+                worker.join()
+        queue.close()
@@ -0,0 +1,247 @@
+"""Long running scrape service with a local HTTP API
+
+The service keeps one worker pool for its whole lifetime. Site instances,
+their connection pools and the URL router are created once and stay warm, so
+a request only pays for the scrape itself. The API is served over TCP or a
+Unix socket:
+
+``POST /batches`` with ``{"urls": [...]}`` queues a batch and answers with its
+status, ``GET /batches/<id>`` polls that status and ``GET /batches/<id>/results``
+streams one JSON line per story as the stories finish. ``GET /health`` reports
+whether the service is up and ``GET /metrics`` exports the scrape metrics in the
+Prometheus text format."""
+from ff_scrape.scraper import processors, _story_scraper, _setup_logger
+from ff_scrape.routing import Router, CanonicalURL
+from ff_scrape.storybase import Story
+from ff_scrape.metrics import registry
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+import uuid
+
+
+def story_summary(fanfic: Story) -> dict:
+    """The JSON representation of a scraped story"""
+    return {
+        'url': fanfic.url,
+        'title': fanfic.title,
+        'authors': [author.name for author in fanfic.authors],
+        'status': fanfic.status,
+        'updated': fanfic.updated.isoformat() if fanfic.updated is not None else None,
+        'chapters': fanfic.chapter_count,
+        'words': fanfic.word_count,
+        'scrape_status': fanfic.scrape_status,
+        'metrics': fanfic.metrics.as_dict(),
+    }
+
+
+class Batch(object):
+    """URLs submitted together and the stories scraped for them so far"""
+
+    def __init__(self, batch_id: str):
+        self.id = batch_id
+        self.submitted = time.time()
+        self.errors: List[dict] = []
+        self.pending = 0
+        self._finished: List[dict] = []
+        self._condition = threading.Condition()
+
+    def _add(self) -> None:
+        with self._condition:
+            self.pending += 1
+
+    def _finish(self, result: dict) -> None:
+        with self._condition:
+            self._finished.append(result)
+            self.pending -= 1
+            self._condition.notify_all()
+
+    @property
+    def done(self) -> bool:
+        return self.pending == 0
+
+    def status(self) -> dict:
+        with self._condition:
+            return {
+                'id': self.id,
+                'submitted': self.submitted,
+                'pending': self.pending,
+                'finished': len(self._finished),
+                'errors': list(self.errors),
+                'stories': list(self._finished),
+            }
+
+    def iter_results(self) -> Iterator[dict]:
+        """Yields every story result, waiting for the ones still being scraped"""
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._finished) and self.pending > 0:
+                    self._condition.wait()
+                ready = self._finished[index:]
+            if len(ready) == 0:
+                return
+            for result in ready:
+                yield result
+            index += len(ready)
+
+
+class ScrapeService(object):
+    """Scrapes submitted batches on a pool of ``jobs`` warm worker threads
+
+    Up to ``max_batches`` finished batches are kept for polling, the other
+    options are those of ff_scrape."""
+
+    def __init__(self, jobs: int = 4, max_batches: int = 1000, formatter=None, recorder=None, output_dir=None,
+                 journal_dir=None, story_timeout: float = None, backup_dir=None, loglevel=None):
+        self._logger = _setup_logger(loglevel=loglevel)
+        self._scrape = _story_scraper(formatter=formatter, recorder=recorder, output_dir=output_dir,
+                                      journal_dir=journal_dir, story_timeout=story_timeout, backup_dir=backup_dir)
+        self._router = Router(processors)
+        self._pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='ff_scrape')
+        self._max_batches = max_batches
+        self._batches: Dict[str, Batch] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, urls: Iterable[str]) -> Batch:
+        batch = Batch(uuid.uuid4().hex)
+        seen = set()
+        for url, canonical, error in self._router.iter_canonical(urls):
+            if canonical is None:
+                batch.errors.append({'url': url, 'error': error})
+            elif canonical.key not in seen:
+                seen.add(canonical.key)
+                batch._add()
+                self._pool.submit(self._run, batch, canonical)
+        with self._lock:
+            self._batches[batch.id] = batch
+            self._evict()
+        return batch
+
+    def _evict(self) -> None:
+        for batch_id in list(self._batches):
+            if len(self._batches) <= self._max_batches:
+                return
+            if self._batches[batch_id].done:
+                del self._batches[batch_id]
+
+    def _run(self, batch: Batch, canonical: CanonicalURL) -> None:
+        try:
+            result = story_summary(self._scrape(canonical))
+        except Exception as error:
+            self._logger.error("Scrape failed for: %s (%s)" % (canonical.url, getattr(error, 'value', error)))
+            result = {'url': canonical.url, 'scrape_status': 'failed', 'error': str(getattr(error, 'value', error))}
+        batch._finish(result)
+
+    def batch(self, batch_id: str) -> Optional[Batch]:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def service(self) -> ScrapeService:
+        return self.server.service
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args) -> None:
+        logging.getLogger('ff_scrape.server').debug("%s - %s" % (self.address_string(), format % args))
+
+    def _send_json(self, code: int, value, headers: dict = None) -> None:
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, header in (headers or {}).items():
+            self.send_header(name, header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        if self.path.rstrip('/') != '/batches':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            urls = request['urls']
+            if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'Expected a JSON object with a list of urls'})
+            return
+        batch = self.service.submit(urls)
+        self._send_json(202, batch.status(), headers={'Location': '/batches/' + batch.id})
+
+    def do_GET(self) -> None:
+        parts = [part for part in self.path.split('?')[0].split('/') if part != '']
+        if parts == ['health']:
+            self._send_json(200, {'status': 'ok'})
+            return
+        if parts == ['metrics']:
+            body = registry.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        batch = self.service.batch(parts[1]) if len(parts) in (2, 3) and parts[0] == 'batches' else None
+        if batch is None:
+            self._send_json(404, {'error': 'Not found'})
+        elif len(parts) == 2:
+            self._send_json(200, batch.status())
+        elif parts[2] == 'results':
+            self._stream(batch)
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def _stream(self, batch: Batch) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for result in batch.iter_results():
+            line = (json.dumps(result) + '\n').encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class ScrapeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, service: ScrapeService):
+        self.service = service
+        super().__init__(address, _Handler)
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class ScrapeUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path: str, service: ScrapeService):
+            self.service = service
+            # a socket file left behind by a previous run would make the bind fail
+            if os.path.exists(path):
+                os.remove(path)
+            super().__init__(path, _Handler)
+
+        def server_close(self) -> None:
+            super().server_close()
+            if os.path.exists(self.server_address):
+                os.remove(self.server_address)
@@ -4,26 +4,35 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
+from urllib.parse import SplitResult
+from datetime import datetime
+from typing import Optional, Tuple, TYPE_CHECKING
 import re
-from dateutil.parser import parse
-import time
+
+if TYPE_CHECKING:
+    from bs4.element import Tag
 
 
 class AnimationSource(Site):
     """Provides the logic to parse fanfics from animationsource.org"""
+    hostnames = ('animationsource.org',)
+    missing_patterns = (re.compile(rb'class="bhaut2b"><h1[^>]*>The page can\'t be found!</h1>'),)
     _fandom: str
+    _reading_soup: object
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.AnimationSource',
                          site_params=site_params)
         self.site_url = "https://archiveofourown.org"
         self._fandom = ""
+        self._reading_soup = None
 
     def set_domain(self) -> None:
         """Sets the domain of the fanfic to AnimationSource"""
         self._fanfic.domain = "Animation Source"
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         if 'animationsource.org/' in url:
             return True
         return False
@@ -32,7 +41,8 @@ class AnimationSource(Site):
     def url(self, value: str) -> None:
         """Allows for the URL to be changed to parse another fanfic"""
         if self._fanfic_set:
-            del self._fanfic
+            self._fanfic = None
+            self._fanfic_set = False
             self._got_meta = False
             self.cleanup_custom_vars()
         self._url = ''
@@ -43,25 +53,27 @@ class AnimationSource(Site):
         url_split = value.split("/")
         self._fandom = url_split[3]
 
-    def correct_url(self, url: str) -> str:
-        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
-        # check if url has "http://" or "https://" prefix
-        if "http://" not in url and "https://" not in url:
-            url = "http://" + self.url
-        url_split = url.split("/")
-        # correct URL as needed for script
-        if len(url_split) != 8:
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Strips the reading view parameters from the story URL"""
+        # path is /<fandom>/<language>/view_fanfic/<title>/<story id>.html&deb=0&nsite=1
+        path = parts.path.split('/')
+        if len(path) != 6 or path[5] == '':
             raise URLError('Unknown URL format')
-        if url_split[7] == '':
+        page = path[5].split('&')[0]
+        story_id = page.replace('.html', '')
+        if not story_id.isdigit():
             raise URLError('Unknown URL format')
-
-        temp = url_split[7].split('&')
-        url_split[7] = temp[0]
-        url = '/'.join(url_split)
-        return url
+        path[5] = page
+        return story_id, "https://www.animationsource.org" + '/'.join(path)
 
     def cleanup_custom_vars(self):
         self._fandom = ""
+        self._reading_soup = None
+
+    def meta_url(self) -> str:
+        """The reading view of the first chapter, which also carries the story details"""
+        return self._url + "&deb=0&nsite=1"
 
     def check_story_exists(self) -> bool:
         """Verify that the fanfic exists"""
@@ -71,17 +83,44 @@ class AnimationSource(Site):
             return False
         return True
 
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the date the story was sent without parsing the page
+
+        The story page does not list the chapters, so only the date is known."""
+        from dateutil.parser import parse
+
+        sent = re.search(r'Date sent</b>\s*:\s*([^<]+)<', text)
+        if sent is None:
+            return None, None
+        return parse(sent.group(1).strip()), None
+
+    @staticmethod
+    def story_details(soup) -> Optional['Tag']:
+        """The panel with the story details, told apart from other ct2 blocks by its Date sent label"""
+        for panel in soup.find_all('div', {'class': 'ct2'}):
+            if panel.find(text='Date sent') is not None:
+                return panel
+        return None
+
     def record_story_metadata(self) -> None:
         """Record the metadata of the fanfic"""
+        from dateutil.parser import parse
 
         colon_removal = re.compile("^\\s+:\\s+")
 
-        self._fanfic.raw_index_page = self._soup.prettify()
+        # keep the reading view for the first chapter and its links to the others
+        if self._soup.find('div', {'class': 'fanfic'}) is not None:
+            self._reading_soup = self._soup
+        if self.story_details(self._soup) is None:
+            # this reading view has no story details, they are on the story page
+            self._update_soup(lenient=False)
+
+        self._fanfic.raw_index_page = self._prettify(self._soup)
         self._fanfic.add_universe(standardize_universe(self._fandom))
         self._fanfic.title = self._soup.find_all('div', {'class': 'bhaut2b'})[0].text
 
         # get top panel with the details
-        header = self._soup.find_all('div', {'class', 'ct2'})[0]
+        header = self.story_details(self._soup)
 
         author_text = header.find_all(text='Author')[0]
         author_string = author_text.parent.next_sibling
@@ -138,12 +177,12 @@ class AnimationSource(Site):
 
         # get the story container
         fanfic_container = self._soup.find_all('div', {'class': 'fanfic'})[0]
-        chapter_obj.raw_body = fanfic_container.prettify()
+        chapter_obj.raw_body = self._prettify(fanfic_container)
 
         # remove the table containing the chapter links at the bottom
         for table in fanfic_container.find_all('table'):
             table.decompose()
-        chapter_obj.processed_body = fanfic_container.prettify()
+        chapter_obj.processed_body = self._prettify(fanfic_container)
         chapter_obj.word_count = len(fanfic_container.text.split())
 
         chapter_obj.name = "Chapter {}".format(chapter)
@@ -152,9 +191,13 @@ class AnimationSource(Site):
     def record_story_chapters(self) -> None:
         """Record the chapters of the fanfic"""
 
-        # get initial reading link
-        link = self._url + "&deb=0&nsite=1"
-        self._update_soup(link)
+        # the reading view of the first chapter was kept by the metadata, it is only used once
+        # as extracting the chapter takes the links out of it
+        if self._reading_soup is not None:
+            self._soup = self._reading_soup
+            self._reading_soup = None
+        else:
+            self._update_soup(self.meta_url())
 
         chapters_raw = self._soup.find_all('span', {'class': 'f9'})
         chapters = []
@@ -170,11 +213,16 @@ class AnimationSource(Site):
             for link in chapter.find_all('a'):
                 chapters.append({'number': chapter_number, 'link': link.attrs['href']})
 
-        self._fanfic.add_chapter(self._extract_chapter('1'))
+        # the first chapter is on the reading page
+        self._add_chapter({'number': '1', 'link': self._url}, lambda: self._extract_chapter('1'))
 
         for chapter in chapters:
-            time.sleep(self._chapter_sleep_time)
-            # get page
-            self._update_soup(url=chapter['link'])
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        """Download and extract a single chapter"""
+        self._pause(self._chapter_sleep_time)
+        # get page
+        self._update_soup(url=chapter['link'])
 
-            self._fanfic.add_chapter(self._extract_chapter(chapter['number']))
+        return self._extract_chapter(chapter['number'])
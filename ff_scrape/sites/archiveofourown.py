@@ -4,46 +4,173 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
+from urllib.parse import SplitResult
+from collections import deque
+from datetime import datetime
+from html.parser import HTMLParser
 import re
-from dateutil.parser import parse
-from bs4.element import Tag
-from typing import List
+from typing import Callable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bs4.element import Tag
+
+# characters of the full work page handed to the chapter splitter at a time
+SPLIT_CHUNK = 64 * 1024
+
+
+def _prettify(tag: 'Tag') -> str:
+    return tag.prettify()
+
+
+def _chapter_from_tag(chapter: 'Tag', prettify: Callable[['Tag'], str] = _prettify) -> Chapter:
+    """Extract name, text and word count from a div.chapter"""
+    new_line_regex = re.compile('\n')
+    # todo: need to add author notes in as well
+    chapter_object = Chapter()
+
+    chap_name_container = chapter.find_all(True, {'class': 'chapter preface group'})[0]
+    chap_name = chap_name_container.find_all('h3')[0].text
+    chapter_object.name = new_line_regex.sub('', chap_name).strip()
+
+    chap_text = chapter.find_all(True, {'class': 'userstuff'})[0]
+    chapter_object.raw_body = prettify(chap_text)
+
+    # remove the invisible heading
+    heading = chapter.find_all('h3', {'class': ['landmark', 'heading']})
+    for element in heading:
+        element.decompose()
+    chapter_object.processed_body = prettify(chap_text)
+    chapter_object.word_count = len(chap_text.text.split())
+    return chapter_object
+
+
+def extract_chapter(source: str, prettify: Callable[['Tag'], str] = _prettify) -> Chapter:
+    """Parse the source of a single div.chapter, a plain function so worker processes can run it"""
+    from bs4 import BeautifulSoup
+
+    return _chapter_from_tag(BeautifulSoup(source, features="html.parser").find('div'), prettify)
+
+
+class ChapterSplitter(HTMLParser):
+    """Cuts the source of every div.chapter out of a document fed to it in pieces
+
+    Only the source of the chapter being read is kept, finished chapters are
+    collected in ``chapters`` as (id, source) until taken."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._depth = 0
+        self._id = None
+        self._parts: List[str] = []
+        self.chapters: List[Tuple[str, str]] = []
+
+    def take(self) -> List[Tuple[str, str]]:
+        chapters, self.chapters = self.chapters, []
+        return chapters
+
+    def _add(self, text: str) -> None:
+        if self._depth > 0:
+            self._parts.append(text)
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if self._depth > 0:
+            self._parts.append(self.get_starttag_text())
+            if tag == 'div':
+                self._depth += 1
+            return
+        attributes = dict(attrs)
+        if tag == 'div' and 'chapter' in (attributes.get('class') or '').split() and \
+                'chapter' in (attributes.get('id') or ''):
+            self._depth = 1
+            self._id = attributes['id']
+            self._parts = [self.get_starttag_text()]
+
+    def handle_startendtag(self, tag: str, attrs: list) -> None:
+        self._add(self.get_starttag_text())
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._depth == 0:
+            return
+        self._parts.append('</%s>' % tag)
+        if tag == 'div':
+            self._depth -= 1
+            if self._depth == 0:
+                self.chapters.append((self._id, ''.join(self._parts)))
+                self._parts = []
+
+    def handle_data(self, data: str) -> None:
+        self._add(data)
+
+    def handle_entityref(self, name: str) -> None:
+        self._add('&%s;' % name)
+
+    def handle_charref(self, name: str) -> None:
+        self._add('&#%s;' % name)
+
+    def handle_comment(self, data: str) -> None:
+        self._add('<!--%s-->' % data)
+
 
 class ArchiveofOurOwn(Site):
-    """Provides the logic to parse fanfics from archiveofourown.org"""
+    """Provides the logic to parse fanfics from archiveofourown.org
+
+    The metadata is read from the part of the full work page before the
+    chapters. The chapters are cut out of the rest of the page one at a time
+    and parsed on their own, in ``parallel`` worker processes when that site
+    parameter is above one, so only a few chapter trees exist at any time."""
+    hostnames = ('archiveofourown.org',)
+    missing_statuses = (404,)
+    missing_patterns = (re.compile(rb'class=["\'][^"\'>]*\berror-404\b'),)
+    _page_text: Optional[str]
+    _chapters_start: int
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.ArchiveofOurOwn',
                          site_params=site_params)
         self.site_url = "https://archiveofourown.org"
+        self._parallel = int(site_params.get('parallel', 1))
+        self._page_text = None
+        self._chapters_start = 0
 
     def set_domain(self) -> None:
         """Sets the domain of the fanfic to archiveofourown"""
         self._fanfic.domain = "Archive of Our Own"
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         if 'archiveofourown.org/' in url:
             return True
         return False
 
-    def correct_url(self, url: str) -> str:
-        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
-        # check if url has "http://" or "https://" prefix
-        if "http://" not in url and "https://" not in url:
-            url = "http://" + self.url
-        url_split = url.split("/")
-        # correct URL as needed for script
-        if len(url_split) <= 4:
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Maps work, chapter and collection URLs to the full work view"""
+        # path is /works/<work id>/chapters/<chapter id>, optionally prefixed by /collections/<name>
+        path = parts.path.split('/')
+        if len(path) < 3:
+            raise URLError('Unknown URL format')
+        if 'works' not in path:
             raise URLError('Unknown URL format')
-        if url_split[4] == '':
+        index = path.index('works') + 1
+        if index == len(path) or path[index] == '':
             raise URLError('Missing story ID')
+        if not path[index].isdigit():
+            raise URLError('Unknown URL format')
+        return path[index], "https://archiveofourown.org/works/%s?view_full_work=true" % path[index]
+
+    def cleanup_custom_vars(self) -> None:
+        self._page_text = None
+        self._chapters_start = 0
 
-        while len(url_split) > 5:
-            url_split.pop(5)
-        story_id = url_split[4].split('?')
-        url_split[4] = story_id[0] + "?view_full_work=true"
-        url = '/'.join(url_split)
-        return url
+    def _parse(self, text: str, lenient: bool = True):
+        """Parse the page up to the chapters, keeping the rest for the chapter splitter"""
+        start = text.find('<div id="chapters"')
+        if start == -1:
+            self._page_text = None
+            return super()._parse(text, lenient)
+        self._page_text = text
+        self._chapters_start = start
+        return super()._parse(text[0:start], lenient)
 
     def check_story_exists(self) -> bool:
         """Verify that the fanfic exists"""
@@ -53,7 +180,29 @@ class ArchiveofOurOwn(Site):
             return False
         return True
 
-    def _extract_values(self, tag: Tag) -> List[str]:
+    def get_meta(self) -> None:
+        # consent to adult content once for the whole session, so no request gets the interstitial
+        self._fetcher.set_cookie('view_adult', 'true', 'archiveofourown.org')
+        super().get_meta()
+
+    def meta_url(self) -> str:
+        """The full work with the adult content consent, so no interstitial or redirect comes first"""
+        return self._url + '&view_adult=true'
+
+    def probe_url(self) -> str:
+        """The first chapter view carries the same stats block as the full work but only one chapter"""
+        return self._url.replace('?view_full_work=true', '?view_adult=true')
+
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the dates and chapter count from the stats block without parsing the page"""
+        dates = re.findall(r'<dd class="(?:published|status)">([0-9-]+)</dd>', text)
+        if len(dates) == 0:
+            return None, None
+        updated = max(datetime.strptime(date, '%Y-%m-%d') for date in dates)
+        chapters = re.search(r'<dd class="chapters">(\d+)/', text)
+        return updated, int(chapters.group(1)) if chapters is not None else None
+
+    def _extract_values(self, tag: 'Tag') -> List[str]:
         values = []
         links = tag.find_all('a')
         for link in links:
@@ -62,8 +211,9 @@ class ArchiveofOurOwn(Site):
 
     def record_story_metadata(self) -> None:
         """Record the metadata of the fanfic"""
+        from dateutil.parser import parse
 
-        self._fanfic.raw_index_page = self._soup.prettify()
+        self._fanfic.raw_index_page = self._prettify(self._soup)
 
         # get title and author from top center
         header = self._soup.find_all(True, {'class': 'work meta group'})[0]
@@ -138,29 +288,43 @@ class ArchiveofOurOwn(Site):
         summary = new_line_regex.sub('', summary)
         self._fanfic.summary = summary.strip()
 
+    def _chapter_sources(self) -> Iterator[Tuple[str, str]]:
+        """The id and source of every chapter of the full work page, in order"""
+        text, start = self._page_text, self._chapters_start
+        # the page is only split once, a retry downloads it again
+        self._page_text = None
+        splitter = ChapterSplitter()
+        for position in range(start, len(text), SPLIT_CHUNK):
+            splitter.feed(text[position:position + SPLIT_CHUNK])
+            yield from splitter.take()
+        splitter.close()
+        yield from splitter.take()
+
     def record_story_chapters(self) -> None:
         """Record the chapters of the fanfic"""
+        if self._page_text is None:
+            # the chapters were parsed along with the rest of the page
+            id_regex = re.compile('chapter')
+            for chapter in self._soup.find_all('div', {'class': 'chapter', 'id': id_regex}):
+                self._add_chapter({'id': chapter.attrs['id']}, lambda: _chapter_from_tag(chapter, self._prettify))
+            return
 
-        id_regex = re.compile('chapter')
-        new_line_regex = re.compile('\n')
-        chapters = self._soup.find_all('div', {'class': 'chapter', 'id': id_regex})
-
-        for chapter in chapters:
-            # todo: need to add author notes in as well
-            chapter_object = Chapter()
-
-            chap_name_container = chapter.find_all(True, {'class': 'chapter preface group'})[0]
-            chap_name = chap_name_container.find_all('h3')[0].text
-            chapter_object.name = new_line_regex.sub('', chap_name).strip()
-
-            chap_text = chapter.find_all(True, {'class': 'userstuff'})[0]
-            chapter_object.raw_body = chap_text.prettify()
+        if self._parallel <= 1:
+            for chapter_id, source in self._chapter_sources():
+                self._add_chapter({'id': chapter_id}, lambda: extract_chapter(source, self._prettify))
+            return
 
-            # remove the invisible heading
-            heading = chapter.find_all('h3', {'class': ['landmark', 'heading']})
-            for element in heading:
-                element.decompose()
-            chapter_object.processed_body = chap_text.prettify()
-            chapter_object.word_count = len(chap_text.text.split())
+        from concurrent.futures import ProcessPoolExecutor
 
-            self._fanfic.add_chapter(chapter_object)
+        # the workers prettify the chapters themselves, their time is part of the extract phase
+        with ProcessPoolExecutor(max_workers=self._parallel) as pool:
+            # a bounded window of chapters is in flight, the others are not cut out yet
+            pending = deque()
+            for chapter_id, source in self._chapter_sources():
+                pending.append((chapter_id, pool.submit(extract_chapter, source)))
+                if len(pending) >= 2 * self._parallel:
+                    chapter_id, future = pending.popleft()
+                    self._add_chapter({'id': chapter_id}, future.result)
+            while len(pending) > 0:
+                chapter_id, future = pending.popleft()
+                self._add_chapter({'id': chapter_id}, future.result)
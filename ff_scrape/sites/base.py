@@ -1,17 +1,47 @@
-"""Contains central imports for all of the sites package"""
-import requests                        # used to get the web page to pass to beautifulsoup
-from urllib.parse import urljoin       # used to properly format the web URL
+"""Contains central imports for all of the sites package
+
+BeautifulSoup is heavy to import (it pulls in html5lib when it is installed) so
+it is only imported once a page is fetched."""
+from urllib.parse import urljoin, urlsplit, SplitResult  # used to properly format the web URL
 import logging                         # used for logger setup
-from bs4 import BeautifulSoup          # used to parse the web page
 from ff_scrape.errors import *         # used for custom errors
 from os import environ                 # used for environment variable lookups
-from ff_scrape.storybase import Story
+from ff_scrape.storybase import Story, Chapter
+from ff_scrape.recorders.base import Recorder
+from ff_scrape.fetch import Fetcher, Deadline, default_fetcher
+from ff_scrape.probe import Fingerprint
+from ff_scrape.journal import ChapterJournal, StoryCheckpoint
+from ff_scrape.metrics import StoryMetrics
+from datetime import datetime
+from typing import Callable, List, Optional, Pattern, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+    from requests import Response
+
+
+def split_url(url: str) -> SplitResult:
+    """Splits a URL, assuming http when the scheme was left off"""
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    return urlsplit(url)
 
 
 class Site(object):
     """Creates a logger using a variable formatter"""
 
-    _soup: BeautifulSoup
+    # registrable domains served by the site, subdomains are routed to the site as well
+    hostnames: Tuple[str, ...] = ()
+    # tree builder of the index pages, sites whose markup html.parser gets wrong opt into html5lib
+    index_parser: str = 'html.parser'
+    # cheap signs of a missing story, checked on the fetched page before it is parsed: HTTP
+    # statuses and byte patterns searched for in the first missing_scan bytes
+    missing_statuses: Tuple[int, ...] = ()
+    missing_patterns: Tuple[Pattern[bytes], ...] = ()
+    missing_scan: int = 64 * 1024
+
+    _soup: 'BeautifulSoup'
     _fanfic_set: bool
     _url: str
     _fanfic: Story
@@ -19,6 +49,11 @@ class Site(object):
     _chapter_sleep_time: int
     _params: dict
     _logging: logging.Logger
+    _fetcher: Fetcher
+    _journal: ChapterJournal
+    _checkpoint: StoryCheckpoint
+    _deadline: Deadline
+    _metrics: StoryMetrics
 
     def __init__(self, loglevel=None, **kwargs):
         defaults = {
@@ -32,6 +67,11 @@ class Site(object):
         self._url = ''
         self._fanfic = None
         self._got_meta = False
+        self._fetcher = default_fetcher()
+        self._journal = None
+        self._checkpoint = None
+        self._deadline = None
+        self._metrics = StoryMetrics(site=self.__class__.__name__)
 
         self._chapter_sleep_time = 3
 
@@ -82,48 +122,185 @@ class Site(object):
             ch.setFormatter(formatter)
             self._logger.addHandler(ch)
 
-    def get_story(self) -> None:
-        """Perform the necessary steps to download the fanfic"""
+    def get_story(self, recorders: List[Recorder] = None, deadline: Deadline = None) -> None:
+        """Perform the necessary steps to download the fanfic
 
-        self.log_debug("Starting story")
+        Any recorders are started once the metadata is known and receive each
+        chapter as soon as record_story_chapters produces it. With a journal set,
+        every chapter is checkpointed and a retry resumes after the last one.
+
+        When the deadline passes every request is cut short and DeadlineError is
+        raised, leaving the chapters downloaded so far on a story marked partial."""
 
+        self.log_debug("Starting story")
+        if deadline is not None:
+            self._deadline = deadline
+        try:
+            self._get_story(recorders)
+        except DeadlineError:
+            if self._fanfic is not None:
+                self._fanfic.scrape_status = 'partial'
+            self.log_warn("Deadline passed, stopping the story")
+            raise
+        finally:
+            self._deadline = None
+            self._metrics.finish()
+
+    def _get_story(self, recorders: List[Recorder] = None) -> None:
         if not self._got_meta:
+            self._metrics = StoryMetrics(site=self.__class__.__name__)
             self.get_meta()
 
         self.log_debug("Done metadata")
-        self.record_story_chapters()
-
-        self.log_info("Done processing story")
+        if recorders is None:
+            recorders = []
+        # a retry starts the chapters over, checkpointed ones are taken from the journal
+        del self._fanfic.chapters[:]
+        for recorder in recorders:
+            recorder.start(self._fanfic)
+            self._fanfic.add_chapter_listener(recorder.add_chapter)
+        if self._journal is not None:
+            self._checkpoint = self._journal.open(self.story_key)
+            if len(self._checkpoint) > 0:
+                self.log_info("Resuming with %d checkpointed chapters" % len(self._checkpoint))
+
+        try:
+            self.record_story_chapters()
+        except BaseException:
+            for recorder in recorders:
+                recorder.abort()
+            if self._checkpoint is not None:
+                self._checkpoint.close()
+                self._checkpoint = None
+            raise
+        finally:
+            for recorder in recorders:
+                self._fanfic.remove_chapter_listener(recorder.add_chapter)
+        with self._metrics.phase('record'):
+            for recorder in recorders:
+                recorder.finish()
+        if self._checkpoint is not None:
+            self._checkpoint.discard()
+        self._checkpoint = None
+        self._fanfic.scrape_status = 'complete'
+
+        self.log_info("Done processing story: %d chapters with %d requests"
+                      % (self._fanfic.chapter_count, self._metrics.counts.get('requests', 0)))
+
+    def _add_chapter(self, entry: dict, download: Callable[[], Chapter]) -> None:
+        """Add the chapter for a chapter list entry, reusing its checkpoint if it still matches"""
+        index = self._fanfic.chapter_count
+        chapter = None
+        if self._checkpoint is not None:
+            chapter = self._checkpoint.load(index, entry)
+        if chapter is None:
+            with self._metrics.phase('extract'):
+                chapter = download()
+            if self._checkpoint is not None:
+                self._checkpoint.save(index, entry, chapter)
+        else:
+            self.log_debug("Reusing checkpointed chapter: " + chapter.name)
+            self._metrics.count('checkpoint_hits')
+        self._metrics.count('chapters')
+        self._fanfic.add_chapter(chapter)
+
+    def _pause(self, seconds: float) -> None:
+        """Wait between requests, giving up right away if the deadline would pass meanwhile"""
+        if self._deadline is not None and self._deadline.remaining() < seconds:
+            raise DeadlineError("Deadline would pass while waiting")
+        with self._metrics.phase('sleep'):
+            self._fetcher.sleep(seconds)
+
+    def _prettify(self, tag) -> str:
+        with self._metrics.phase('prettify'):
+            return tag.prettify()
 
     def _update_soup(self, url: str = None, lenient: bool = True, cookie_jar=None) -> None:
         if url is None:
             url = self._url
-        page = requests.get(url, cookies=cookie_jar)
+        page = self._fetch(url, cookie_jar)
+        with self._metrics.phase('parse'):
+            self._soup = self._parse(page.text, lenient)
+
+    def _fetch(self, url: str, cookie_jar=None) -> 'Response':
+        with self._metrics.phase('network'):
+            return self._fetcher.get(url, cookies=cookie_jar, deadline=self._deadline, metrics=self._metrics)
+
+    def _parse(self, text: str, lenient: bool = True):
+        """Parse a fetched page, sites override it to leave out parts they read another way
+
+        Index pages (not ``lenient``) get the ``index_parser`` of the site."""
+        from bs4 import BeautifulSoup
+
         if lenient:
-            self._soup = BeautifulSoup(page.text, features="html.parser")
-        else:
-            # need to use html5lib due to ff.net having broken html in their site
-            # most notably the chapter list
-            self._soup = BeautifulSoup(page.text, features="html5lib")
+            return BeautifulSoup(text, features="html.parser")
+        return BeautifulSoup(text, features=self.index_parser)
 
     def get_meta(self) -> None:
-        # get page
-        self._update_soup(lenient=False)
+        # get page, a missing story is told from the response before it is parsed
+        page = self._fetch(self.meta_url())
+        if self.missing_story(page):
+            self.log_warn("Story doesn't exist.")
+            raise StoryError("Story doesn't exist.")
+        with self._metrics.phase('parse'):
+            self._soup = self._parse(page.text, lenient=False)
+
+        with self._metrics.phase('extract'):
+            # check to see that the story exists
+            if not self.check_story_exists():
+                raise StoryError("Story doesn't exist.")
+
+            # create a story and start setting attributes
+            self._fanfic = Story(self._url)
+            self._fanfic.metrics = self._metrics
+            self._fanfic_set = True
+            self.set_domain()
+            self.log_debug("Recording metadata")
+            self.record_story_metadata()
+        self._got_meta = True
 
-        # check to see that the story exists
-        if not self.check_story_exists():
+    def check_story_exists(self) -> bool:
+        return True
+
+    def missing_story(self, page: 'Response') -> bool:
+        """Whether the fetched page shows a missing story by its status or the missing_patterns of the site"""
+        if getattr(page, 'status_code', 200) in self.missing_statuses:
+            return True
+        if len(self.missing_patterns) == 0:
+            return False
+        head = page.content[0:self.missing_scan]
+        return any(pattern.search(head) is not None for pattern in self.missing_patterns)
+
+    def probe(self) -> Fingerprint:
+        """Fetch only the page carrying the update time and chapter count of the fanfic"""
+        page = self._fetcher.get(self.probe_url(), deadline=self._deadline)
+        if self.missing_story(page):
+            raise StoryError("Story doesn't exist.")
+        updated, chapter_count = self.extract_probe_fields(page.text)
+        if updated is None and chapter_count is None:
             raise StoryError("Story doesn't exist.")
+        return Fingerprint(self._url, updated, chapter_count)
 
-        # create a story and start setting attributes
+    def probe_url(self) -> str:
+        return self._url
+
+    def meta_url(self) -> str:
+        """The page the metadata is read from, sites override it when another page also gets them chapters"""
+        return self._url
+
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Extract the update time and chapter count from the probed page
+
+        Sites override this with a cheap extraction, the fallback runs the full
+        metadata parse on the page."""
+        self._soup = self._parse(text, lenient=False)
+        if not self.check_story_exists():
+            return None, None
         self._fanfic = Story(self._url)
         self._fanfic_set = True
-        self.set_domain()
-        self.log_debug("Recording metadata")
         self.record_story_metadata()
-        self._got_meta = True
-
-    def check_story_exists(self) -> bool:
-        return True
+        chapter_count = len(getattr(self, 'chapter_list', [])) or None
+        return self._fanfic.updated, chapter_count
 
     def record_story_metadata(self) -> None:
         pass
@@ -147,7 +324,9 @@ class Site(object):
     def url(self, value: str) -> None:
         """Allows for the URL to be changed to parse another fanfic"""
         if self._fanfic_set:
-            del self._fanfic
+            # a failed scrape may have left the previous story behind, never reuse it
+            self._fanfic = None
+            self._fanfic_set = False
             self._got_meta = False
             self.cleanup_custom_vars()
         self._url = ''
@@ -160,16 +339,63 @@ class Site(object):
     def fanfic(self) -> Story:
         return self._fanfic
 
+    @property
+    def fetcher(self) -> Fetcher:
+        """Fetcher used for every page request, shared between sites by default"""
+        return self._fetcher
+
+    @fetcher.setter
+    def fetcher(self, fetcher: Fetcher) -> None:
+        self._fetcher = fetcher
+
+    @property
+    def journal(self) -> ChapterJournal:
+        """Chapter journal used to resume interrupted downloads, None disables checkpoints"""
+        return self._journal
+
+    @journal.setter
+    def journal(self, journal: ChapterJournal) -> None:
+        self._journal = journal
+
+    @property
+    def metrics(self) -> StoryMetrics:
+        """Measurements of the current story"""
+        return self._metrics
+
+    @property
+    def deadline(self) -> Deadline:
+        """Deadline applied to every request of the current story, None waits forever"""
+        return self._deadline
+
+    @deadline.setter
+    def deadline(self, deadline: Deadline) -> None:
+        self._deadline = deadline
+
+    @property
+    def story_key(self) -> Tuple[str, str]:
+        """Canonical (site, story id) key of the current URL"""
+        return self.__class__.__name__, self.canonicalize(split_url(self._url))[0]
+
     def reset_fanfic(self) -> None:
         if self._fanfic_set:
             del self._fanfic
         self._fanfic = Story(self._url)
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         return False
 
     def correct_url(self, url: str) -> str:
-        return url
+        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
+        return self.canonicalize(split_url(url))[1]
+
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Returns the canonical story id and fetch URL for an already split URL
+
+        Raises URLError when the URL does not point at a story."""
+        url = parts.geturl()
+        return url, url
 
     def __enter__(self):
         pass
@@ -4,27 +4,47 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
-from urllib.parse import urljoin, urlparse, urlunparse, ParseResult
+from urllib.parse import urljoin, urlparse, urlunparse, unquote, ParseResult, SplitResult
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import posixpath
 import re
-import time
-from dateutil.parser import parse
+
+# namespaces of the epub container and package documents
+EPUB_CONTAINER = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+EPUB_PACKAGE = '{http://www.idpf.org/2007/opf}'
+
 
 class FanficAuthors(Site):
-    """Provides the logic to parse fanfics from fanficauthors.net"""
+    """Provides the logic to parse fanfics from fanficauthors.net
+
+    With the epub site parameter set the chapters are read from the epub the
+    site offers for the story, one request for the whole story. Every chapter
+    page is downloaded instead when there is no epub or its chapters do not
+    match the chapter list, from the first chapter the epub lacks on."""
+    hostnames = ('fanficauthors.net',)
+    missing_statuses = (404,)
+    missing_patterns = (re.compile(rb'<title>\s*Not Found\s*</title>', re.IGNORECASE),)
     chapter_list: [dict]
     _url_obj: ParseResult
+    _epub_link: Optional[str]
+    _epub_chapters: Optional[Iterator[Tuple[int, Chapter]]]
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.FanficAuthors',
                          site_params=site_params)
         self.chapter_list = []
         self._url_obj = None
+        self._use_epub = str(site_params.get('epub', 'False')).upper() == 'TRUE'
+        self._epub_link = None
+        self._epub_chapters = None
 
     def set_domain(self) -> None:
         """Sets the domain of the fanfic to Fanfiction.net"""
         self._fanfic.domain = "Fanfic Authors"
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         if 'fanficauthors.net/' in url:
             return True
         return False
@@ -33,7 +53,8 @@ class FanficAuthors(Site):
     def url(self, value: str) -> None:
         """Allows for the URL to be changed to parse another fanfic"""
         if self._fanfic_set:
-            del self._fanfic
+            self._fanfic = None
+            self._fanfic_set = False
             self._got_meta = False
             self.cleanup_custom_vars()
         self._url = ''
@@ -43,20 +64,16 @@ class FanficAuthors(Site):
         self._url = value
         self._url_obj = urlparse(value)
 
-    def correct_url(self, url: str) -> str:
-        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
-        # check if url has "http://" or "https://" prefix
-        if "http://" not in url and "https://" not in url:
-            url = "http://" + self.url
-        url_split = url.split("/")
-        # correct URL as needed for script
-        if len(url_split) <= 4:
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Maps chapter URLs to the index page of the story"""
+        # every author has a subdomain, the path is /<story>/<chapter>/
+        author = parts.hostname.split('.')[0] if parts.hostname else ''
+        path = parts.path.split('/')
+        if len(path) < 3 or path[1] == '' or author in ['', 'fanficauthors', 'www']:
             raise URLError('Unknown URL format')
-        else:
-            while len(url_split) > 5:
-                url_split.pop(5)
-            url = urljoin('/'.join(url_split), 'index')
-        return url
+        story_id = "%s/%s" % (author, path[1])
+        return story_id, "https://%s.fanficauthors.net/%s/index" % (author, path[1])
 
     def check_story_exists(self) -> bool:
         """Verify that the fanfic exists"""
@@ -66,17 +83,31 @@ class FanficAuthors(Site):
             return False
         return True
 
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the update line and chapter count of the summary block without parsing the page"""
+        from dateutil.parser import parse
+
+        updated = re.search(r'was updated on ([^<]+)<', text)
+        if updated is None:
+            return None, None
+        chapters = re.search(r'Chapters: (\d+)', text)
+        return parse(updated.group(1)), int(chapters.group(1)) if chapters is not None else None
+
     def cleanup_custom_vars(self) -> None:
         self.chapter_list = []
         self._url_obj = None
+        self._epub_link = None
+        self._epub_chapters = None
 
     def record_story_metadata(self) -> None:
         """Record the metadata of the fanfic"""
+        from dateutil.parser import parse
 
         # get title and author from top center
         header = self._soup.find_all(True, {'class': 'page-header'})[0]
         header_objs = header.find_all(True, {'class': 'text-center'})
-        author = header_objs[1].text.replace('By ', '')
+        # the author heading is closed with </h2>, only html5lib ends it there
+        author = header_objs[1].text.replace('By ', '').strip()
         author_url = self._url_obj.scheme + "://" + self._url_obj.netloc
         self._fanfic.title = header_objs[0].text
         self._fanfic.add_author(author, author_url)
@@ -84,7 +115,7 @@ class FanficAuthors(Site):
         # get metadata info from story summary div
         metadata_container = self._soup.find_all(True, {'class': 'well'})[0]
         self._fanfic.summary = metadata_container.find('blockquote').text.strip()
-        self._fanfic.raw_index_page = self._soup.prettify()
+        self._fanfic.raw_index_page = self._prettify(self._soup)
 
         paragraphs = metadata_container.find_all('p')
         for group in paragraphs[1].text.split(' - '):
@@ -114,6 +145,8 @@ class FanficAuthors(Site):
         container = self._soup.find_all(True, {'class': 'row'})[0]
         links = container.find_all('a')
         for link in links:
+            if link.text == 'Epub':
+                self._epub_link = link['href']
             if link.text in ['Epub', 'lit', 'mobi', 'pdf', 'txt']:
                 continue
             if '/reviews/' in link['href']:
@@ -123,25 +156,104 @@ class FanficAuthors(Site):
     def record_story_chapters(self) -> None:
         """Record the chapters of the fanfic"""
         # need to add /?bypass=1 to url
-        for chapter in self.chapter_list:
-            time.sleep(self._chapter_sleep_time)
-            self.log_debug("Downloading chapter:" + chapter['name'])
-            url_fixed = urlunparse(self._url_obj._replace(path=chapter['link'], query='bypass=1'))
-
-            # get page
-            self._update_soup(url=url_fixed)
-            story = self._soup.find_all(True, {'class': 'story'})[0]
-
-            # remove the pager elements at the top and bottom
-            for element in story.find_all(True, {'class': 'pager'}):
-                element.decompose()
-            # remove the 'well' block at the top
-            for element in story.find_all(True, {'class': 'well'}):
-                element.decompose()
+        for index, chapter in enumerate(self.chapter_list):
+            self._add_chapter(chapter, lambda: self._whole_story_chapter(index, chapter))
+
+    def _whole_story_chapter(self, index: int, chapter: dict) -> Chapter:
+        """Take the chapter from the epub, which is only fetched once a chapter is not checkpointed"""
+        if self._use_epub and self._epub_link is not None and self._epub_chapters is None:
+            self._epub_chapters = self._split_epub()
+        if self._epub_chapters is not None:
+            # checkpointed chapters are skipped, the epub is read up to the requested one
+            for position, chapter_object in self._epub_chapters:
+                if position == index:
+                    return chapter_object
+        return self._download_chapter(chapter)
+
+    @staticmethod
+    def _epub_documents(archive) -> List[str]:
+        """The names of the content documents of the epub, in reading order"""
+        from xml.etree import ElementTree
+
+        container = ElementTree.fromstring(archive.read('META-INF/container.xml'))
+        package_path = container.find('.//%srootfile' % EPUB_CONTAINER).attrib['full-path']
+        package = ElementTree.fromstring(archive.read(package_path))
+        manifest = {item.attrib['id']: item.attrib['href']
+                    for item in package.iter('%sitem' % EPUB_PACKAGE)}
+        base = posixpath.dirname(package_path)
+        return [posixpath.normpath(posixpath.join(base, unquote(manifest[reference.attrib['idref']])))
+                for reference in package.iter('%sitemref' % EPUB_PACKAGE)]
 
+    def _split_epub(self) -> Iterator[Tuple[int, Chapter]]:
+        """Yield the index and chapter of every chapter in the epub, stopping at the first it lacks
+
+        The epub is only fetched once the first chapter is asked for. The
+        documents are parsed one at a time, skipping those without the heading
+        of the next chapter (title page, contents)."""
+        from bs4 import BeautifulSoup
+        from io import BytesIO
+        from xml.etree import ElementTree
+        import zipfile
+
+        self._pause(self._chapter_sleep_time)
+        self.log_debug("Downloading the epub")
+        try:
+            with self._metrics.phase('network'):
+                response = self._fetcher.get(urljoin(self._url, self._epub_link), deadline=self._deadline,
+                                             metrics=self._metrics)
+        except Exception as error:
+            self.log_info("Epub download failed (%s), downloading the chapters one by one" % error)
+            return
+        try:
+            archive = zipfile.ZipFile(BytesIO(response.content))
+            documents = self._epub_documents(archive)
+        except (zipfile.BadZipFile, KeyError, AttributeError, ElementTree.ParseError):
+            self.log_info("No readable epub, downloading the chapters one by one")
+            return
+
+        position = 0
+        for index, entry in enumerate(self.chapter_list):
+            name = entry['name'].strip()
+            heading = None
+            while heading is None and position < len(documents):
+                with self._metrics.phase('parse'):
+                    soup = BeautifulSoup(archive.read(documents[position]), features="html.parser")
+                position += 1
+                heading = soup.find(lambda tag: tag.name in ['h1', 'h2', 'h3', 'h4'] and tag.text.strip() == name)
+            if heading is None:
+                self.log_info("Epub has no chapter %s, downloading the remaining chapters one by one" % name)
+                return
+
+            # the heading repeats the chapter name, the chapter pages do not count it
+            heading.decompose()
+            story = soup.find('body') or soup
             chapter_object = Chapter()
-            chapter_object.processed_body = story.prettify()
-            chapter_object.raw_body = self._soup.prettify()
+            chapter_object.processed_body = self._prettify(story)
+            chapter_object.raw_body = self._prettify(soup)
             chapter_object.word_count = len(story.text.split())
-            chapter_object.name = chapter['name']
-            self._fanfic.add_chapter(chapter_object)
+            chapter_object.name = entry['name']
+            yield index, chapter_object
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        """Download and extract a single chapter"""
+        self._pause(self._chapter_sleep_time)
+        self.log_debug("Downloading chapter:" + chapter['name'])
+        url_fixed = urlunparse(self._url_obj._replace(path=chapter['link'], query='bypass=1'))
+
+        # get page
+        self._update_soup(url=url_fixed)
+        story = self._soup.find_all(True, {'class': 'story'})[0]
+
+        # remove the pager elements at the top and bottom
+        for element in story.find_all(True, {'class': 'pager'}):
+            element.decompose()
+        # remove the 'well' block at the top
+        for element in story.find_all(True, {'class': 'well'}):
+            element.decompose()
+
+        chapter_object = Chapter()
+        chapter_object.processed_body = self._prettify(story)
+        chapter_object.raw_body = self._prettify(self._soup)
+        chapter_object.word_count = len(story.text.split())
+        chapter_object.name = chapter['name']
+        return chapter_object
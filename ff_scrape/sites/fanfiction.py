@@ -2,67 +2,89 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
-from urllib.parse import urljoin
+from urllib.parse import urljoin, SplitResult
 from datetime import datetime
+from html import unescape
+from typing import List, Optional, Tuple
 import re
-import time
+
+# the chapter list, its options are never closed so parsers other than html5lib nest them
+CHAPTER_SELECT = re.compile(r'<select\b[^>]*\bid=["\']?chap_select\b[^>]*>(.*?)</select>', re.IGNORECASE | re.DOTALL)
+CHAPTER_OPTION = re.compile(r'<option\b([^>]*)>([^<]*)', re.IGNORECASE)
+OPTION_VALUE = re.compile(r'\bvalue\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
+
+def chapter_options(text: str) -> List[dict]:
+    """Read the name and link of every chapter from the first chapter list of the page
+
+    An empty list when the page has no chapter list, as one shots do."""
+    select = CHAPTER_SELECT.search(text)
+    if select is None:
+        return []
+    chapters = []
+    for attributes, name in CHAPTER_OPTION.findall(select.group(1)):
+        value = OPTION_VALUE.search(attributes)
+        if value is None:
+            continue
+        chapters.append({'name': unescape(name), 'link': unescape(next(group for group in value.groups()
+                                                                        if group is not None))})
+    return chapters
 
 
 class Fanfiction(Site):
-    """Provides the logic to parse fanfics from fanfiction.net"""
+    """Provides the logic to parse fanfics from fanfiction.net
+
+    With the mobile site parameter the chapters are downloaded from the much
+    lighter mobile site, the metadata still comes from the desktop page. The
+    first chapter is checked against the text on that desktop page, when they
+    differ every chapter comes from the desktop site."""
+    hostnames = ('fanfiction.net',)
+    missing_patterns = (re.compile(rb'class=["\']?panel_warning\b'),)
+    _first_chapter_words: Optional[List[str]]
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.Fanfiction',
                          site_params=site_params)
         self.chapter_list = []
+        self._chapter_options = None
+        self._use_mobile = str(site_params.get('mobile', 'False')).upper() == 'TRUE'
+        self._mobile = self._use_mobile
+        self._first_chapter_words = None
 
     def set_domain(self) -> None:
         """Sets the domain of the fanfic to Fanfiction.net"""
         self._fanfic.domain = "Fanfiction.net"
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         if 'fanfiction.net/' in url:
             return True
         return False
 
     def cleanup_custom_vars(self):
         self.chapter_list = []
-
-    def correct_url(self, url: str) -> str:
-        """Perform the necessary steps to correct the supplied _url so the parser can work with it"""
-        # check if _url has "https://" or "http://" prefix
-        if "http://" not in url:
-            if "https://" not in url:
-                url = "http://%s" % url
-        _url_split = url.split("/")
-        if len(_url_split) < 5:
+        self._chapter_options = None
+        self._mobile = self._use_mobile
+        self._first_chapter_words = None
+
+    def _parse(self, text: str, lenient: bool = True):
+        if not lenient:
+            # the chapter list is read from the markup, so html.parser can take the rest of the page
+            self._chapter_options = chapter_options(text)
+        return super()._parse(text, lenient)
+
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Maps www, mobile, http and chapter URLs to the https URL of the first chapter"""
+        # path is /s/<story id>/<chapter>/<title>
+        path = parts.path.split('/')
+        if len(path) < 3:
             raise URLError('Unknown URL format')
-        # correct for https
-        if _url_split[0] == 'http:':
-            _url_split[0] = "https:"
-        # correct for mobile _url
-        if _url_split[2] == "m.fanfiction.net":
-            _url_split[2] = "www.fanfiction.net"
-        # correct _url as needed for script
-        if _url_split[4] == '':
+        if path[2] == '':
             raise URLError('No Story ID given')
-        # adds chapter id is 1 and trailing /
-        if len(_url_split) == 5:
-            _url_split.append('1')
-            _url_split.append('')
-        # sets chapter id to 1 and trailing /
-        elif len(_url_split) == 6:
-            _url_split[5] = '1'
-            _url_split.append('')
-        # sets chapter id to 1 and removes chapter title
-        elif len(_url_split) == 7:
-            _url_split[5] = '1'
-            _url_split[6] = ''
-        else:
+        if len(path) > 5 or path[1] != 's' or not path[2].isdigit():
             raise URLError('Unknown URL format')
-        url = '/'.join(_url_split)
-        tmp = urljoin(url, ' ')[0:-2]
-        return tmp
+        return path[2], "https://www.fanfiction.net/s/%s/1" % path[2]
 
     def check_story_exists(self) -> bool:
         """Verify that the fanfic exists"""
@@ -71,6 +93,19 @@ class Fanfiction(Site):
             return False
         return True
 
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the timestamps and chapter count from the story header without parsing the page"""
+        header_start = text.find('profile_top')
+        if header_start == -1:
+            return None, None
+        header_end = text.find('</span></div>', header_start)
+        header = text[header_start:header_end if header_end != -1 else len(text)]
+        times = [int(value) for value in re.findall(r"data-xutime='(\d+)'", header)[0:2]]
+        updated = datetime.fromtimestamp(max(times)) if len(times) > 0 else None
+        # one shots have no chapter count in the header
+        chapters = re.search(r'Chapters: (\d+)', header)
+        return updated, int(chapters.group(1)) if chapters is not None else 1
+
     def record_story_metadata(self) -> None:
         """Record the metadata of the fanfic"""
 
@@ -82,7 +117,7 @@ class Fanfiction(Site):
             self._fanfic.add_universe(universe)
 
         top_profile = self._soup.find(id="profile_top")
-        self._fanfic.raw_index_page = self._soup.prettify()
+        self._fanfic.raw_index_page = self._prettify(self._soup)
 
         # record title and author
         self._fanfic.title = top_profile.b.string
@@ -138,10 +173,18 @@ class Fanfiction(Site):
             person = standardize_character(person)
             if person is not None:
                 self._fanfic.add_character(standardize_character(person))
-        chap_select = self._soup.find(id='chap_select')
-        if chap_select is not None:
-            for entry in chap_select.contents:
-                self.chapter_list.append({'name': entry.text, 'link': entry.attrs['value']})
+        if self._mobile:
+            # the first chapter is on this page, the mobile one is checked against it
+            self._first_chapter_words = self._words(self._soup.find(id='storytextp'))
+
+        chapters = self._chapter_options
+        if chapters is None:
+            # a soup parsed elsewhere, read the options from its chapter list however it got nested
+            chap_select = self._soup.find(id='chap_select')
+            chapters = chapter_options(str(chap_select)) if chap_select is not None else []
+        self._chapter_options = None
+        if len(chapters) > 0:
+            self.chapter_list.extend(chapters)
         else:
             self.chapter_list.append({'name': self._fanfic.title, 'link': '1'})
 
@@ -149,18 +192,48 @@ class Fanfiction(Site):
         """Record the chapters of the fanfic"""
         # get the chapters
         for chapter in self.chapter_list:
-            time.sleep(self._chapter_sleep_time)
-            chapter_object = Chapter()
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def mobile_url(self, link: str) -> str:
+        return self._url[0:-1].replace('://www.', '://m.', 1) + link
+
+    @staticmethod
+    def _words(story_tag) -> Optional[List[str]]:
+        if story_tag is None:
+            return None
+        return [word for content in story_tag.find_all(['p', 'hr']) for word in content.text.split()]
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        """Download and extract a single chapter"""
+        self._pause(self._chapter_sleep_time)
+        story_tag = None
+        if self._mobile:
+            self.log_debug("Downloading mobile chapter: " + chapter['link'])
+            self._update_soup(url=self.mobile_url(chapter['link']))
+            story_tag = self._soup.find(id="storycontent")
+            if chapter['link'] == '1' and self._first_chapter_words is not None:
+                # only the first chapter can be compared with the desktop site
+                if self._words(story_tag) != self._first_chapter_words:
+                    story_tag = None
+                self._first_chapter_words = None
+            if story_tag is None:
+                self.log_warn("Mobile chapter differs from the desktop site, using the desktop site")
+                self._metrics.count('mobile_fallbacks')
+                self._mobile = False
+                # the desktop page is one more request
+                self._pause(self._chapter_sleep_time)
+        if story_tag is None:
             self.log_debug("Downloading chapter: " + chapter['link'])
             self._update_soup(url=self._url[0:-1]+chapter['link'])
-            chapter_text = ""
-            chapter_count = 0
             story_tag = self._soup.find(id="storytextp")
-            for content in story_tag.find_all(['p', 'hr']):
-                chapter_text += content.prettify()
-                chapter_count += len(content.text.split())
-            chapter_object.processed_body = chapter_text
-            chapter_object.raw_body = self._soup.prettify()
-            chapter_object.word_count = chapter_count
-            chapter_object.name = chapter['name']
-            self._fanfic.add_chapter(chapter_object)
+        chapter_object = Chapter()
+        chapter_text = ""
+        chapter_count = 0
+        for content in story_tag.find_all(['p', 'hr']):
+            chapter_text += self._prettify(content)
+            chapter_count += len(content.text.split())
+        chapter_object.processed_body = chapter_text
+        chapter_object.raw_body = self._prettify(self._soup)
+        chapter_object.word_count = chapter_count
+        chapter_object.name = chapter['name']
+        return chapter_object
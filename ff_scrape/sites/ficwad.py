@@ -4,26 +4,34 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError, StoryError, ParameterError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
-from urllib.parse import urljoin, urlparse
-import requests
+from urllib.parse import urljoin, urlparse, SplitResult
 import re
-import time
-from dateutil.parser import parse
-from requests.cookies import RequestsCookieJar
+from datetime import datetime
+from typing import Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from requests.cookies import RequestsCookieJar
 
 
 class Ficwad(Site):
     """Provides the logic to parse fanfics from ficwad.com"""
+    hostnames = ('ficwad.com',)
+    # no recorded pages prove html.parser reads the index like html5lib does
+    index_parser = 'html5lib'
+    # missing stories redirect to the front page
+    missing_patterns = (re.compile(rb'<title>FicWad: fresh-picked original and fan fiction</title>'),)
     _index_page: str
     _web_domain: str
-    cookie_jar: RequestsCookieJar
+    cookie_jar: 'RequestsCookieJar'
     chapter_list: [dict]
+    _parsed: dict
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.Ficwad',
                          site_params=site_params)
         self.chapter_list = []
         self._index_page = None
+        self._parsed = {}
         self._web_domain = "http://ficwad.com"
         self.cookie_jar = None
         if 'login' in site_params and site_params['login'].upper() == 'TRUE':
@@ -33,38 +41,35 @@ class Ficwad(Site):
                 raise ParameterError("No credentials provided")
 
     def login(self, user: str, password: str) -> None:
+        import requests
+
         login = requests.post('https://ficwad.com/account/login', files=(
             ('username', (None, user)),
             ('password', (None, password))
-        ))
+        ), timeout=self._fetcher.timeout)
         self.cookie_jar = login.cookies
 
     def set_domain(self) -> None:
         """Sets the domain of the fanfic to Fanfiction.net"""
         self._fanfic.domain = "Ficwad.com"
 
-    def can_handle(self, url: str) -> bool:
+    @classmethod
+    def can_handle(cls, url: str) -> bool:
         if 'ficwad.com/' in url:
             return True
         return False
 
-    def correct_url(self, url: str) -> str:
-        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
-        # check if url has "http://" prefix
-        if "http://" not in url:
-            if "https://" not in url:
-                url = "http://" + url
-        url_split = url.split("/")
-        # correct URL as needed for script
-        if url_split[4] == '':
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Maps story URLs to their plain /story/<id> form"""
+        path = parts.path.split('/')
+        if len(path) < 3 or path[2] == '':
             raise URLError('No Story ID given')
-        if len(url_split) == 5:
-            url_split.append('')
-        else:
+        if len(path) > 4 or (len(path) == 4 and path[3] != ''):
             raise URLError('Unknown URL format')
-        url = '/'.join(url_split)
-        url = urljoin(url, ' ')[0:-2]
-        return url
+        if path[1] != 'story' or not path[2].isdigit():
+            raise URLError('Unknown URL format')
+        return path[2], "http://ficwad.com/story/%s" % path[2]
 
     def check_story_exists(self) -> bool:
         """Verify that the fanfic exists"""
@@ -73,9 +78,31 @@ class Ficwad(Site):
             return False
         return True
 
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the dates and chapter count from the first meta block without parsing the page"""
+        from dateutil.parser import parse
+
+        meta_start = text.find('class="meta"')
+        if meta_start == -1:
+            return None, None
+        meta = text[meta_start:text.find('</p>', meta_start)]
+        dates = [parse(value) for value in re.findall(r'<span title="([^"]+)"', meta)]
+        chapters = re.search(r'Chapters:\s*(\d+)', meta)
+        return max(dates) if len(dates) > 0 else None, int(chapters.group(1)) if chapters is not None else None
+
     def cleanup_custom_vars(self) -> None:
         self.chapter_list = []
         self._index_page = None
+        self._parsed = {}
+
+    def _visit(self, url: str) -> None:
+        """Make the page the current soup, only fetching it if it was not parsed before"""
+        url = urljoin(self._web_domain, url)
+        if url in self._parsed:
+            self._soup = self._parsed[url]
+        else:
+            self._update_soup(url=url)
+            self._parsed[url] = self._soup
 
     def _get_story_chapter_list_non_index(self) -> None:
         chap_list_select = self._soup.find_all(True, {'name': 'chapterlist'})
@@ -96,24 +123,28 @@ class Ficwad(Site):
                     self.chapter_list.append({'name': page.text, 'link': page['value']})
 
     def get_story_chapter_list(self) -> None:
-        """Create a list of the chapters in the fanfic"""
-        # check if it is the story index page
+        """Create a list of the chapters in the fanfic
+
+        Visits at most one chapter page besides the story URL, every page is
+        kept so the metadata and chapters do not fetch it again."""
+        self._parsed[urljoin(self._web_domain, urlparse(self._url).path)] = self._soup
+        # the index page lists the chapters inside the story text, a chapter page has its text there
         story_text = self._soup.find(id='storytext')
-        if story_text is not None:
+        story_container = story_text.find('ul', {'class': 'storylist'}) if story_text is not None else None
+        if story_container is not None:
             # we are in a index list, we need to see if we can access the story
-            self._index_page = self._url
+            self._index_page = urlparse(self._url).path
 
-            story_container = self._soup.find_all('ul', {'class': 'storylist'})[0]
             chapter_blocks = story_container.find_all('li')
             for block in chapter_blocks:
-                if 'blocked' not in block.attrs['class']:
-                    # we found an open chapter
+                if 'blocked' not in block.attrs.get('class', []):
+                    # we found an open chapter, its chapter list covers the whole story
                     links = block.find_all('a')
-                    open_url = self._web_domain + links[0]['href']
-                    self._update_soup(url=open_url)
+                    self._visit(links[0]['href'])
 
                     # now run the get story chapters method on the open page
                     self._get_story_chapter_list_non_index()
+                    break
             else:
                 raise StoryError('Story is age blocked, can not locate an unblocked chapter.')
         else:
@@ -122,14 +153,14 @@ class Ficwad(Site):
 
     def record_story_metadata(self) -> None:
         """Record the metadata of the fanfic"""
+        from dateutil.parser import parse
 
         # need to find an entry point first
         self.get_story_chapter_list()
 
         # jump to the index page
-        index_url = self._web_domain + self._index_page
-        self._update_soup(url=index_url)
-        self._fanfic.raw_index_page = self._soup.prettify()
+        self._visit(self._index_page)
+        self._fanfic.raw_index_page = self._prettify(self._soup)
 
         # add author and title
         author_container = self._soup.find_all('span', {'class': 'author'})[0]
@@ -202,21 +233,32 @@ class Ficwad(Site):
         self._fanfic.published = parse(timestamps[0].attrs['title'])
         self._fanfic.updated = parse(timestamps[1].attrs['title'])
 
+        # only the chapter pages are still needed
+        chapter_urls = [urljoin(self._web_domain, chapter['link']) for chapter in self.chapter_list]
+        self._parsed = {url: soup for url, soup in self._parsed.items() if url in chapter_urls}
+
     def record_story_chapters(self) -> None:
         """Record the chapters of the fanfic"""
         # get the chapters
         for chapter in self.chapter_list:
-            time.sleep(self._chapter_sleep_time)
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        """Download and extract a single chapter"""
+        url_fixed = urljoin(self.url, chapter['link'])
+        soup = self._parsed.pop(url_fixed, None)
+        if soup is not None:
+            # the page was visited while looking for the chapter list
+            self._soup = soup
+        else:
+            self._pause(self._chapter_sleep_time)
             self.log_debug("Downloading chapter:" + chapter['name'])
-            url_fixed = urljoin(self.url, chapter['link'])
-
-            # get page
             self._update_soup(url=url_fixed)
-            story = self._soup.find(id='storytext')
-
-            chapter_object = Chapter()
-            chapter_object.processed_body = story.prettify()
-            chapter_object.raw_body = self._soup.prettify()
-            chapter_object.word_count = len(story.text.split())
-            chapter_object.name = chapter['name']
-            self._fanfic.add_chapter(chapter_object)
+        story = self._soup.find(id='storytext')
+
+        chapter_object = Chapter()
+        chapter_object.processed_body = self._prettify(story)
+        chapter_object.raw_body = self._prettify(self._soup)
+        chapter_object.word_count = len(story.text.split())
+        chapter_object.name = chapter['name']
+        return chapter_object
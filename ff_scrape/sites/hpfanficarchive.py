@@ -4,57 +4,54 @@ from ff_scrape.storybase import Chapter
 from ff_scrape.errors import URLError
 from ff_scrape.sites.base import Site
 from ff_scrape.standardization import *
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit, parse_qs, SplitResult
+from typing import Iterator, Optional, Tuple
 from datetime import datetime
 import re
-import time
 
 class HPFanficArchive(Site):
-    """Provides the logic to parse fanfics from hpfanficarchive.com"""
+    """Provides the logic to parse fanfics from hpfanficarchive.com
+
+    The chapters are taken from the printable view of the whole story, so a
+    story takes two requests. When that view does not line up with the
+    chapter list, or the printable site parameter is false, every chapter is
+    downloaded on its own, from the first chapter that does not line up on."""
+    hostnames = ('hpfanficarchive.com',)
+    missing_patterns = (re.compile(rb'class=["\']?errortext\b'),)
+    _printable_link: Optional[str]
+    _printable_chapters: Optional[Iterator[Tuple[int, Chapter]]]
 
     def __init__(self, site_params={}):
         super().__init__(logger_name='ff_scrape.site.HPFanficArchive',
                          site_params=site_params)
         self.chapter_list = []
+        self._use_printable = str(site_params.get('printable', 'True')).upper() == 'TRUE'
+        self._printable_link = None
+        self._printable_chapters = None
 
     def set_domain(self):
         """Sets the domain of the fanfic to Fanfiction.net"""
         self._fanfic.domain = "HP Fanfic Archive"
 
-    def can_handle(self, url: str):
+    @classmethod
+    def can_handle(cls, url: str):
         if 'hpfanficarchive.com/' in url:
             return True
         return False
 
-    def correct_url(self, url: str):
-        """Perform the necessary steps to correct the supplied URL so the parser can work with it"""
-        # check if url has "http://" prefix
-        # check if url has "http://" prefix
-        if "http://" not in url:
-            if "https://" not in url:
-                url = "http://" + url
-        url_split = url.split("/")
-        # correct URL as needed for script
-        if len(url_split) == 5:
-            if url_split[4] == '':
-                raise URLError('Unknown URL format')
-            else:
-                # extract the story id for easy access to the index page
-                story_split = url_split[4].split('?')
-                if len(story_split) == 2:
-                    story_data_split = story_split[1].replace('&', '=').split('=')
-                    if len(story_data_split) < 2:
-                        raise URLError('No Story ID given')
-                    sid = story_data_split[1]
-                else:
-                    raise URLError('Unknown URL format')
-        else:
+    @classmethod
+    def canonicalize(cls, parts: SplitResult) -> Tuple[str, str]:
+        """Maps chapter URLs to the index page of the story"""
+        # path is /stories/viewstory.php?sid=<story id>
+        path = parts.path.split('/')
+        if len(path) != 3 or path[1] != 'stories' or path[2] != 'viewstory.php' or parts.query == '':
             raise URLError('Unknown URL format')
-        url_fixed = '/'.join(url_split)
-
-        # prep url so it is easy to go to the index page
-        url = urljoin(url_fixed, 'viewstory.php?sid=' + str(sid))
-        return url
+        sid = parse_qs(parts.query).get('sid', [''])[0]
+        if sid == '':
+            raise URLError('No Story ID given')
+        if not sid.isdigit():
+            raise URLError('Unknown URL format')
+        return sid, "http://www.hpfanficarchive.com/stories/viewstory.php?sid=%s" % sid
 
     def check_story_exists(self):
         """Verify that the fanfic exists"""
@@ -64,13 +61,24 @@ class HPFanficArchive(Site):
             return False
         return True
 
+    def extract_probe_fields(self, text: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """Read the eFiction update marker and chapter count without parsing the page"""
+        updated = re.search(r'<!-- UPDATED START -->([^<]+)<!-- UPDATED END -->', text)
+        if updated is None:
+            return None, None
+        chapters = re.search(r'Chapters: </span>\s*(\d+)', text)
+        return (datetime.strptime(updated.group(1).strip(), "%B %d, %Y"),
+                int(chapters.group(1)) if chapters is not None else None)
+
     def cleanup_custom_vars(self):
         self.chapter_list = []
+        self._printable_link = None
+        self._printable_chapters = None
 
     def record_story_metadata(self):
         """Record the metadata of the fanfic"""
         content_containers = self._soup.find_all(True, {'class': 'content'})
-        self._fanfic.raw_index_page = self._soup.prettify()
+        self._fanfic.raw_index_page = self._prettify(self._soup)
         # should be length 5
         # 0 => story tags
         # 1 => parent wrapper of story info
@@ -84,6 +92,11 @@ class HPFanficArchive(Site):
             if chapter_regex.match(link.attrs['href']):
                 self.chapter_list.append({'name': link.text, 'link': link.attrs['href']})
 
+        # eFiction links the printable view of all chapters from the index
+        printable = self._soup.find('a', href=re.compile("action=printable.*chapter=all"))
+        if printable is not None:
+            self._printable_link = printable.attrs['href']
+
         # extract metadata
         summary_text = ""
         parsed_key = ""
@@ -138,21 +151,76 @@ class HPFanficArchive(Site):
         # set universe to hard coded value due to this being a HP only site
         self._fanfic.add_universe("Harry Potter")
 
+    def printable_url(self) -> str:
+        """The printable view of every chapter of the story"""
+        if self._printable_link is not None:
+            return urljoin(self._url, self._printable_link)
+        sid = parse_qs(urlsplit(self._url).query)['sid'][0]
+        return urljoin(self._url, "viewstory.php?action=printable&textsize=0&sid=%s&chapter=all" % sid)
+
     def record_story_chapters(self):
         """Record the chapters of the fanfic"""
         # get the chapters
-        for chapter in self.chapter_list:
-            time.sleep(self._chapter_sleep_time)
-            self.log_debug("Downloading chapter:" + chapter['name'])
-            url_fixed = urljoin(self.url, chapter['link'])
-
-            # get page
-            self._update_soup(url=url_fixed)
-            story = self._soup.find(id='story')
+        for index, chapter in enumerate(self.chapter_list):
+            self._add_chapter(chapter, lambda: self._whole_story_chapter(index, chapter))
+
+    def _whole_story_chapter(self, index: int, chapter: dict) -> Chapter:
+        """Take the chapter from the printable view, which is only fetched once a chapter is not checkpointed"""
+        if self._use_printable and self._printable_chapters is None:
+            self._printable_chapters = self._split_printable()
+        if self._printable_chapters is not None:
+            # checkpointed chapters are skipped, the printable view is read up to the requested one
+            for position, chapter_object in self._printable_chapters:
+                if position == index:
+                    return chapter_object
+        return self._download_chapter(chapter)
+
+    def _split_printable(self) -> Iterator[Tuple[int, Chapter]]:
+        """Yield the index and chapter of every chapter in the printable view, stopping at the first mismatch
+
+        The printable view is only fetched once the first chapter is asked for."""
+        self._pause(self._chapter_sleep_time)
+        self.log_debug("Downloading the printable view")
+        self._update_soup(url=self.printable_url())
+
+        titles = self._soup.find_all('div', {'class': 'chaptertitle'})
+        if len(titles) != len(self.chapter_list):
+            self.log_info("Printable view has %d of %d chapters, downloading them one by one"
+                          % (len(titles), len(self.chapter_list)))
+            return
+        for index, (title, entry) in enumerate(zip(titles, self.chapter_list)):
+            story = None
+            for sibling in title.find_next_siblings():
+                if 'chaptertitle' in sibling.attrs.get('class', []):
+                    break
+                if sibling.attrs.get('id') == 'story' or 'chapter' in sibling.attrs.get('class', []):
+                    story = sibling
+                    break
+            if story is None or entry['name'].strip() not in title.text:
+                self.log_info("Printable view does not match chapter %s, downloading the remaining chapters one by one"
+                              % entry['name'])
+                return
 
             chapter_object = Chapter()
-            chapter_object.processed_body = story.prettify()
-            chapter_object.raw_body = self._soup.prettify()
+            chapter_object.processed_body = self._prettify(story)
+            chapter_object.raw_body = self._prettify(title) + self._prettify(story)
             chapter_object.word_count = len(story.text.split())
-            chapter_object.name = chapter['name']
-            self._fanfic.add_chapter(chapter_object)
+            chapter_object.name = entry['name']
+            yield index, chapter_object
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        """Download and extract a single chapter"""
+        self._pause(self._chapter_sleep_time)
+        self.log_debug("Downloading chapter:" + chapter['name'])
+        url_fixed = urljoin(self.url, chapter['link'])
+
+        # get page
+        self._update_soup(url=url_fixed)
+        story = self._soup.find(id='story')
+
+        chapter_object = Chapter()
+        chapter_object.processed_body = self._prettify(story)
+        chapter_object.raw_body = self._prettify(self._soup)
+        chapter_object.word_count = len(story.text.split())
+        chapter_object.name = chapter['name']
+        return chapter_object
@@ -1,5 +1,6 @@
+from ff_scrape.metrics import StoryMetrics
 from datetime import datetime
-from typing import List
+from typing import List, Callable
 
 class Chapter(object):
     __word_count: int
@@ -80,6 +81,9 @@ class Story(object):
     _warnings: List[str]
     _characters: List[str]
     _raw_index_page: str
+    _chapter_listeners: List[Callable[[Chapter], None]]
+    _scrape_status: str
+    _metrics: StoryMetrics
 
     def __init__(self, url, **kwargs):
         self._url = url
@@ -101,6 +105,9 @@ class Story(object):
         self._warnings = []
         self._characters = []
         self._authors = []
+        self._chapter_listeners = []
+        self._scrape_status = 'pending'
+        self._metrics = StoryMetrics()
 
     def __repr__(self):
         return '%s(url:%s)' % (self.__class__.__name__,
@@ -144,6 +151,22 @@ class Story(object):
     @status.setter
     def status(self, status: str): self._status = status
 
+    @property
+    def scrape_status(self) -> str:
+        """How far the scrape got: pending, complete, partial (stopped by a deadline) or cancelled"""
+        return self._scrape_status
+
+    @scrape_status.setter
+    def scrape_status(self, status: str): self._scrape_status = status
+
+    @property
+    def metrics(self) -> StoryMetrics:
+        """Timings, counts and byte sizes collected while the story was scraped"""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics: StoryMetrics): self._metrics = metrics
+
     @property
     def universe(self) -> List[str]: return self._universe
 
@@ -196,7 +219,17 @@ class Story(object):
     @property
     def chapters(self) -> List[Chapter]: return self._chapters
 
-    def add_chapter(self, chapter) -> None: self._chapters.append(chapter)
+    def add_chapter(self, chapter) -> None:
+        self._chapters.append(chapter)
+        for listener in self._chapter_listeners:
+            listener(chapter)
+
+    def add_chapter_listener(self, listener: Callable[[Chapter], None]) -> None:
+        """Registers a callable that receives every chapter as soon as it is added"""
+        self._chapter_listeners.append(listener)
+
+    def remove_chapter_listener(self, listener: Callable[[Chapter], None]) -> None:
+        self._chapter_listeners.remove(listener)
 
     @property
     def chapter_count(self) -> int: return len(self._chapters)
@@ -0,0 +1 @@
+"""Offline stand-ins for the supported sites, for tests and benchmarks"""
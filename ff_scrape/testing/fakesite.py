@@ -0,0 +1,348 @@
+"""A local HTTP server standing in for the supported sites under stress
+
+The server answers with the pages of synthetic stories and of the HTML
+fixtures, at the URLs the site plugins fetch. A request for
+``https://www.fanfiction.net/s/1/1`` is sent to
+``http://127.0.0.1:<port>/www.fanfiction.net/s/1/1`` by the FakeSiteTransport,
+or to ``/s/1/1`` with the site's hostname in the Host header. Faults make it
+behave like a site under load: a latency drawn for every request, 429 answers
+once a host gets more requests per second than allowed, random 503 answers,
+bodies cut off halfway and connections reset before any answer.
+
+    with FakeSiteServer(faults=Faults(latency=lognormal(0.05, 0.5), unavailable=0.05)) as server:
+        server.add_story(synthetic_story('fanfiction', chapters=50))
+        fetcher.transport = FakeSiteTransport(server)
+
+Unlike the synthetic session every request goes over a real socket and takes
+real time, so the fetcher applies its domain limits, pauses and retries as it
+does against the sites themselves. ``python -m ff_scrape.testing.fakesite``
+runs the server on its own."""
+from ff_scrape.testing.synthetic import STORIES, SyntheticStory, synthetic_story
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import argparse
+import math
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+# site fixture directory: (story URL the fixture is served at, prefix of the URLs also answered with it)
+FIXTURE_URLS = {
+    'fanfiction': ('https://www.fanfiction.net/s/%d/1', 'https://www.fanfiction.net/s/%d'),
+    'archiveofourown': ('https://archiveofourown.org/works/%d?view_full_work=true', 'https://archiveofourown.org/works/%d'),
+    'ficwad': ('https://ficwad.com/story/%d', 'https://ficwad.com/story/%d'),
+    'fanficauthors': ('https://fixture%d.fanficauthors.net/Story/index', 'https://fixture%d.fanficauthors.net'),
+    'hpfanficarchive': ('http://www.hpfanficarchive.com/stories/viewstory.php?sid=%d',
+                        'http://www.hpfanficarchive.com/stories/viewstory.php?sid=%d'),
+    'animationsource': ('https://www.animationsource.org/balto/en/view_fanfic/Fixture/%d.html',
+                        'https://www.animationsource.org/balto/en/view_fanfic/Fixture/%d.html'),
+}
+# fixture stories get ids from here on so they never collide with synthetic ones
+FIXTURE_IDS = 900000
+
+Latency = Callable[[random.Random], float]
+
+
+def constant(seconds: float) -> Latency:
+    return lambda generator: seconds
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda generator: generator.uniform(low, high)
+
+
+def exponential(mean: float) -> Latency:
+    return lambda generator: generator.expovariate(1.0 / mean)
+
+
+def lognormal(median: float, sigma: float) -> Latency:
+    """Mostly close to ``median`` with a long tail of slow requests, like most real sites"""
+    return lambda generator: generator.lognormvariate(math.log(median), sigma)
+
+
+LATENCIES = {'constant': constant, 'uniform': uniform, 'exponential': exponential, 'lognormal': lognormal}
+
+
+def latency(spec: str) -> Latency:
+    """Parses a latency distribution such as ``constant:0.1`` or ``lognormal:0.05,0.5``"""
+    name, _, arguments = spec.partition(':')
+    if name not in LATENCIES:
+        raise ValueError('Unknown latency distribution: %s' % name)
+    return LATENCIES[name](*(float(argument) for argument in arguments.split(',') if argument != ''))
+
+
+class Faults(object):
+    """How a fake site misbehaves
+
+    ``latency`` draws the seconds every request waits before its answer,
+    ``rate_limit`` is the number of requests per second a host answers before
+    it replies 429, ``unavailable`` the share of requests answered with 503,
+    both telling the client to come back after ``retry_after`` seconds.
+    ``truncate`` is the share of bodies cut off halfway and ``reset`` the share
+    of connections reset instead of answered. ``seed`` makes the faults repeatable."""
+
+    def __init__(self, latency: Latency = None, rate_limit: float = None, unavailable: float = 0.0,
+                 retry_after: float = 1.0, truncate: float = 0.0, reset: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.unavailable = unavailable
+        self.retry_after = retry_after
+        self.truncate = truncate
+        self.reset = reset
+        self.seed = seed
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so the connection pooling of the client matters as it does for real sites
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        self.server.answer(self)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class FakeSiteServer(ThreadingHTTPServer):
+    """Serves synthetic stories and fixtures with the configured faults, on a free port by default
+
+    ``stats`` counts the requests and how each was answered."""
+    daemon_threads = True
+
+    def __init__(self, stories: List[SyntheticStory] = (), faults: Faults = None, host: str = '127.0.0.1',
+                 port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.faults = faults if faults is not None else Faults()
+        self._stories: List[SyntheticStory] = list(stories)
+        self._pages: Dict[str, Tuple[str, bool]] = {}
+        self._random = random.Random(self.faults.seed)
+        self._next_allowed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[0:2]
+        return 'http://%s:%d' % (host, port)
+
+    def local_url(self, url: str) -> str:
+        """The URL of the server answering for a URL of a site"""
+        parts = urlsplit(url)
+        local = '%s/%s%s' % (self.url, parts.hostname, parts.path or '/')
+        if parts.query != '':
+            local += '?' + parts.query
+        return local
+
+    def add_story(self, story: SyntheticStory) -> None:
+        self._stories.append(story)
+
+    def add_page(self, url: str, text: str, prefix: bool = False) -> None:
+        """Serves the page at the URL, with ``prefix`` also at every URL below it"""
+        self._pages[SyntheticStory._key(url)] = (text, prefix)
+
+    def add_fixtures(self, directory: str) -> List[Tuple[str, str]]:
+        """Serves the story fixtures of the site tests in ``directory``, returning their (site, URL)
+
+        A fixture answers every request for its story, chapter pages included."""
+        served = []
+        story_id = FIXTURE_IDS
+        for site in sorted(FIXTURE_URLS):
+            url, prefix = FIXTURE_URLS[site]
+            for file_path in sorted(glob(path.join(directory, site, 'data', 'good_story*.html'))):
+                story_id += 1
+                with open(file_path, 'r', encoding='utf-8') as page:
+                    text = page.read()
+                self.add_page(prefix % story_id, text, prefix=True)
+                self.add_page(url % story_id, text)
+                served.append((site, url % story_id))
+        return served
+
+    def page(self, url: str) -> Optional[Union[str, bytes]]:
+        """The page served for a URL of a site, None if there is none"""
+        for story in self._stories:
+            text = story.page(url)
+            if text is not None:
+                return text
+        key = SyntheticStory._key(url)
+        if key in self._pages:
+            return self._pages[key][0]
+        for page_key, (text, prefix) in self._pages.items():
+            if prefix and key.startswith(page_key) and key[len(page_key)] in '/?&':
+                return text
+        return None
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def _draw(self, share: float) -> bool:
+        if share <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < share
+
+    def _throttled(self, host: str) -> float:
+        """Seconds until the host answers again, 0 when this request is within the rate limit"""
+        if self.faults.rate_limit is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            allowed = self._next_allowed.get(host, 0.0)
+            if now < allowed:
+                return allowed - now
+            self._next_allowed[host] = now + 1.0 / self.faults.rate_limit
+            return 0.0
+
+    def _site_url(self, handler: BaseHTTPRequestHandler) -> str:
+        first = handler.path.lstrip('/').split('/')[0].split('?')[0]
+        if '.' in first and not first.endswith(('.php', '.html')):
+            # the hostname is the first part of the path
+            return 'http://' + handler.path.lstrip('/')
+        return 'http://' + (handler.headers.get('Host') or '') + handler.path
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes, headers: Dict[str, str] = None,
+              length: int = None) -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body) if length is None else length))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def answer(self, handler: BaseHTTPRequestHandler) -> None:
+        self._count('requests')
+        url = self._site_url(handler)
+        faults = self.faults
+        if faults.latency is not None:
+            with self._lock:
+                wait = faults.latency(self._random)
+            time.sleep(max(wait, 0.0))
+
+        if self._draw(faults.reset):
+            self._count('reset')
+            # closing with a zero linger time sends a reset instead of a clean close
+            handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            handler.connection.close()
+            handler.close_connection = True
+            return
+
+        wait = self._throttled(urlsplit(url).hostname or '')
+        if wait > 0:
+            self._count('rate_limited')
+            self._send(handler, 429, b'Too Many Requests', {'Retry-After': str(max(int(math.ceil(wait)), 1))})
+            return
+        if self._draw(faults.unavailable):
+            self._count('unavailable')
+            self._send(handler, 503, b'Service Unavailable', {'Retry-After': '%g' % faults.retry_after})
+            return
+
+        text = self.page(url)
+        if text is None:
+            self._count('not_found')
+            self._send(handler, 404, b'<html><head><title>Not Found</title></head><body></body></html>')
+            return
+        body = text if isinstance(text, bytes) else text.encode('utf-8')
+        if self._draw(faults.truncate):
+            self._count('truncated')
+            # announce the whole body, send half of it and hang up
+            self._send(handler, 200, body[0:len(body) // 2], length=len(body))
+            handler.close_connection = True
+            return
+        self._count('ok')
+        self._send(handler, 200, body)
+
+    def start(self) -> 'FakeSiteServer':
+        """Serves requests on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fakesite', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self) -> 'FakeSiteServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class FakeSiteTransport(object):
+    """Sends the requests of the sites to a fake site server instead of the network
+
+    Each thread gets its own requests session, so connections are pooled as
+    they are for the real sites. Requests take real time, so the fetcher keeps
+    its domain limits and the pauses of the sites."""
+    realtime = True
+
+    def __init__(self, server: FakeSiteServer):
+        self._server = server
+        self._local = threading.local()
+
+    def _thread_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = self._local.session = requests.Session()
+        return session
+
+    def get(self, url: str, cookies=None, timeout=None, **kwargs):
+        return self._thread_session().get(self._server.local_url(url), cookies=cookies, timeout=timeout, **kwargs)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m ff_scrape.testing.fakesite',
+                                     description='Serve synthetic stories of every site with injected faults.')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--stories', type=int, default=1, help='Synthetic stories per site')
+    parser.add_argument('--chapters', type=int, default=10, help='Chapters per story')
+    parser.add_argument('--words', type=int, default=2000, help='Words per chapter')
+    parser.add_argument('--fixtures', type=str, help='Also serve the story fixtures of this tests directory')
+    parser.add_argument('--latency', type=str, help='Latency distribution, e.g. constant:0.1 or lognormal:0.05,0.5')
+    parser.add_argument('--rate-limit', type=float, help='Requests per second per host before answering 429')
+    parser.add_argument('--unavailable', type=float, default=0.0, help='Share of requests answered with 503')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After of the 429 and 503 answers')
+    parser.add_argument('--truncate', type=float, default=0.0, help='Share of bodies cut off halfway')
+    parser.add_argument('--reset', type=float, default=0.0, help='Share of connections reset')
+    parser.add_argument('--seed', type=int, help='Seed of the injected faults')
+    args = parser.parse_args(argv)
+
+    faults = Faults(latency=latency(args.latency) if args.latency is not None else None, rate_limit=args.rate_limit,
+                    unavailable=args.unavailable, retry_after=args.retry_after, truncate=args.truncate,
+                    reset=args.reset, seed=args.seed)
+    server = FakeSiteServer(faults=faults, host=args.host, port=args.port)
+    for site in sorted(STORIES):
+        for story_id in range(1, args.stories + 1):
+            story = synthetic_story(site, story_id=story_id, chapters=args.chapters, words=args.words)
+            server.add_story(story)
+            print(server.local_url(story.url))
+    if args.fixtures is not None:
+        for site, url in server.add_fixtures(args.fixtures):
+            print(server.local_url(url))
+    print('Serving on %s' % server.url, file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
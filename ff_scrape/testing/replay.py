@@ -0,0 +1,201 @@
+"""Recording and replaying of site traffic
+
+A RecordingSession passes requests on to the network and keeps every response
+in a Cassette, which is saved as one zip archive: an index of the requests and
+their status and headers, plus the response bodies, each stored once and
+compressed. A ReplaySession answers the same requests from the archive without
+any network access. Responses of a URL requested more than once are replayed in
+the recorded order.
+
+    with Cassette.recording('fanfiction.zip') as cassette:
+        fetcher.transport = RecordingSession(cassette)
+        ...
+    fetcher.transport = ReplaySession(Cassette.load('fanfiction.zip'))
+
+Replayed responses take no time, so the fetcher skips its domain limits and
+the pauses sites take between chapters."""
+from ff_scrape.errors import ReplayError
+from contextlib import contextmanager
+from typing import Dict, List
+import hashlib
+import json
+import threading
+import zipfile
+
+# headers worth keeping, the others only make the archive bigger
+KEPT_HEADERS = ('content-type', 'location', 'retry-after')
+# fixed timestamp of the archive entries so the same traffic gives the same archive
+ZIP_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class ReplayResponse(object):
+    """A recorded response with the parts of the requests response the sites use"""
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def encoding(self) -> str:
+        content_type = self.headers.get('content-type', '')
+        for parameter in content_type.split(';')[1:]:
+            name, _, value = parameter.strip().partition('=')
+            if name.lower() == 'charset' and value != '':
+                return value.strip('"')
+        return 'utf-8'
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            from requests import HTTPError
+
+            raise HTTPError('%d Error for url: %s' % (self.status_code, self.url), response=self)
+
+
+class Cassette(object):
+    """Recorded requests and responses, saved to and loaded from a zip archive"""
+
+    def __init__(self):
+        self._interactions: List[dict] = []
+        self._by_url: Dict[str, List[dict]] = {}
+        self._bodies: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, interaction: dict) -> None:
+        self._interactions.append(interaction)
+        self._by_url.setdefault(interaction['url'], []).append(interaction)
+
+    def __len__(self) -> int:
+        return len(self._interactions)
+
+    def record(self, url: str, status_code: int, headers, content: bytes) -> None:
+        digest = hashlib.sha1(content).hexdigest()
+        kept = {}
+        for name, value in (headers or {}).items():
+            if name.lower() in KEPT_HEADERS:
+                kept[name.lower()] = value
+        with self._lock:
+            self._bodies[digest] = content
+            self._add({'url': url, 'status': status_code, 'headers': kept, 'body': digest})
+
+    def interactions(self, url: str) -> List[ReplayResponse]:
+        """The recorded responses of a URL in the order they were recorded"""
+        with self._lock:
+            return [ReplayResponse(url, interaction['status'], dict(interaction['headers']),
+                                   self._bodies[interaction['body']])
+                    for interaction in self._by_url.get(url, [])]
+
+    @property
+    def urls(self) -> List[str]:
+        with self._lock:
+            return list(self._by_url)
+
+    def save(self, file_path: str) -> None:
+        with self._lock, zipfile.ZipFile(file_path, 'w') as archive:
+            self._write(archive, 'interactions.json',
+                        json.dumps(self._interactions, indent=1, sort_keys=True).encode('utf-8'))
+            for digest in sorted(self._bodies):
+                self._write(archive, 'bodies/' + digest, self._bodies[digest])
+
+    @staticmethod
+    def _write(archive: zipfile.ZipFile, name: str, data: bytes) -> None:
+        info = zipfile.ZipInfo(name, date_time=ZIP_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        archive.writestr(info, data, compresslevel=9)
+
+    @classmethod
+    def load(cls, file_path: str) -> 'Cassette':
+        cassette = cls()
+        with zipfile.ZipFile(file_path, 'r') as archive:
+            for interaction in json.loads(archive.read('interactions.json').decode('utf-8')):
+                cassette._add(interaction)
+                digest = interaction['body']
+                if digest not in cassette._bodies:
+                    cassette._bodies[digest] = archive.read('bodies/' + digest)
+        return cassette
+
+    @classmethod
+    @contextmanager
+    def recording(cls, file_path: str):
+        """A new cassette that is saved to file_path when the block ends, even if it fails"""
+        cassette = cls()
+        try:
+            yield cassette
+        finally:
+            cassette.save(file_path)
+
+
+class RecordingSession(object):
+    """Fetches from the network (or the given session) and records every response
+
+    Each thread gets its own requests session unless ``session`` is given."""
+
+    def __init__(self, cassette: Cassette, session=None):
+        self._cassette = cassette
+        self._session = session
+        self._local = threading.local()
+
+    @property
+    def cassette(self) -> Cassette:
+        return self._cassette
+
+    @property
+    def realtime(self) -> bool:
+        return getattr(self._session, 'realtime', True)
+
+    def _thread_session(self):
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = self._local.session = requests.Session()
+        return session
+
+    def get(self, url: str, cookies=None, timeout=None, **kwargs):
+        response = self._thread_session().get(url, cookies=cookies, timeout=timeout, **kwargs)
+        self._cassette.record(url, response.status_code, response.headers, response.content)
+        return response
+
+
+class ReplaySession(object):
+    """Answers requests from a cassette, raising ReplayError for requests that were not recorded
+
+    With ``strict`` off a request that was not recorded is answered with a 404."""
+    realtime = False
+
+    def __init__(self, cassette: Cassette, strict: bool = True):
+        self._cassette = cassette
+        self._strict = strict
+        self._served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, file_path: str, strict: bool = True) -> 'ReplaySession':
+        return cls(Cassette.load(file_path), strict=strict)
+
+    def get(self, url: str, cookies=None, timeout=None, **kwargs) -> ReplayResponse:
+        responses = self._cassette.interactions(url)
+        if len(responses) == 0:
+            if self._strict:
+                raise ReplayError("No recorded response for: %s" % url)
+            return ReplayResponse(url, 404, {}, b'')
+        with self._lock:
+            served = self._served.get(url, 0)
+            self._served[url] = served + 1
+        # once every response was replayed, the last one is repeated
+        return responses[min(served, len(responses) - 1)]
+
+    def rewind(self) -> None:
+        """Starts every URL over at its first recorded response"""
+        with self._lock:
+            self._served.clear()
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,648 @@
+"""Synthetic stories of any size in the page layout of every supported site
+
+A synthetic story renders the index and chapter pages a site serves for a
+story with the given number of chapters and words per chapter, in the markup
+the site plugin parses. Pages are rendered on request from a seeded generator,
+so a 2,000 chapter story takes no memory until its pages are fetched and the
+same parameters always give the same pages.
+
+    story = synthetic_story('fanfiction', chapters=2000, words=3000)
+    processor.url = story.url
+    processor.fetcher = Fetcher(transport=SyntheticSession(story))
+
+Every chapter body holds exactly ``words`` words, so the word counts of a
+scrape can be checked against the story. Pages are text, downloads such as
+epubs are bytes."""
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from html import escape
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+import random
+import zipfile
+
+VOCABULARY = (
+    'the', 'a', 'and', 'of', 'to', 'was', 'he', 'she', 'they', 'it', 'in', 'that', 'had', 'his', 'her', 'with',
+    'for', 'as', 'on', 'at', 'by', 'from', 'but', 'not', 'what', 'all', 'were', 'when', 'we', 'there', 'been',
+    'wand', 'castle', 'forest', 'letter', 'door', 'night', 'storm', 'river', 'train', 'library', 'garden',
+    'quiet', 'bright', 'ancient', 'silver', 'cold', 'distant', 'small', 'golden', 'broken', 'hidden',
+    'window', 'whisper', 'turned', 'looked', 'walked', 'remembered', 'smiled', 'answered', 'waited', 'ran',
+    'never', 'always', 'again', 'before', 'after', 'under', 'over', 'through', 'between', 'without',
+    'perhaps', 'suddenly', 'slowly', 'finally', 'almost', 'still', 'only', 'just', 'once', 'even',
+)
+PARAGRAPH_WORDS = 120
+EPOCH = datetime(2010, 1, 1, 12, 0, 0)
+
+
+class SyntheticStory(ABC):
+    """A story of ``chapters`` chapters of ``words`` words each on one site
+
+    ``seed`` selects the generated text, ``complete`` whether the story is
+    marked as finished. Subclasses provide the URL of the story and the pages of
+    the site."""
+    site: str = None
+    fandom = 'Harry Potter'
+
+    def __init__(self, story_id: int = 1, chapters: int = 10, words: int = 2000, seed: int = 0,
+                 complete: bool = True):
+        if chapters < 1 or words < 1:
+            raise ValueError('A story needs at least one chapter of one word')
+        self.story_id = story_id
+        self.chapters = chapters
+        self.words = words
+        self.seed = seed
+        self.complete = complete
+        self.title = 'Synthetic Story %d' % story_id
+        self.author = 'Author%d' % (story_id % 97)
+        self.summary = ' '.join(self._words(random.Random(seed - 1), 40))
+        self.published = EPOCH + timedelta(days=seed % 1000)
+        self.updated = self.published + timedelta(days=chapters - 1)
+        self._pages: Dict[str, Callable[[], Union[str, bytes]]] = {}
+        for url, render in self._routes():
+            self._pages[self._key(url)] = render
+
+    @property
+    @abstractmethod
+    def url(self) -> str:
+        """The URL the site plugin fetches first, as its correct_url returns it"""
+
+    @abstractmethod
+    def _routes(self) -> List[Tuple[str, Callable[[], Union[str, bytes]]]]:
+        """The URLs of the story pages with the functions rendering them"""
+
+    def chapter_name(self, number: int) -> str:
+        """The chapter name as the site plugin records it"""
+        return 'Chapter %d' % number
+
+    def _chapter_title(self, number: int) -> str:
+        return 'Part %d of the tale' % number
+
+    @staticmethod
+    def _words(generator: random.Random, count: int) -> List[str]:
+        return generator.choices(VOCABULARY, k=count)
+
+    def paragraphs(self, number: int) -> List[str]:
+        """The plain text paragraphs of a chapter, ``words`` words in total"""
+        generator = random.Random(self.seed * 1000003 + number)
+        words = self._words(generator, self.words)
+        paragraphs = []
+        for start in range(0, len(words), PARAGRAPH_WORDS):
+            paragraph = words[start:start + PARAGRAPH_WORDS]
+            # sentences of eight to sixteen words
+            position = 0
+            while position < len(paragraph):
+                paragraph[position] = paragraph[position].capitalize()
+                position += generator.randint(8, 16)
+                paragraph[min(position, len(paragraph)) - 1] += '.'
+            paragraphs.append(' '.join(paragraph))
+        return paragraphs
+
+    def body(self, number: int) -> str:
+        return ''.join('<p>%s</p>\n' % paragraph for paragraph in self.paragraphs(number))
+
+    @staticmethod
+    def _key(url: str) -> str:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        for prefix in ('www.', 'm.'):
+            if host.startswith(prefix):
+                host = host[len(prefix):]
+        key = host + parts.path.rstrip('/')
+        if parts.query != '':
+            key += '?' + parts.query
+        return key
+
+    def urls(self) -> List[str]:
+        """The URL of every page of the story"""
+        return [url for url, _ in self._routes()]
+
+    def page(self, url: str) -> Optional[Union[str, bytes]]:
+        """The page served for the URL, None if the site has no such page"""
+        key = self._key(url)
+        render = self._pages.get(key)
+        if render is None and '?' in key:
+            # sites ignore query parameters they do not know
+            render = self._pages.get(key.split('?')[0])
+        return render() if render is not None else None
+
+
+class FanfictionStory(SyntheticStory):
+    site = 'fanfiction'
+
+    @property
+    def url(self) -> str:
+        return 'https://www.fanfiction.net/s/%d/1' % self.story_id
+
+    @staticmethod
+    def _key(url: str) -> str:
+        # the title slug after the chapter number is optional
+        parts = urlsplit(url)
+        return SyntheticStory._key(parts._replace(path='/'.join(parts.path.split('/')[0:4])).geturl())
+
+    def chapter_name(self, number: int) -> str:
+        if self.chapters == 1:
+            return self.title
+        return '%d. %s' % (number, self._chapter_title(number))
+
+    def page(self, url: str) -> Optional[Union[str, bytes]]:
+        if not (urlsplit(url).hostname or '').lower().startswith('m.'):
+            return super().page(url)
+        # the mobile site serves the same chapters without the desktop page around them
+        if self._pages.get(self._key(url)) is None:
+            return None
+        return self._mobile_page(int(urlsplit(url).path.split('/')[3]))
+
+    def _routes(self):
+        return [('https://www.fanfiction.net/s/%d/%d' % (self.story_id, number),
+                 lambda number=number: self._chapter_page(number)) for number in range(1, self.chapters + 1)]
+
+    def _select(self) -> str:
+        # the options are never closed, which is why the plugin reads them from the markup
+        options = ''.join('<option value=%d%s>%d. %s' % (number, ' selected' if number == 1 else '', number,
+                                                           self._chapter_title(number))
+                          for number in range(1, self.chapters + 1))
+        return ('<select id=chap_select title="Chapter Navigation" Name=chapter onChange="self.location = '
+                '\'/s/%d/\'+ this.options[this.selectedIndex].value + \'/Synthetic-Story\';">%s</select>'
+                % (self.story_id, options))
+
+    def _chapter_page(self, number: int) -> str:
+        timestamps = ' - Updated: <span data-xutime=\'%d\'>%s</span>' % (
+            self.updated.timestamp(), self.updated.strftime('%m/%d/%Y')) if self.chapters > 1 else ''
+        chapter_count = ' - Chapters: %d  ' % self.chapters if self.chapters > 1 else ''
+        select = self._select() if self.chapters > 1 else ''
+        return (
+            "<!DOCTYPE html><html><head><title>%(title)s Chapter %(number)d, a %(fandom)s fanfic | FanFiction"
+            "</title></head><body><div id=content_wrapper><div id=content_wrapper_inner>"
+            "<div id=pre_story_links class='lc-wrapper'><span class=lc-left><a class=xcontrast_txt href='/book/'>"
+            "Books</a><span class='xcontrast_txt icon-chevron-right xicon-section-arrow'></span>"
+            "<a class=xcontrast_txt href='/book/Harry-Potter/'>%(fandom)s</a></span></div>\n"
+            "<div id=profile_top style='min-height:112px;'><button class='btn pull-right icon-heart' type=button>"
+            " Follow/Fav</button><b class='xcontrast_txt'>%(title)s</b>\n"
+            "<span class='xcontrast_txt'><div style='height:5px'></div>By:</span> <a class='xcontrast_txt' "
+            "href='/u/%(story_id)d/%(author)s'>%(author)s</a> <span class='icon-mail-1  xcontrast_txt' ></span>\n"
+            "<div style='margin-top:2px' class='xcontrast_txt'>%(summary)s</div>\n"
+            "<span class='xgray xcontrast_txt'>Rated: <a class='xcontrast_txt' href='https://www.fictionratings.com/'"
+            " target='rating'>Fiction  T</a> - English - Adventure/Romance -  [Harry P., Ginny W.] Hermione G."
+            "%(chapter_count)s - Words: %(total)s - Reviews: <a href='/r/%(story_id)d/'>12</a> - Favs: 34 - "
+            "Follows: 56%(timestamps)s - Published: <span data-xutime='%(published)d'>%(published_text)s</span>"
+            "%(complete)s - id: %(story_id)d </span>\n</div>\n"
+            "<span class='lc-left'>%(select)s</span>\n"
+            "<div role='main' aria-label='story content' class='storytextp' id='storytextp' align=center "
+            "style='padding:0 0.5em 0 0.5em;'>\n<div class='storytext xcontrast_txt nocopy' id='storytext'>\n"
+            "%(body)s</div>\n</div>\n<span class='lc-left'>%(select)s</span>\n</div></div></body></html>" % {
+                'title': escape(self.title), 'number': number, 'fandom': self.fandom, 'story_id': self.story_id,
+                'author': self.author, 'summary': self.summary, 'chapter_count': chapter_count,
+                'total': format(self.words * self.chapters, ','), 'timestamps': timestamps,
+                'published': self.published.timestamp(), 'published_text': self.published.strftime('%m/%d/%Y'),
+                'complete': ' - Complete' if self.complete else '', 'select': select, 'body': self.body(number),
+            })
+
+    def _mobile_page(self, number: int) -> str:
+        navigation = ''
+        if number < self.chapters:
+            navigation = "<a href='/s/%d/%d/'>Next &#187;</a>" % (self.story_id, number + 1)
+        return (
+            "<!DOCTYPE html><html><head><title>%(title)s Ch %(number)d | FanFiction</title></head><body>"
+            "<div id=top><div align=center><b>%(title)s</b> By <a href='/u/%(story_id)d/'>%(author)s</a></div>"
+            "<div align=center>%(name)s</div></div>\n"
+            "<div style='' class='storycontent nocopy' id='storycontent' >\n%(body)s</div>\n"
+            "<div align=center>%(navigation)s</div></body></html>" % {
+                'title': escape(self.title), 'number': number, 'story_id': self.story_id, 'author': self.author,
+                'name': escape(self.chapter_name(number)), 'body': self.body(number), 'navigation': navigation,
+            })
+
+
+class ArchiveofOurOwnStory(SyntheticStory):
+    site = 'archiveofourown'
+
+    @property
+    def url(self) -> str:
+        return 'https://archiveofourown.org/works/%d?view_full_work=true' % self.story_id
+
+    @staticmethod
+    def _key(url: str) -> str:
+        # the works are not rated adult, the consent flag changes nothing
+        parts = urlsplit(url)
+        query = '&'.join(pair for pair in parts.query.split('&') if pair not in ('', 'view_adult=true'))
+        return SyntheticStory._key(parts._replace(query=query).geturl())
+
+    def _chapter_id(self, number: int) -> int:
+        return self.story_id * 1000 + number
+
+    def chapter_name(self, number: int) -> str:
+        return 'Chapter %d: %s' % (number, self._chapter_title(number))
+
+    def _routes(self):
+        routes = [(self.url, lambda: self._work(range(1, self.chapters + 1))),
+                  ('https://archiveofourown.org/works/%d' % self.story_id, lambda: self._work([1]))]
+        for number in range(1, self.chapters + 1):
+            routes.append(('https://archiveofourown.org/works/%d/chapters/%d' % (self.story_id,
+                                                                                self._chapter_id(number)),
+                           lambda number=number: self._work([number])))
+        return routes
+
+    @staticmethod
+    def _tags(name: str, label: str, values: List[str]) -> str:
+        links = ''.join('<li><a class="tag" href="/tags/%s/works">%s</a></li>' % (escape(value.replace('/', '*s*')),
+                                                                                   escape(value))
+                        for value in values)
+        return ('<dt class="%s tags">\n              %s:\n          </dt>\n<dd class="%s tags">\n'
+                '<ul class="commas">\n%s\n</ul>\n</dd>\n' % (name, label, name, links))
+
+    def _chapter(self, number: int) -> str:
+        return ('<div class="chapter" id="chapter-%d">\n<!-- chapter management -->\n'
+                '<div class="chapter preface group" role="complementary">\n<h3 class="title">\n'
+                '<a href="/works/%d/chapters/%d">Chapter %d</a>: %s\n    </h3>\n</div>\n<!--main content-->\n'
+                '<div class="userstuff module" role="article">\n'
+                '<h3 class="landmark heading" id="work">Chapter Text</h3>\n%s</div>\n</div>\n'
+                % (number, self.story_id, self._chapter_id(number), number, self._chapter_title(number),
+                   self.body(number)))
+
+    def _work(self, numbers) -> str:
+        status = ''
+        if self.chapters > 1:
+            status = '<dt class="status">%s:</dt><dd class="status">%s</dd>' % (
+                'Completed' if self.complete else 'Updated', self.updated.strftime('%Y-%m-%d'))
+        parts = [
+            '<!DOCTYPE html>\n<html lang="en"><head><title>%s - %s - %s [Archive of Our Own]</title></head>\n'
+            '<body><div id="outer" class="wrapper"><div id="main" class="works-show region" role="main">\n'
+            '<div class="wrapper">\n<dl class="work meta group" role="complementary">\n'
+            % (escape(self.title), self.author, self.fandom),
+            self._tags('rating', 'Rating', ['Teen And Up Audiences']),
+            self._tags('warning', 'Archive Warning', ['No Archive Warnings Apply']),
+            self._tags('category', 'Category', ['Gen']),
+            self._tags('fandom', 'Fandom', [self.fandom + ' - J. K. Rowling']),
+            self._tags('relationship', 'Relationship', ['Harry Potter/Ginny Weasley']),
+            self._tags('character', 'Characters', ['Harry Potter', 'Ginny Weasley', 'Hermione Granger']),
+            self._tags('freeform', 'Additional Tags', ['Adventure', 'Slow Burn']),
+            '<dt class="language">\n        Language:\n      </dt>\n<dd class="language">\n        English\n'
+            '      </dd>\n<dt class="stats">Stats:</dt>\n<dd class="stats">\n<dl class="stats">'
+            '<dt class="published">Published:</dt><dd class="published">%s</dd>%s'
+            '<dt class="words">Words:</dt><dd class="words">%d</dd><dt class="chapters">Chapters:</dt>'
+            '<dd class="chapters">%d/%s</dd><dt class="kudos">Kudos:</dt><dd class="kudos">42</dd></dl>\n'
+            '</dd>\n</dl>\n</div>\n' % (self.published.strftime('%Y-%m-%d'), status, self.words * self.chapters,
+                                        self.chapters, self.chapters if self.complete else '?'),
+            '<div id="workskin">\n<div class="preface group">\n<h2 class="title heading">\n      %s\n    </h2>\n'
+            '<h3 class="byline heading">\n<a rel="author" href="/users/%s/pseuds/%s">%s</a>\n</h3>\n'
+            '<div class="summary module" role="complementary">\n<h3 class="heading">Summary:</h3>\n'
+            '<blockquote class="userstuff">\n<p>%s</p>\n</blockquote>\n</div>\n</div>\n'
+            '<div id="chapters" role="article">\n'
+            % (escape(self.title), self.author, self.author, self.author, self.summary),
+        ]
+        if self.chapters == 1:
+            # one shots have no chapter wrappers
+            parts.append('<h3 class="landmark heading" id="work">Work Text:</h3>\n<div class="userstuff">\n%s</div>\n'
+                         % self.body(1))
+        else:
+            parts.extend(self._chapter(number) for number in numbers)
+        parts.append('</div>\n</div>\n</div></div></body></html>\n')
+        return ''.join(parts)
+
+
+class FicwadStory(SyntheticStory):
+    site = 'ficwad'
+
+    @property
+    def url(self) -> str:
+        return 'http://ficwad.com/story/%d' % self.story_id
+
+    def _chapter_id(self, number: int) -> int:
+        return self.story_id * 1000 + number
+
+    def chapter_name(self, number: int) -> str:
+        if self.chapters == 1:
+            return self.title
+        return '%d. %s' % (number, self._chapter_title(number))
+
+    def _routes(self):
+        if self.chapters == 1:
+            return [(self.url, self._one_shot)]
+        routes = [(self.url, self._index)]
+        for number in range(1, self.chapters + 1):
+            routes.append(('http://ficwad.com/story/%d' % self._chapter_id(number),
+                           lambda number=number: self._chapter_page(number)))
+        return routes
+
+    def _meta(self, chapters: int) -> str:
+        return ('<p class="meta">Category: <a href="/category/1">%s</a> - Rating: PG - Genres: Drama,Romance - '
+                'Warnings: <a href="/warnings#violence" title="Violence">[V]</a> - Chapters: %d - '
+                'Published: <span title="%s">%s</span> - Updated: <span title="%s">%s</span>%s</p>\n'
+                '<p>Characters: Harry Potter, Hermione Granger</p>\n'
+                % (self.fandom, chapters, self.published.isoformat(' '), self.published.strftime('%Y-%m-%d'),
+                   self.updated.isoformat(' '), self.updated.strftime('%Y-%m-%d'),
+                   ' - Complete' if self.complete else ''))
+
+    def _page(self, content: str) -> str:
+        return ('<!DOCTYPE html>\n<html><head><title>%s :: FicWad: fresh-picked original and fan fiction</title>'
+                '</head>\n<body><div id="contents"><div id="story">\n%s</div></div></body></html>\n'
+                % (escape(self.title), content))
+
+    def _header(self, link: str) -> str:
+        return ('<div class="storylist">\n<h4><a href="%s">%s</a></h4>\n<span class="author">by '
+                '<a href="/a/%s">%s</a></span>\n<block_quote>%s</block_quote>\n%s</div>\n'
+                % (link, escape(self.title), self.author, self.author, self.summary, self._meta(self.chapters)))
+
+    def _index(self) -> str:
+        chapters = ''.join('<li class="chapter"><h4><a href="/story/%d">%s</a></h4>\n%s</li>\n'
+                           % (self._chapter_id(number), self.chapter_name(number), self._meta(1))
+                           for number in range(1, self.chapters + 1))
+        return self._page(self._header('/story/%d' % self.story_id) +
+                          '<div id="storytext"><ul class="storylist">\n%s</ul></div>\n' % chapters)
+
+    def _chapter_page(self, number: int) -> str:
+        options = ''.join('<option value="/story/%d"%s>%s</option>' % (
+            self._chapter_id(chapter), ' selected="selected"' if chapter == number else '', self.chapter_name(chapter))
+                          for chapter in range(1, self.chapters + 1))
+        return self._page('<h4><a href="/story/%d">%s</a></h4>\n<form><select name="chapterlist">'
+                          '<option value="/story/%d">Story Index</option>%s</select></form>\n'
+                          '<div id="storytext">\n%s</div>\n'
+                          % (self.story_id, escape(self.title), self.story_id, options, self.body(number)))
+
+    def _one_shot(self) -> str:
+        return self._page(self._header('/story/%d' % self.story_id) +
+                          '<div id="storytext">\n%s</div>\n' % self.body(1))
+
+
+class FanficAuthorsStory(SyntheticStory):
+    site = 'fanficauthors'
+
+    @property
+    def _story_path(self) -> str:
+        return 'Synthetic_Story_%d' % self.story_id
+
+    @property
+    def _host(self) -> str:
+        return 'https://%s.fanficauthors.net' % self.author.lower()
+
+    @property
+    def url(self) -> str:
+        return '%s/%s/index' % (self._host, self._story_path)
+
+    def chapter_name(self, number: int) -> str:
+        return self._chapter_title(number)
+
+    def _chapter_path(self, number: int) -> str:
+        return '/%s/Part_%d/' % (self._story_path, number)
+
+    @property
+    def epub_url(self) -> str:
+        return '%s/ws/public/epub/%d/' % (self._host, self.story_id)
+
+    def _routes(self):
+        routes = [(self.url, self._index), (self.epub_url, self._epub)]
+        for number in range(1, self.chapters + 1):
+            routes.append(('%s%s?bypass=1' % (self._host, self._chapter_path(number)),
+                           lambda number=number: self._chapter_page(number)))
+        return routes
+
+    @staticmethod
+    def _date(date: datetime) -> str:
+        suffix = 'th' if 10 <= date.day % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(date.day % 10, 'th')
+        return '%d%s %s' % (date.day, suffix, date.strftime('%b %y'))
+
+    def _page(self, content: str) -> str:
+        return ('<!DOCTYPE html>\n<html><head><title>%s</title></head>\n<body><div class="container">\n'
+                '<div class="row" id="main">\n<div class="col-md-12">\n<div class="page-header">\n'
+                '<h2 class="text-center">%s</h2>\n<h3 class="text-center">By %s</h3>\n</div>\n</div>\n'
+                '<div class="col-md-12">\n%s</div>\n</div>\n</div></body></html>\n'
+                % (escape(self.title), escape(self.title), self.author, content))
+
+    def _index(self) -> str:
+        story_id = self.story_id
+        chapters = ''.join(
+            '<p>%d - <a href="%s">%s</a><br/>\nWord count: %s -\nReviews: <a href="%sreviews/">3</a> -\n'
+            'Rating: Teen -\nUploaded on: %s\n</p>\n'
+            % (number, self._chapter_path(number), self.chapter_name(number), format(self.words, ','),
+               self._chapter_path(number), self._date(self.published + timedelta(days=number - 1)))
+            for number in range(1, self.chapters + 1))
+        return self._page(
+            '<div class="well">\n<p>%s was updated on %s</p>\n<p>Status: %s - Rating: Teen - Chapters: %d -\n'
+            'Word count: %s - Genre: Drama, Romance</p>\n<p>Also available as: <a href="/ws/public/epub/%d/">Epub</a>'
+            ' | <a href="/resources/files/%d1/">lit</a> | <a href="/resources/files/%d2/">mobi</a> | '
+            '<a href="/resources/files/%d3/">pdf</a> | <a href="/resources/files/%d4/">txt</a></p>\n'
+            '<blockquote><p>%s</p></blockquote>\n</div>\n%s'
+            % (escape(self.title), self._date(self.updated), 'Completed' if self.complete else 'In progress',
+               self.chapters, format(self.words * self.chapters, ','), story_id, story_id, story_id, story_id,
+               story_id, self.summary, chapters))
+
+    def _chapter_page(self, number: int) -> str:
+        pager = '<ul class="pager"><li class="next"><a href="%s">Next</a></li></ul>\n' % self._chapter_path(
+            min(number + 1, self.chapters))
+        return self._page('<div class="story">\n%s<div class="well"><p>%s</p><p>Uploaded on: %s</p></div>\n%s%s'
+                          '</div>\n' % (pager, self.chapter_name(number), self._date(self.published), self.body(number),
+                                        pager))
+
+    def _epub_document(self, title: str, content: str) -> str:
+        return ('<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">'
+                '<head><title>%s</title></head>\n<body>\n%s</body></html>\n' % (escape(title), content))
+
+    def _epub(self) -> bytes:
+        """The story as an epub: a title page, then one document per chapter"""
+        documents = [('title.xhtml', self._epub_document(self.title, '<h1>%s</h1>\n<p>By %s</p>\n' % (
+            escape(self.title), self.author)))]
+        for number in range(1, self.chapters + 1):
+            documents.append(('chapter_%d.xhtml' % number, self._epub_document(
+                self.chapter_name(number), '<h2>%s</h2>\n%s' % (self.chapter_name(number), self.body(number)))))
+        package = ('<?xml version="1.0" encoding="utf-8"?>\n<package xmlns="http://www.idpf.org/2007/opf" '
+                   'version="2.0" unique-identifier="id"><metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                   '<dc:title>%s</dc:title><dc:creator>%s</dc:creator></metadata>\n<manifest>%s</manifest>\n'
+                   '<spine>%s</spine></package>\n'
+                   % (escape(self.title), self.author,
+                      ''.join('<item id="d%d" href="Text/%s" media-type="application/xhtml+xml"/>' % (index, name)
+                              for index, (name, _) in enumerate(documents)),
+                      ''.join('<itemref idref="d%d"/>' % index for index in range(len(documents)))))
+        container = ('<?xml version="1.0"?>\n<container version="1.0" '
+                     'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+                     '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                     '</rootfiles></container>\n')
+        entries = [('mimetype', 'application/epub+zip'), ('META-INF/container.xml', container),
+                   ('OEBPS/content.opf', package)]
+        entries += [('OEBPS/Text/' + name, document) for name, document in documents]
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, content in entries:
+                # a fixed timestamp keeps the epub the same on every run
+                info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+                info.compress_type = zipfile.ZIP_STORED if name == 'mimetype' else zipfile.ZIP_DEFLATED
+                archive.writestr(info, content)
+        return buffer.getvalue()
+
+
+class HPFanficArchiveStory(SyntheticStory):
+    site = 'hpfanficarchive'
+
+    @property
+    def url(self) -> str:
+        return 'http://www.hpfanficarchive.com/stories/viewstory.php?sid=%d' % self.story_id
+
+    def chapter_name(self, number: int) -> str:
+        return self._chapter_title(number)
+
+    @property
+    def printable_url(self) -> str:
+        return ('http://www.hpfanficarchive.com/stories/viewstory.php?action=printable&textsize=0&sid=%d&chapter=all'
+                % self.story_id)
+
+    def _routes(self):
+        routes = [(self.url, self._index), (self.printable_url, self._printable)]
+        for number in range(1, self.chapters + 1):
+            routes.append(('%s&chapter=%d' % (self.url, number), lambda number=number: self._chapter_page(number)))
+        return routes
+
+    def _page(self, content: str) -> str:
+        return ('<!DOCTYPE html>\n<html><head><title>HP Fanfiction Archive: %s</title></head>\n<body>'
+                '<div id="pagetitle"> <!-- TITLE START --><a href="viewstory.php?sid=%d">%s</a><!-- TITLE END --> by '
+                '<!-- AUTHOR START --><a href="viewuser.php?uid=%d">%s</a><!-- AUTHOR END --> </div>\n%s</body></html>\n'
+                % (escape(self.title), self.story_id, escape(self.title), self.story_id, self.author, content))
+
+    def _index(self) -> str:
+        info = (
+            '<div class="content"><span class="label">Summary: </span><!-- SUMMARY START --><p>%s</p>'
+            '<!-- SUMMARY END --><br/>\n<span class="label">Rated:</span> T - Teens<br/>\n'
+            '<span class="label">Categories:</span> <a href="browse.php?type=categories&amp;catid=49">Drama</a><br/>\n'
+            '<span class="label">Characters: </span> <a href="browse.php?type=characters&amp;charid=12">'
+            'Harry James Potter</a>, <a href="browse.php?type=characters&amp;charid=15">Hermione Granger</a><br/>\n'
+            '<span class="label">Status: </span> <a href="browse.php?type=class&amp;type_id=3&amp;classid=68">%s</a>'
+            '<br/><span class="label">Genres: </span> <a href="browse.php?type=class&amp;type_id=1&amp;classid=48">'
+            'Adventure/Action</a>, <a href="browse.php?type=class&amp;type_id=1&amp;classid=10">Drama</a><br/>'
+            '<span class="label">Pairings: </span> <a href="browse.php?type=class&amp;type_id=4&amp;classid=134">'
+            'Harry/Hermione</a><br/><span class="label">Warnings: </span> '
+            '<a href="browse.php?type=class&amp;type_id=2&amp;classid=25">Strong Violence</a><br/>\n'
+            '<span class="label">Challenges:</span> None<br/> <span class="label">Series:</span> None<br/>\n'
+            '<span class="label">Chapters: </span> %d <span class="label">Completed:</span> %s <br/> \n'
+            '<span class="label">Word count:</span> <!-- WORDCOUNT START -->%s<!-- WORDCOUNT END --> '
+            '<span class="label">Read:</span> 1,024<br/>\n'
+            '<span class="label"> Published: </span><!-- PUBLISHED START -->%s<!-- PUBLISHED END --> '
+            '<span class="label">Updated:</span> <!-- UPDATED START -->%s<!-- UPDATED END --> </div>\n'
+            % (self.summary, 'Completed' if self.complete else 'WIP (Work in progress)', self.chapters,
+               'Yes' if self.complete else 'No', format(self.words * self.chapters, ','),
+               self.published.strftime('%B %d, %Y'), self.updated.strftime('%B %d, %Y')))
+        chapters = ''.join(
+            '<p><b>%d. <a href="viewstory.php?sid=%d&amp;chapter=%d">%s</a> </b>by <a href="viewuser.php?uid=%d">'
+            '%s</a> [<a href="reviews.php?type=ST&amp;item=%d&amp;chapid=%d">Reviews</a> - '
+            '<a href="reviews.php?type=ST&amp;item=%d&amp;chapid=%d">0</a>]  (%s words)<br/>\n</p>\n'
+            % (number, self.story_id, number, self.chapter_name(number), self.story_id, self.author, self.story_id,
+               number, self.story_id, number, format(self.words, ','))
+            for number in range(1, self.chapters + 1))
+        return self._page(
+            '<div id="sort"><a href="viewstory.php?action=printable&amp;textsize=0&amp;sid=%d&amp;chapter=all" '
+            'target="_blank"><img src="images/print.gif" alt="Printer"/></a></div>\n' % self.story_id +
+            '<div class="content"> Be the first to add a tag to this story </div>\n<div class="content">\n\n'
+            '<div class="jumpmenu"></div>\n%s<div style="text-align: center;">  <br/></div>\n\n</div>\n'
+            '<div class="content">\n\n\n</div>\n<div class="content">\n%s</div>\n' % (info, chapters))
+
+    def _chapter(self, number: int) -> str:
+        return ('<div class="chaptertitle">%s by <a href="viewuser.php?uid=%d">%s</a></div>\n'
+                '<div id="story"><span style="color: #000000;">\n%s</span></div>\n'
+                % (self.chapter_name(number), self.story_id, self.author, self.body(number)))
+
+    def _chapter_page(self, number: int) -> str:
+        return self._page(self._chapter(number))
+
+    def _printable(self) -> str:
+        # every chapter one after the other, the way eFiction prints a whole story
+        return self._page(''.join(self._chapter(number) for number in range(1, self.chapters + 1)))
+
+
+class AnimationSourceStory(SyntheticStory):
+    site = 'animationsource'
+    fandom = 'Balto'
+
+    @property
+    def url(self) -> str:
+        return 'https://www.animationsource.org/balto/en/view_fanfic/Synthetic-Story-%d/%d.html' % (
+            self.story_id, self.story_id)
+
+    def _reading_url(self, number: int) -> str:
+        return '%s&deb=%d&nsite=1' % (self.url, number - 1)
+
+    def _routes(self):
+        routes = [(self.url, self._story_page)]
+        for number in range(1, self.chapters + 1):
+            routes.append((self._reading_url(number), lambda number=number: self._reading_page(number)))
+        return routes
+
+    def _page(self, content: str) -> str:
+        return ('<!DOCTYPE html>\n<html><head><title>%s - Balto Source</title></head>\n<body>'
+                '<div class="bhaut2b"><h1 style="display:inline">%s</h1></div>\n%s</body></html>\n'
+                % (escape(self.title), escape(self.title), content))
+
+    def _story_page(self) -> str:
+        return self._page(self._details())
+
+    def _details(self) -> str:
+        return (
+            '<div class="ct2"><div style="padding:5px"><b>Author</b> : %s<br/><br/><b>Date sent</b> : %s<br/><br/>'
+            '<b>Rating</b> : <span class="content_important">PG (Parental guidance suggested)</span><br/><br/>'
+            '<b>Category</b> : Epic<br/><br/><b>Description</b> : %s<br/><br/><b>Length</b> : Long<br/><br/>'
+            'Characters  : <center><center>Balto</center><center>Aleu</center></center><br/><br/>'
+            '<span class="bold bs2"><a href="%s&amp;deb=0&amp;nsite=1"><span class="bold bs2">Read the fanfic</span>'
+            '</a></span><br/><br/><span class="bs2"><a href="https://www.animationsource.org/balto/en/fanfic/%s/%d.html">'
+            '<span class="bs2"><big>Go to the writer\'s section</big></span></a></span></div></div>\n'
+            % (self.author, self.published.strftime('%B %d, %Y'), self.summary, self.url, self.author, self.story_id))
+
+    def _reading_page(self, number: int) -> str:
+        navigation = ''
+        if self.chapters > 1:
+            links = ''.join('<span class="f9"><b>%d</b></span> ' % chapter if chapter == number else
+                            '<span class="f9"><a href="%s">%d</a></span> ' % (escape(self._reading_url(chapter)),
+                                                                              chapter)
+                            for chapter in range(1, self.chapters + 1))
+            navigation = '<table><tr><td>Chapters : %s</td></tr></table>\n' % links
+        # the reading view repeats the story details above the text
+        return self._page(self._details() + '<div class="fanfic">\n%s%s</div>\n' % (self.body(number), navigation))
+
+
+STORIES = {story.site: story for story in [FanfictionStory, ArchiveofOurOwnStory, FicwadStory, FanficAuthorsStory,
+                                           HPFanficArchiveStory, AnimationSourceStory]}
+
+
+def synthetic_story(site: str, **options) -> SyntheticStory:
+    """A synthetic story on the named site, see SyntheticStory for the options"""
+    if site not in STORIES:
+        raise ValueError('No synthetic pages for site: %s' % site)
+    return STORIES[site](**options)
+
+
+class SyntheticResponse(object):
+    def __init__(self, url: str, text: Optional[Union[str, bytes]]):
+        self.url = url
+        self.status_code = 200 if text is not None else 404
+        self.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        if isinstance(text, bytes):
+            self.content = text
+            self.text = text.decode('utf-8', 'replace')
+            self.headers = {'Content-Type': 'application/octet-stream'}
+            return
+        self.text = text if text is not None else '<html><head><title>Not Found</title></head><body></body></html>'
+        self.content = self.text.encode('utf-8')
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            from requests import HTTPError
+
+            raise HTTPError('%d Client Error for url: %s' % (self.status_code, self.url), response=self)
+
+
+class SyntheticSession(object):
+    """Answers the requests of a site from synthetic stories instead of the network
+
+    Has the part of the requests session interface the fetcher uses, unknown
+    pages are answered with a 404. The fetched URLs are kept in ``requested``."""
+    realtime = False
+
+    def __init__(self, *stories: SyntheticStory):
+        self._stories = stories
+        self.requested: List[str] = []
+
+    def get(self, url: str, cookies=None, timeout=None, **kwargs) -> SyntheticResponse:
+        self.requested.append(url)
+        for story in self._stories:
+            text = story.page(url)
+            if text is not None:
+                return SyntheticResponse(url, text)
+        return SyntheticResponse(url, None)
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,272 @@
+"""Adaptive refresh of monitored stories
+
+Every monitored story keeps its history of update times in a small SQLite
+database. From that history the watchlist estimates how often the story is
+updated and, with the time since it was last checked, the probability that a
+check finds a change. Checks are scheduled when that probability crosses a
+threshold and, when more checks are due than the per site budgets allow, the
+most promising ones go first. Only stories whose probe fingerprint changed are
+handed on for a full scrape."""
+from ff_scrape.routing import CanonicalizationReport
+from ff_scrape.probe import ProbeReport
+from ff_scrape.storybase import Story
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import heapq
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+DAY = 86400.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    site TEXT NOT NULL,
+    story_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    digest TEXT,
+    last_checked REAL,
+    next_check REAL NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (site, story_id)
+);
+CREATE TABLE IF NOT EXISTS updates (
+    site TEXT NOT NULL,
+    story_id TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (site, story_id, updated)
+);
+"""
+
+StoryKey = Tuple[str, str]
+
+
+class Watchlist(object):
+    """Monitored stories with their update history and next check time
+
+    The update rate of a story is estimated as (updates + 1) / (observed span +
+    ``prior_interval``), so a story without history is assumed to update once
+    per ``prior_interval`` seconds and the estimate follows the history as it
+    grows. A story is due once a check has at least ``threshold`` probability
+    of finding a change, clamped between ``min_interval`` and ``max_interval``."""
+
+    def __init__(self, path: str, prior_interval: float = 30 * DAY, threshold: float = 0.5,
+                 min_interval: float = 3600.0, max_interval: float = 60 * DAY):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._prior_interval = prior_interval
+        self._threshold = threshold
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._queue = []
+        for site, story_id, next_check in self._db.execute("SELECT site, story_id, next_check FROM stories"):
+            self._queue.append((next_check, site, story_id))
+        heapq.heapify(self._queue)
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM stories").fetchone()[0]
+
+    def add(self, report: CanonicalizationReport, now: float = None) -> int:
+        """Starts monitoring the stories of a canonicalization report, returns how many were new"""
+        now = time.time() if now is None else now
+        added = 0
+        with self._lock, self._db:
+            for canonical in report.unique:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO stories (site, story_id, url, next_check) VALUES (?, ?, ?, ?)",
+                    (canonical.site, canonical.story_id, canonical.url, now))
+                if cursor.rowcount > 0:
+                    heapq.heappush(self._queue, (now, canonical.site, canonical.story_id))
+                    added += 1
+        return added
+
+    def url(self, key: StoryKey) -> str:
+        return self._db.execute("SELECT url FROM stories WHERE site = ? AND story_id = ?", key).fetchone()[0]
+
+    def record_update(self, key: StoryKey, updated: Optional[datetime]) -> None:
+        if updated is None:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT OR IGNORE INTO updates (site, story_id, updated) VALUES (?, ?, ?)",
+                             key + (updated.timestamp(),))
+
+    def record_story(self, key: StoryKey, fanfic: Story) -> None:
+        """Adds the published and updated times of a scraped story to its history"""
+        self.record_update(key, fanfic.published)
+        self.record_update(key, fanfic.updated)
+
+    def update_rate(self, key: StoryKey, now: float = None) -> float:
+        """Estimated updates per second"""
+        now = time.time() if now is None else now
+        count, first = self._db.execute("SELECT COUNT(*), MIN(updated) FROM updates WHERE site = ? AND story_id = ?",
+                                        key).fetchone()
+        span = now - first if first is not None else 0.0
+        # the first entry is the publication, it is not an update
+        updates = max(count - 1, 0)
+        return (updates + 1) / (max(span, 0.0) + self._prior_interval)
+
+    def change_probability(self, key: StoryKey, now: float = None) -> float:
+        """Probability that a check now finds a change, treating updates as a Poisson process"""
+        now = time.time() if now is None else now
+        row = self._db.execute("SELECT last_checked FROM stories WHERE site = ? AND story_id = ?", key).fetchone()
+        if row is None or row[0] is None:
+            return 1.0
+        return 1 - math.exp(-self.update_rate(key, now) * (now - row[0]))
+
+    def _interval(self, key: StoryKey, now: float) -> float:
+        interval = -math.log(1 - self._threshold) / self.update_rate(key, now)
+        return min(max(interval, self._min_interval), self._max_interval)
+
+    def record_check(self, key: StoryKey, digest: Optional[str], now: float = None,
+                     store_change: bool = True) -> bool:
+        """Stores the result of a check and schedules the next one, returns whether the story changed
+
+        Without ``store_change`` a changed digest is left for record_change, so
+        the change is found again until it is recorded."""
+        now = time.time() if now is None else now
+        with self._lock:
+            previous = self._db.execute("SELECT digest FROM stories WHERE site = ? AND story_id = ?",
+                                        key).fetchone()[0]
+            changed = digest is not None and previous is not None and digest != previous
+            if changed and not store_change:
+                digest = None
+            next_check = now + self._interval(key, now)
+            with self._db:
+                self._db.execute("UPDATE stories SET digest = COALESCE(?, digest), last_checked = ?, next_check = ?, "
+                                 "checks = checks + 1, changes = changes + ? WHERE site = ? AND story_id = ?",
+                                 (digest, now, next_check, int(changed and store_change)) + key)
+            heapq.heappush(self._queue, (next_check, key[0], key[1]))
+        return changed
+
+    def record_change(self, key: StoryKey, digest: str) -> None:
+        """Stores the digest of a change once it has been handled"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE stories SET digest = ?, changes = changes + 1 WHERE site = ? AND story_id = ?",
+                             (digest,) + key)
+
+    def postpone(self, key: StoryKey, when: float) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("UPDATE stories SET next_check = ? WHERE site = ? AND story_id = ?", (when,) + key)
+            heapq.heappush(self._queue, (when, key[0], key[1]))
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            return self._queue[0][0] if len(self._queue) > 0 else None
+
+    def pop_due(self, now: float = None, limit: int = None) -> List[StoryKey]:
+        """Removes and returns the stories that are due, most likely to have changed first"""
+        now = time.time() if now is None else now
+        due = []
+        with self._lock:
+            while len(self._queue) > 0 and self._queue[0][0] <= now and (limit is None or len(due) < limit):
+                next_check, site, story_id = heapq.heappop(self._queue)
+                row = self._db.execute("SELECT next_check FROM stories WHERE site = ? AND story_id = ?",
+                                       (site, story_id)).fetchone()
+                # skip entries left behind by a later reschedule
+                if row is None or row[0] != next_check:
+                    continue
+                due.append((site, story_id))
+        return sorted(due, key=lambda key: self.change_probability(key, now), reverse=True)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class _Budget(object):
+    """Token bucket refilled at ``per_hour`` requests per hour"""
+
+    def __init__(self, per_hour: float, now: float):
+        self.per_hour = per_hour
+        self.tokens = per_hour
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.per_hour, self.tokens + (now - self.updated) * self.per_hour / 3600)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RefreshDaemon(object):
+    """Checks due stories within per site request budgets and re-scrapes changed ones
+
+    ``probe`` receives a list of URLs and returns a ProbeReport, ``rescrape``
+    receives the URLs of changed stories and returns the scraped stories."""
+
+    def __init__(self, watchlist: Watchlist, probe: Callable[[List[str]], ProbeReport],
+                 rescrape: Callable[[List[str]], List[Story]], budgets: Dict[str, float] = None,
+                 default_budget: float = 600.0, batch_size: int = 200, retry_delay: float = 300.0):
+        self._watchlist = watchlist
+        self._probe = probe
+        self._rescrape = rescrape
+        self._budget_sizes = budgets or {}
+        self._default_budget = default_budget
+        self._budgets = {}
+        self._batch_size = batch_size
+        self._retry_delay = retry_delay
+        self._logger = logging.getLogger('ff_scrape.watchlist')
+
+    def _take(self, site: str, now: float) -> bool:
+        if site not in self._budgets:
+            self._budgets[site] = _Budget(self._budget_sizes.get(site, self._default_budget), now)
+        return self._budgets[site].take(now)
+
+    def run_once(self, now: float = None) -> Tuple[int, List[StoryKey]]:
+        """Probes one batch of due stories, returns the number probed and the changed keys"""
+        now = time.time() if now is None else now
+        selected = []
+        for key in self._watchlist.pop_due(now, limit=self._batch_size):
+            if self._take(key[0], now):
+                selected.append(key)
+            else:
+                # over budget, try again once the bucket had time to refill
+                self._watchlist.postpone(key, now + self._retry_delay)
+        if len(selected) == 0:
+            return 0, []
+
+        report = self._probe([self._watchlist.url(key) for key in selected])
+        changed = []
+        digests = {}
+        for key in selected:
+            fingerprint = report.fingerprints.get(key)
+            if fingerprint is None:
+                self._watchlist.record_check(key, None, now)
+                continue
+            self._watchlist.record_update(key, fingerprint.updated)
+            # the new digest is only stored once the story was scraped, a failed scrape finds the change again
+            if self._watchlist.record_check(key, fingerprint.digest, now, store_change=False):
+                changed.append(key)
+                digests[key] = fingerprint.digest
+
+        if len(changed) > 0:
+            self._logger.info("%d of %d checked stories changed" % (len(changed), len(selected)))
+            try:
+                stories = list(self._rescrape([self._watchlist.url(key) for key in changed]))
+            except Exception:
+                self._logger.exception("Re-scraping %d changed stories failed" % len(changed))
+                stories = []
+            stories += [None] * (len(changed) - len(stories))
+            for key, fanfic in zip(changed, stories):
+                if fanfic is None or fanfic.scrape_status != 'complete':
+                    self._logger.warning("Re-scraping %s failed, trying again later" % self._watchlist.url(key))
+                    self._watchlist.postpone(key, now + self._retry_delay)
+                    continue
+                self._watchlist.record_story(key, fanfic)
+                self._watchlist.record_change(key, digests[key])
+        return len(selected), changed
+
+    def run_forever(self, stop: threading.Event = None, poll_interval: float = 60.0) -> None:
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            probed, changed = self.run_once()
+            if probed == 0:
+                next_due = self._watchlist.next_due()
+                wait = poll_interval if next_due is None else min(max(next_due - time.time(), 1.0), poll_interval)
+                stop.wait(wait)
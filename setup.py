@@ -5,7 +5,7 @@ setup(
     name='ff_scrape',
     version='0.1',
 
-    packages=['ff_scrape', 'ff_scrape.sites'],
+    packages=['ff_scrape', 'ff_scrape.sites', 'ff_scrape.formatters', 'ff_scrape.recorders', 'ff_scrape.testing'],
     install_requires=[
         'beautifulsoup4',
         'requests',
@@ -15,21 +15,24 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'ff_scrape=ff_scrape.cli:main'
+            'ff_scrape=ff_scrape.cli:main',
+            'ff_scrape_worker=ff_scrape.cli:worker',
+            'ff_scrape_server=ff_scrape.cli:server'
         ],
         'ff_scrape.sites': [
             'Fanfiction=ff_scrape.sites.fanfiction:Fanfiction',
             'HPFanficArchive=ff_scrape.sites.hpfanficarchive:HPFanficArchive',
             'FanficAuthors=ff_scrape.sites.fanficauthors:FanficAuthors',
             'Ficwad=ff_scrape.sites.ficwad:Ficwad',
-            'AnimationSource=ff_scrape.sites.animationsource:AnimationSource'
+            'AnimationSource=ff_scrape.sites.animationsource:AnimationSource',
+            'ArchiveofOurOwn=ff_scrape.sites.archiveofourown:ArchiveofOurOwn'
         ],
         'ff_scrape.formatters': [
             'text=ff_scrape.formatters.text:Text',
             'bbcode=ff_scrape.formatters.bbcode:BBCode'
         ],
-        # 'ff_scrape.recorders': [
-        #
-        # ]
+        'ff_scrape.recorders': [
+            'epub=ff_scrape.recorders.epub:Epub'
+        ]
     }
 )
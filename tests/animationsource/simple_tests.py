@@ -5,6 +5,7 @@ from ff_scrape.errors import URLError
 from testfixtures import ShouldRaise
 from bs4 import BeautifulSoup
 from os.path import dirname, join
+from datetime import datetime
 
 
 class FanfictionTests(unittest.TestCase):
@@ -73,6 +74,30 @@ class FanfictionTests(unittest.TestCase):
         self.assertTrue(self.fanfiction.check_story_exists(), "Good page shows as existing")
         page.close()
 
+    def test_probe_fields(self):
+        checks = [
+            ['good_story.html', datetime(2008, 3, 6), None],
+            ['good_story2.html', datetime(2017, 1, 6), None],
+            ['missing_story.html', None, None],
+        ]
+        for check in checks:
+            page = open(join(self.dir, 'data', check[0]), 'r', encoding='latin-1')
+            fields = self.fanfiction.extract_probe_fields(page.read())
+            page.close()
+            self.assertEqual(fields, (check[1], check[2]), 'Probe fields for ' + check[0])
+
+    def test_story_details(self):
+        checks = [
+            ['good_story.html', True],
+            ['good_story2.html', True],
+            ['missing_story.html', False],
+        ]
+        for check in checks:
+            page = open(join(self.dir, 'data', check[0]), 'r', encoding='latin-1')
+            soup = BeautifulSoup(page.read(), features="html.parser")
+            page.close()
+            self.assertEqual(self.fanfiction.story_details(soup) is not None, check[1], 'Details for ' + check[0])
+
 
 if __name__ == '__main__':
     unittest.main()
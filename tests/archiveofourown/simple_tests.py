@@ -1,10 +1,11 @@
 import unittest
-from ff_scrape.sites.archiveofourown import ArchiveofOurOwn
+from ff_scrape.sites.archiveofourown import ArchiveofOurOwn, ChapterSplitter, extract_chapter
 from ff_scrape.storybase import Story
 from ff_scrape.errors import URLError
 from testfixtures import ShouldRaise
 from bs4 import BeautifulSoup
 from os.path import dirname, join
+from datetime import datetime
 
 
 class FanfictionTests(unittest.TestCase):
@@ -75,6 +76,43 @@ class FanfictionTests(unittest.TestCase):
         self.assertTrue(self.fanfiction.check_story_exists(), "Good page shows as existing")
         page.close()
 
+    def test_probe_fields(self):
+        checks = [
+            ['good_story.html', datetime(2020, 6, 27), 23],
+            ['good_story2.html', datetime(2020, 6, 27), 1],
+            ['missing_story.html', None, None],
+        ]
+        for check in checks:
+            page = open(join(self.dir, 'data', check[0]), 'r', encoding='utf8')
+            fields = self.fanfiction.extract_probe_fields(page.read())
+            page.close()
+            self.assertEqual(fields, (check[1], check[2]), 'Probe fields for ' + check[0])
+
+    def test_chapter_splitter(self):
+        for name, count in [['good_story.html', 23], ['good_story3.html', 20]]:
+            page = open(join(self.dir, 'data', name), 'r', encoding='utf8')
+            text = page.read()
+            page.close()
+            splitter = ChapterSplitter()
+            sources = []
+            # small pieces so tags and entities get cut in half
+            for position in range(0, len(text), 1000):
+                splitter.feed(text[position:position + 1000])
+                sources.extend(splitter.take())
+            splitter.close()
+            sources.extend(splitter.take())
+            self.assertEqual(len(sources), count, 'Every chapter of ' + name)
+
+            soup = BeautifulSoup(text, features="html5lib")
+            for (chapter_id, source), tag in zip(sources, soup.find_all('div', {'class': 'chapter', 'id': True})):
+                self.assertEqual(chapter_id, tag.attrs['id'])
+                chapter = extract_chapter(source)
+                whole = tag.find_all(True, {'class': 'userstuff'})[0]
+                for heading in whole.find_all('h3', {'class': ['landmark', 'heading']}):
+                    heading.decompose()
+                self.assertEqual(chapter.word_count, len(whole.text.split()), 'Word count of ' + chapter_id)
+                self.assertTrue(chapter.name.startswith('Chapter'), 'Name of ' + chapter_id)
+
 
 if __name__ == '__main__':
     unittest.main()
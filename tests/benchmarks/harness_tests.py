@@ -0,0 +1,53 @@
+from benchmarks.harness import Benchmark, measure, run, compare, append_history, load_history
+import os
+import tempfile
+import unittest
+
+
+class HarnessTests(unittest.TestCase):
+
+    def test_measure_time(self):
+        calls = []
+        result = measure(Benchmark('count', lambda: calls.append(1), size=100), repeat=3, warmup=2)
+        self.assertEqual(len(calls), 5, 'Warmup runs are not measured')
+        self.assertEqual(result['repeat'], 3)
+        self.assertGreater(result['throughput'], 0, 'Throughput is reported for sized benchmarks')
+
+    def test_setup_is_passed(self):
+        seen = []
+        measure(Benchmark('setup', seen.append, setup=lambda: 'state'), repeat=2, warmup=0)
+        self.assertEqual(seen, ['state', 'state'], 'Every run gets a fresh setup')
+
+    def test_measure_memory(self):
+        result = measure(Benchmark('alloc', lambda: bytearray(1024 * 1024), kind='memory'))
+        self.assertGreaterEqual(result['retained'], 1024 * 1024, 'The returned value is retained')
+        self.assertGreaterEqual(result['peak'], result['retained'])
+
+    def test_errors_are_recorded(self):
+        results = run([Benchmark('broken', lambda: 1 / 0)], repeat=1)
+        self.assertIn('ZeroDivisionError', results['broken']['error'])
+
+    def test_compare(self):
+        baseline = {'slower': {'kind': 'time', 'median': 0.1},
+                    'noise': {'kind': 'time', 'median': 0.0001},
+                    'bigger': {'kind': 'memory', 'peak': 1000, 'retained': 0},
+                    'same': {'kind': 'time', 'median': 0.1}}
+        results = {'slower': {'kind': 'time', 'median': 0.2},
+                   'noise': {'kind': 'time', 'median': 0.0003},
+                   'bigger': {'kind': 'memory', 'peak': 1200, 'retained': 0},
+                   'same': {'kind': 'time', 'median': 0.105},
+                   'new': {'kind': 'time', 'median': 1.0}}
+        regressions = compare(results, baseline, threshold=0.10)
+        self.assertEqual(sorted(regression['name'] for regression in regressions), ['bigger', 'slower'])
+
+    def test_history(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'history.jsonl')
+            self.assertEqual(load_history(file_path), [], 'A missing history is empty')
+            append_history(file_path, {'results': {'a': 1}})
+            append_history(file_path, {'results': {'a': 2}})
+            self.assertEqual([record['results']['a'] for record in load_history(file_path)], [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import tempfile
+import shutil
+import io
+from os import path, listdir
+from contextlib import redirect_stdout, redirect_stderr
+from ff_scrape import scraper, cli
+from ff_scrape.storybase import Story, Chapter
+from ff_scrape.recorders.epub import Epub
+from ff_scrape.formatters.text import Text
+from tests.fakes import ExampleSite, register
+
+
+class BatchSite(ExampleSite):
+    """Site serving three chapter stories, story 0 does not exist"""
+    hostnames = ('batch.example.net',)
+
+    def __init__(self, site_params={}):
+        super().__init__(site_params=site_params)
+        self._chapter_sleep_time = 0
+
+    def get_meta(self) -> None:
+        story_id = self.story_key[1]
+        if story_id == '0':
+            raise ValueError("Story doesn't exist.")
+        self._fanfic = Story(self._url)
+        self._fanfic.title = 'Story ' + story_id
+        self._fanfic_set = True
+        self._got_meta = True
+
+    def record_story_chapters(self) -> None:
+        for number in range(1, 4):
+            chapter = Chapter()
+            chapter.name = 'Chapter %d' % number
+            chapter.processed_body = '<p>%d</p>' % number
+            self._fanfic.add_chapter(chapter)
+
+
+class CliTests(unittest.TestCase):
+
+    def setUp(self):
+        register(self, 'BatchSite', BatchSite)
+        register(self, 'epub', Epub, scraper.recorders)
+        self.directory = tempfile.mkdtemp()
+        self.input = path.join(self.directory, 'urls.txt')
+        with open(self.input, 'w') as input_file:
+            input_file.write("# reading list\n"
+                             "https://batch.example.net/s/1\n"
+                             "\n"
+                             "batch.example.net/s/2/3\n"
+                             "https://batch.example.net/s/1/2\n"
+                             "https://batch.example.net/s/0\n")
+        self.output = path.join(self.directory, 'archive')
+        self.backup = path.join(self.directory, 'backup')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_cli(self, *argv):
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            code = cli.main(list(argv))
+        return code, out.getvalue(), err.getvalue()
+
+    def test_read_urls(self):
+        self.assertEqual(list(cli._read_urls([" a \n", "\n", "# b\n", "c"])), ['a', 'c'])
+
+    def test_batch(self):
+        code, out, err = self.run_cli('--input', self.input, '--jobs', '2', '--output', self.output,
+                                      '--backup', self.backup)
+        self.assertEqual(code, 1, 'A failed story is reported in the exit code')
+        lines = sorted(out.splitlines())
+        self.assertEqual(lines, ['complete\t3\thttps://batch.example.net/s/1',
+                                 'complete\t3\thttps://batch.example.net/s/2',
+                                 'failed\t0\thttps://batch.example.net/s/0'])
+        self.assertIn('3 stories (2 complete, 1 failed), 6 chapters', err)
+        self.assertIn('stories/s', err)
+        self.assertEqual(sorted(listdir(self.output)), ['Story 1.epub', 'Story 2.epub'])
+        self.assertFalse(path.exists(self.backup), 'Nothing was replaced yet')
+
+        code, out, err = self.run_cli('--url', 'https://batch.example.net/s/1', '--output', self.output,
+                                      '--backup', self.backup)
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(listdir(self.output)), ['Story 1.epub', 'Story 2.epub'])
+        backups = listdir(self.backup)
+        self.assertEqual(len(backups), 1, 'The replaced copy is kept')
+        self.assertTrue(backups[0].startswith('Story 1 ') and backups[0].endswith('.epub'))
+
+    def test_recorder(self):
+        register(self, 'text', Text, scraper.formatters)
+        code, out, err = self.run_cli('--url', 'https://batch.example.net/s/1', '--formatter', 'text',
+                                      '--output', self.output)
+        self.assertEqual(code, 0)
+        self.assertEqual(listdir(self.output), ['Story 1.epub'], 'A formatter keeps the default recorder')
+        fanfic = scraper.ff_scrape(['https://batch.example.net/s/1'], formatter='text', recorder='epub',
+                                   output_dir=self.output)[0]
+        self.assertEqual([chapter.processed_body for chapter in fanfic.chapters], ['1', '2', '3'],
+                         'The formatter runs on the recorded chapters')
+
+        shutil.rmtree(self.output)
+        code, out, err = self.run_cli('--url', 'https://batch.example.net/s/1', '--recorder', 'none',
+                                      '--output', self.output)
+        self.assertEqual(code, 0)
+        self.assertFalse(path.exists(self.output), 'Nothing is written with the recorder turned off')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+from urllib.parse import SplitResult
+from ff_scrape import scraper
+from ff_scrape.plugins import LazyPlugins
+from ff_scrape.sites.base import Site
+
+
+class ExampleSite(Site):
+    """Base of the fake sites, serving stories at https://<first hostname>/s/<story id>"""
+    hostnames = ('example.org',)
+
+    def __init__(self, site_params={}):
+        super().__init__(logger_name='ff_scrape.site.' + self.__class__.__name__, site_params=site_params)
+
+    @classmethod
+    def canonicalize(cls, parts: SplitResult):
+        story_id = parts.path.split('/')[2]
+        return story_id, "https://%s/s/%s" % (cls.hostnames[0], story_id)
+
+
+def register(test, name: str, plugin, plugins: LazyPlugins = None) -> None:
+    """Registers a plugin, with the sites by default, for the duration of the test"""
+    plugins = scraper.processors if plugins is None else plugins
+    plugins.register(name, plugin)
+    test.addCleanup(plugins.unregister, name)
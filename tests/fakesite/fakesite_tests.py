@@ -0,0 +1,118 @@
+from ff_scrape.testing.fakesite import FakeSiteServer, FakeSiteTransport, Faults, latency
+from ff_scrape.testing.synthetic import synthetic_story
+from ff_scrape.sites.hpfanficarchive import HPFanficArchive
+from ff_scrape.fetch import Deadline, Fetcher, retry_after
+from ff_scrape.metrics import StoryMetrics
+from ff_scrape.errors import DeadlineError
+from email.utils import formatdate
+from os import path
+import random
+import time
+import unittest
+import requests
+
+TESTS = path.dirname(path.dirname(path.abspath(__file__)))
+
+
+class _Response(object):
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class FakeSiteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.story = synthetic_story('hpfanficarchive', chapters=4, words=100)
+
+    def serve(self, **faults) -> FakeSiteServer:
+        server = FakeSiteServer([self.story], faults=Faults(seed=1, **faults)).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_scrape_through_server(self):
+        server = self.serve(latency=latency('constant:0.01'))
+        processor = HPFanficArchive()
+        processor._chapter_sleep_time = 0
+        processor.fetcher = Fetcher(transport=FakeSiteTransport(server))
+        processor.url = self.story.url
+        processor.get_story()
+        self.assertEqual(processor.fanfic.scrape_status, 'complete')
+        self.assertEqual(processor.fanfic.chapter_count, 4)
+        self.assertEqual(server.stats, {'requests': 2, 'ok': 2})
+
+    def test_host_routing(self):
+        server = self.serve()
+        response = requests.get(server.url + '/stories/viewstory.php?sid=1',
+                                headers={'Host': 'www.hpfanficarchive.com'}, timeout=5)
+        self.assertEqual(response.text, self.story.page(self.story.url))
+        self.assertEqual(requests.get(server.local_url('http://www.hpfanficarchive.com/nothing'),
+                                      timeout=5).status_code, 404)
+
+    def test_fixtures(self):
+        server = self.serve()
+        served = dict(server.add_fixtures(TESTS))
+        url = served['fanfiction']
+        self.assertIsNotNone(server.page(url))
+        self.assertEqual(server.page(url.replace('/1', '/3')), server.page(url), 'Chapters get the fixture page')
+        self.assertIsNone(server.page(url.replace('/s/', '/s/1')), 'Other stories do not')
+
+    def test_unavailable_retried(self):
+        server = self.serve(unavailable=1.0, retry_after=0)
+        metrics = StoryMetrics()
+        fetcher = Fetcher(transport=FakeSiteTransport(server), retries=2)
+        response = fetcher.get(self.story.url, metrics=metrics)
+        self.assertEqual(response.status_code, 503, 'The last answer is returned once the retries are used up')
+        self.assertEqual(metrics.counts['retries'], 2)
+        self.assertEqual(server.stats['unavailable'], 3)
+        self.assertEqual(fetcher.retried, 2)
+
+    def test_rate_limit_honors_retry_after(self):
+        server = self.serve(rate_limit=2)
+        fetcher = Fetcher(transport=FakeSiteTransport(server), max_wait=0.6)
+        fetcher.get(self.story.url)
+        started = time.monotonic()
+        response = fetcher.get(self.story.url + '&chapter=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - started, 0.6, 'Waited before the retry')
+        self.assertEqual(server.stats['rate_limited'], 1)
+
+    def test_retry_past_deadline(self):
+        server = self.serve(unavailable=1.0, retry_after=30)
+        fetcher = Fetcher(transport=FakeSiteTransport(server))
+        with self.assertRaises(DeadlineError):
+            fetcher.get(self.story.url, deadline=Deadline(5))
+
+    def test_truncated_body(self):
+        server = self.serve(truncate=1.0)
+        fetcher = Fetcher(transport=FakeSiteTransport(server), retries=1, backoff=0)
+        with self.assertRaises(requests.RequestException):
+            fetcher.get(self.story.url)
+        self.assertEqual(server.stats['truncated'], 2)
+
+    def test_connection_reset(self):
+        server = self.serve(reset=1.0)
+        fetcher = Fetcher(transport=FakeSiteTransport(server), retries=1, backoff=0)
+        with self.assertRaises(requests.ConnectionError):
+            fetcher.get(self.story.url)
+        self.assertEqual(server.stats['reset'], 2)
+
+    def test_faults_recover(self):
+        server = self.serve(reset=0.3, truncate=0.3)
+        fetcher = Fetcher(transport=FakeSiteTransport(server), retries=10, backoff=0)
+        response = fetcher.get(self.story.url)
+        self.assertEqual(response.text, self.story.page(self.story.url))
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after(_Response({'Retry-After': '7'}), 1), 7)
+        self.assertEqual(retry_after(_Response({}), 1), 1)
+        self.assertEqual(retry_after(_Response({'Retry-After': 'soon'}), 1), 1)
+        later = retry_after(_Response({'Retry-After': formatdate(time.time() + 100, usegmt=True)}), 1)
+        self.assertTrue(95 < later <= 100)
+
+    def test_latency(self):
+        generator = random.Random(0)
+        self.assertEqual(latency('constant:0.5')(generator), 0.5)
+        self.assertTrue(0.1 <= latency('uniform:0.1,0.2')(generator) <= 0.2)
+        self.assertGreater(latency('lognormal:0.05,0.5')(generator), 0)
+        with self.assertRaises(ValueError):
+            latency('gaussian:1')
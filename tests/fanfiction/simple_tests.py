@@ -5,6 +5,7 @@ from ff_scrape.errors import URLError
 from testfixtures import ShouldRaise
 from bs4 import BeautifulSoup
 from os.path import dirname, join
+from datetime import datetime
 
 
 class FanfictionTests(unittest.TestCase):
@@ -71,6 +72,18 @@ class FanfictionTests(unittest.TestCase):
         self.assertTrue(self.fanfiction.check_story_exists(), "Good page shows as existing")
         page.close()
 
+    def test_probe_fields(self):
+        checks = [
+            ['good_story.html', datetime.fromtimestamp(1589598153), 12],
+            ['good_story4.html', datetime.fromtimestamp(1208137433), 1],
+            ['missing_story.html', None, None],
+        ]
+        for check in checks:
+            page = open(join(self.dir, 'data', check[0]), 'r')
+            fields = self.fanfiction.extract_probe_fields(page.read())
+            page.close()
+            self.assertEqual(fields, (check[1], check[2]), 'Probe fields for ' + check[0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,6 +5,7 @@ from ff_scrape.errors import URLError
 from testfixtures import ShouldRaise
 from bs4 import BeautifulSoup
 from os.path import dirname, join
+from datetime import datetime
 
 
 class FanfictionTests(unittest.TestCase):
@@ -50,6 +51,9 @@ class FanfictionTests(unittest.TestCase):
             ["http://www.hpfanficarchive.com/stories", "Unknown URL format"],
             ["http://www.hpfanficarchive.com/stories/viewstory.php", "Unknown URL format"],
             ["http://www.hpfanficarchive.com/", "Unknown URL format"],
+            ["http://www.hpfanficarchive.com/stories/viewuser.php?uid=587", "Unknown URL format"],
+            ["http://www.hpfanficarchive.com/stories/browse.php?sid=270", "Unknown URL format"],
+            ["http://www.hpfanficarchive.com/other/viewstory.php?sid=270", "Unknown URL format"],
         ]
 
         for check in good_checks:
@@ -74,6 +78,18 @@ class FanfictionTests(unittest.TestCase):
         self.assertTrue(self.fanfiction.check_story_exists(), "Good page shows as existing")
         page.close()
 
+    def test_probe_fields(self):
+        checks = [
+            ['good_story.html', datetime(2012, 3, 4), 86],
+            ['good_story2.html', datetime(2012, 6, 24), 3],
+            ['missing_story.html', None, None],
+        ]
+        for check in checks:
+            page = open(join(self.dir, 'data', check[0]), 'r')
+            fields = self.fanfiction.extract_probe_fields(page.read())
+            page.close()
+            self.assertEqual(fields, (check[1], check[2]), 'Probe fields for ' + check[0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import tempfile
+import shutil
+from os import path
+from ff_scrape.jobqueue import JobQueue, Worker
+from ff_scrape.routing import CanonicalizationReport, CanonicalURL
+from ff_scrape.storybase import Story
+
+NOW = 1600000000.0
+
+
+def _report(*story_ids):
+    report = CanonicalizationReport()
+    for story_id in story_ids:
+        canonical = CanonicalURL('Site', story_id, 'https://example.org/s/' + story_id)
+        report.results.append((canonical.url, canonical))
+    return report
+
+
+class JobQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = path.join(self.directory, 'queue.db')
+        self.queue = JobQueue(self.path, lease_time=60, max_attempts=3, backoff=10, max_backoff=15)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def test_lease_and_ack(self):
+        self.assertEqual(self.queue.add(_report('1', '2', '1'), now=NOW), 2)
+        self.assertEqual(self.queue.add(_report('2'), now=NOW), 0, 'Queued stories are only added once')
+
+        # a second connection stands in for another worker process
+        other = JobQueue(self.path, lease_time=60)
+        first = self.queue.lease('a', now=NOW)
+        second = other.lease('b', now=NOW)
+        self.assertEqual([job.story_id for job in first + second], ['1', '2'], 'Workers never share a job')
+        self.assertEqual(other.lease('b', now=NOW), [])
+        self.assertEqual(self.queue.counts(), {'queued': 0, 'leased': 2, 'dead': 0})
+
+        self.assertFalse(other.ack(first[0], 'b'), 'Only the owner acknowledges a job')
+        self.assertTrue(self.queue.ack(first[0], 'a'))
+        self.assertEqual(self.queue.counts()['leased'], 1)
+        other.close()
+
+    def test_expired_lease(self):
+        self.queue.add(_report('1'), now=NOW)
+        job = self.queue.lease('a', now=NOW)[0]
+        self.assertTrue(self.queue.heartbeat(job, 'a', now=NOW + 50))
+        self.assertEqual(self.queue.lease('b', now=NOW + 100), [], 'The heartbeat extended the lease')
+
+        taken = self.queue.lease('b', now=NOW + 111)
+        self.assertEqual(taken[0].attempts, 2, 'An expired lease is handed to the next worker')
+        self.assertFalse(self.queue.heartbeat(job, 'a', now=NOW + 112), 'The old owner lost the job')
+        self.assertFalse(self.queue.fail(job, 'a', 'late', now=NOW + 112))
+
+    def test_backoff_and_dead_letters(self):
+        self.queue.add(_report('1'), now=NOW)
+        job = self.queue.lease('a', now=NOW)[0]
+        self.queue.fail(job, 'a', 'HTTP 503', now=NOW)
+        self.assertEqual(self.queue.lease('a', now=NOW + 9), [], 'Retried after the backoff')
+        job = self.queue.lease('a', now=NOW + 10)[0]
+        self.queue.fail(job, 'a', 'HTTP 503', now=NOW + 10)
+        self.assertEqual(self.queue.lease('a', now=NOW + 24), [], 'Backoff doubles up to the maximum')
+        job = self.queue.lease('a', now=NOW + 25)[0]
+        self.assertEqual(job.attempts, 3)
+        self.queue.fail(job, 'a', 'HTTP 503', now=NOW + 25)
+
+        self.assertEqual(self.queue.counts(), {'queued': 0, 'leased': 0, 'dead': 1})
+        self.assertEqual(self.queue.dead_letters(), [('https://example.org/s/1', 3, 'HTTP 503')])
+        self.assertEqual(self.queue.requeue_dead_letters(now=NOW + 30), 1)
+        self.assertEqual(self.queue.lease('a', now=NOW + 30)[0].attempts, 1)
+
+    def test_worker(self):
+        self.queue.add(_report('good', 'partial', 'broken'))
+        scraped = []
+
+        def scrape(canonical: CanonicalURL) -> Story:
+            scraped.append(canonical.story_id)
+            if canonical.story_id == 'broken':
+                raise ValueError("Story doesn't exist.")
+            fanfic = Story(canonical.url)
+            fanfic.scrape_status = 'complete' if canonical.story_id == 'good' else 'partial'
+            return fanfic
+
+        worker = Worker(self.queue, scrape, heartbeat_interval=0.01)
+        while worker.run_once() is not None:
+            pass
+        self.assertEqual(sorted(scraped), ['broken', 'good', 'partial'])
+        self.assertEqual(self.queue.counts(), {'queued': 2, 'leased': 0, 'dead': 0},
+                         'Incomplete and failed stories are retried')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import tempfile
+import shutil
+from os import path
+from ff_scrape.journal import ChapterJournal, StoryCheckpoint
+from ff_scrape.storybase import Story, Chapter
+from tests.fakes import ExampleSite
+
+
+class FlakySite(ExampleSite):
+    """Site whose chapter downloads can be made to fail"""
+    hostnames = ('example.org',)
+
+    def __init__(self, site_params={}):
+        super().__init__(site_params=site_params)
+        self._chapter_sleep_time = 0
+        self.chapter_list = []
+        self.downloaded = []
+        self.fail_at = None
+
+    def get_meta(self) -> None:
+        self._fanfic = Story(self._url)
+        self._fanfic_set = True
+        self._got_meta = True
+
+    def record_story_chapters(self) -> None:
+        for chapter in self.chapter_list:
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        if chapter['link'] == self.fail_at:
+            raise ConnectionError("connection reset")
+        self.downloaded.append(chapter['link'])
+        chapter_object = Chapter()
+        chapter_object.name = chapter['name']
+        chapter_object.processed_body = '<p>%s</p>' % chapter['link']
+        chapter_object.word_count = 1
+        return chapter_object
+
+
+def _chapters(*links):
+    return [{'name': 'Chapter ' + link, 'link': link} for link in links]
+
+
+class JournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.site = FlakySite()
+        self.site.journal = ChapterJournal(self.directory)
+        self.site.url = 'https://example.org/s/42'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        self.site.chapter_list = _chapters('1', '2', '3', '4')
+        self.site.fail_at = '3'
+        with self.assertRaises(ConnectionError):
+            self.site.get_story()
+        self.assertEqual(self.site.downloaded, ['1', '2'])
+        self.assertTrue(path.exists(self.site.journal.path(self.site.story_key)), 'Journal kept after failure')
+
+        self.site.fail_at = None
+        self.site.get_story()
+        self.assertEqual(self.site.downloaded, ['1', '2', '3', '4'], 'Checkpointed chapters are not downloaded again')
+        self.assertEqual([chapter.name for chapter in self.site.fanfic.chapters],
+                         ['Chapter 1', 'Chapter 2', 'Chapter 3', 'Chapter 4'])
+        self.assertEqual(self.site.fanfic.chapters[1].processed_body, '<p>2</p>')
+        self.assertFalse(path.exists(self.site.journal.path(self.site.story_key)), 'Journal removed once complete')
+
+    def test_changed_chapter_list(self):
+        self.site.chapter_list = _chapters('1', '2', '3')
+        self.site.fail_at = '3'
+        with self.assertRaises(ConnectionError):
+            self.site.get_story()
+
+        # a chapter was inserted before the second one, later checkpoints no longer line up
+        self.site.chapter_list = _chapters('1', '1b', '2', '3')
+        self.site.fail_at = None
+        self.site.get_story()
+        self.assertEqual(self.site.downloaded, ['1', '2', '1b', '2', '3'])
+        self.assertEqual(self.site.fanfic.chapter_count, 4)
+
+    def test_truncated_record(self):
+        self.site.chapter_list = _chapters('1', '2', '3')
+        self.site.fail_at = '3'
+        with self.assertRaises(ConnectionError):
+            self.site.get_story()
+        with open(self.site.journal.path(self.site.story_key), 'a', encoding='utf-8') as journal:
+            journal.write('{"index": 2, "entry": {"na')
+
+        self.site.fail_at = None
+        self.site.get_story()
+        self.assertEqual(self.site.downloaded, ['1', '2', '3'])
+
+    def test_save_after_torn_record(self):
+        file_path = path.join(self.directory, 'torn.jsonl')
+        chapter = Chapter()
+        chapter.name = 'Chapter'
+        checkpoint = StoryCheckpoint(file_path)
+        checkpoint.save(0, {'link': '1'}, chapter)
+        checkpoint.close()
+        with open(file_path, 'a', encoding='utf-8') as journal:
+            journal.write('{"index": 1, "entry": {"li')
+
+        checkpoint = StoryCheckpoint(file_path)
+        self.assertEqual(len(checkpoint), 1)
+        checkpoint.save(1, {'link': '2'}, chapter)
+        checkpoint.close()
+        checkpoint = StoryCheckpoint(file_path)
+        self.assertIsNotNone(checkpoint.load(0, {'link': '1'}))
+        self.assertIsNotNone(checkpoint.load(1, {'link': '2'}), 'The record after the torn one is kept')
+        checkpoint.close()
+
+    def test_bodies_read_back(self):
+        file_path = path.join(self.directory, 'bodies.jsonl')
+        checkpoint = StoryCheckpoint(file_path)
+        for number in ('1', '2'):
+            chapter = Chapter()
+            chapter.name = 'Chapter ' + number
+            chapter.raw_body = '<p>Ünïcode %s</p>' % number
+            chapter.processed_body = '<p>body %s</p>' % number
+            checkpoint.save(int(number), {'link': number}, chapter)
+        self.assertNotIn('body', repr(checkpoint._records), 'The bodies are not kept in memory')
+        self.assertEqual(checkpoint.load(2, {'link': '2'}).raw_body, '<p>Ünïcode 2</p>')
+        checkpoint.close()
+
+        checkpoint = StoryCheckpoint(file_path)
+        self.assertEqual(checkpoint.load(1, {'link': '1'}).processed_body, '<p>body 1</p>')
+        self.assertEqual(checkpoint.load(2, {'link': '2'}).raw_body, '<p>Ünïcode 2</p>')
+        self.assertIsNone(checkpoint.load(2, {'link': '3'}))
+        checkpoint.close()
+
+    def test_without_journal(self):
+        self.site.journal = None
+        self.site.chapter_list = _chapters('1', '2')
+        self.site.get_story()
+        self.site.get_story()
+        self.assertEqual(self.site.downloaded, ['1', '2', '1', '2'])
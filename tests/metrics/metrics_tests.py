@@ -0,0 +1,133 @@
+import unittest
+import threading
+import time
+import json
+from ff_scrape.metrics import StoryMetrics, MetricsRegistry, json_line
+from ff_scrape.fetch import Fetcher
+from ff_scrape.storybase import Chapter
+from ff_scrape.recorders.base import Recorder
+from tests.fakes import ExampleSite
+
+PAGE = "<html><body><h1>Title</h1><div id='text'><p>one two three</p></div></body></html>"
+
+
+class FakeResponse(object):
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('utf-8')
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, cookies=None, timeout=None):
+        self.requests += 1
+        return FakeResponse(PAGE)
+
+
+class RedirectedSession(FakeSession):
+    """Answers every request after two redirects"""
+    def get(self, url, cookies=None, timeout=None):
+        response = super().get(url, cookies, timeout)
+        response.history = [FakeResponse(''), FakeResponse('')]
+        return response
+
+
+class PagedSite(ExampleSite):
+    """Site with two chapters on separate pages"""
+    hostnames = ('paged.example.net',)
+
+    def __init__(self, site_params={}):
+        super().__init__(site_params=site_params)
+        self._chapter_sleep_time = 0.01
+
+    def record_story_metadata(self) -> None:
+        self._fanfic.title = self._soup.find('h1').text
+
+    def record_story_chapters(self) -> None:
+        for chapter in [{'link': '1'}, {'link': '2'}]:
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        self._pause(self._chapter_sleep_time)
+        self._update_soup(url=self._url + '/' + chapter['link'])
+        chapter_object = Chapter()
+        chapter_object.processed_body = self._prettify(self._soup.find(id='text'))
+        return chapter_object
+
+
+class MetricsTests(unittest.TestCase):
+
+    def test_nested_phases(self):
+        metrics = StoryMetrics()
+        with metrics.phase('extract'):
+            time.sleep(0.02)
+            with metrics.phase('network'):
+                time.sleep(0.05)
+        self.assertGreaterEqual(metrics.timings['network'], 0.05)
+        self.assertLess(metrics.timings['extract'], 0.05, 'Nested phases are not counted twice')
+        self.assertGreaterEqual(metrics.timings['extract'], 0.02)
+
+    def test_story_metrics(self):
+        site = PagedSite()
+        session = FakeSession()
+        site.fetcher = Fetcher(transport=session)
+        site.url = 'https://paged.example.net/s/1'
+        site.get_story(recorders=[Recorder()])
+        metrics = site.fanfic.metrics
+
+        self.assertIs(metrics, site.metrics)
+        self.assertEqual(metrics.site, 'PagedSite')
+        self.assertEqual(metrics.counts, {'requests': 3, 'chapters': 2})
+        self.assertEqual(metrics.bytes['in'], 3 * len(PAGE))
+        self.assertGreater(metrics.bytes['out'], 0)
+        self.assertEqual(set(metrics.timings), {'network', 'parse', 'extract', 'sleep', 'prettify', 'record'})
+        self.assertGreaterEqual(metrics.timings['sleep'], 0.02)
+        self.assertGreaterEqual(metrics.duration, sum(metrics.timings.values()) - 0.001)
+
+        record = json.loads(json_line(site.fanfic.url, site.fanfic.scrape_status, metrics))
+        self.assertEqual((record['site'], record['scrape_status'], record['counts']['requests']),
+                         ('PagedSite', 'complete', 3))
+
+        site.url = 'https://paged.example.net/s/2'
+        site.get_story()
+        self.assertEqual(site.fanfic.metrics.counts['requests'], 3, 'Every story starts with fresh metrics')
+
+    def test_redirects(self):
+        metrics = StoryMetrics()
+        fetcher = Fetcher(transport=RedirectedSession())
+        fetcher.get('http://paged.example.net/s/1', metrics=metrics)
+        self.assertEqual(metrics.counts, {'requests': 1, 'redirects': 2})
+
+    def test_session_cookies(self):
+        fetcher = Fetcher()
+        before = fetcher.session
+        fetcher.set_cookie('view_adult', 'true', 'paged.example.net')
+        self.assertIs(fetcher.session, before)
+        self.assertEqual(before.cookies.get('view_adult', domain='paged.example.net'), 'true')
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(fetcher.session))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], before)
+        self.assertEqual(sessions[0].cookies.get('view_adult', domain='paged.example.net'), 'true')
+
+    def test_prometheus(self):
+        registry = MetricsRegistry()
+        for status in ['complete', 'complete', 'partial']:
+            metrics = StoryMetrics(site='Fanfiction')
+            metrics.count('requests', 4)
+            metrics.add_bytes('in', 1000)
+            metrics.add_time('network', 0.5)
+            registry.add(status, metrics)
+        text = registry.prometheus()
+        self.assertIn('# TYPE ff_scrape_stories_total counter\n', text)
+        self.assertIn('ff_scrape_stories_total{site="Fanfiction",status="complete"} 2\n', text)
+        self.assertIn('ff_scrape_events_total{site="Fanfiction",event="requests"} 12\n', text)
+        self.assertIn('ff_scrape_bytes_total{site="Fanfiction",direction="in"} 3000\n', text)
+        self.assertIn('ff_scrape_phase_seconds_total{site="Fanfiction",phase="network"} 1.5\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from ff_scrape.recorders.epub import Epub
+from ff_scrape.storybase import Story, Chapter
+from datetime import datetime
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+from xml.etree import ElementTree
+import zipfile
+
+
+class EpubTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = TemporaryDirectory()
+        self.dir = self.temp.name
+        self.fanfic = Story("https://www.fanfiction.net/s/1234/1")
+        self.fanfic.title = 'A Story: With <Symbols>'
+        self.fanfic.add_author('Someone', 'https://www.fanfiction.net/u/1/')
+        self.fanfic.summary = 'Things & stuff'
+        self.fanfic.add_genre('Adventure')
+        self.fanfic.published = datetime(2012, 9, 8, 19, 10, 27)
+        self.fanfic.updated = datetime(2020, 5, 15, 23, 2, 33)
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def _chapter(self, number):
+        chapter = Chapter()
+        chapter.name = "{}. Chapter {}".format(number, number)
+        chapter.processed_body = "<p>Text of chapter {}</p>".format(number)
+        chapter.raw_body = "<html><p>Text of chapter {}</p></html>".format(number)
+        chapter.word_count = 4
+        return chapter
+
+    def test_streaming(self):
+        recorder = Epub(self.dir)
+        recorder.start(self.fanfic)
+        self.fanfic.add_chapter_listener(recorder.add_chapter)
+        for number in range(1, 4):
+            self.fanfic.add_chapter(self._chapter(number))
+        self.assertEqual(self.fanfic.chapters[0].processed_body, '', 'Chapter bodies are released once written')
+        self.assertEqual(self.fanfic.word_count, 12, 'Word counts are kept')
+        self.assertTrue(listdir(self.dir)[0].endswith('.part'), 'Book is written to a temporary file')
+        recorder.finish()
+
+        self.assertEqual(listdir(self.dir), ['A Story With Symbols - Someone.epub'], 'Only the final file remains')
+        book = zipfile.ZipFile(join(self.dir, 'A Story With Symbols - Someone.epub'))
+        first = book.infolist()[0]
+        self.assertEqual(first.filename, 'mimetype', 'mimetype is the first entry')
+        self.assertEqual(first.compress_type, zipfile.ZIP_STORED, 'mimetype is not compressed')
+        self.assertEqual(book.read('mimetype'), b'application/epub+zip')
+
+        package = ElementTree.fromstring(book.read('OEBPS/content.opf'))
+        namespaces = {'opf': 'http://www.idpf.org/2007/opf', 'dc': 'http://purl.org/dc/elements/1.1/'}
+        self.assertEqual(package.find('opf:metadata/dc:title', namespaces).text, 'A Story: With <Symbols>')
+        self.assertEqual(package.find('opf:metadata/dc:creator', namespaces).text, 'Someone')
+        self.assertEqual(len(package.findall('opf:spine/opf:itemref', namespaces)), 3, 'All chapters are in the spine')
+
+        ElementTree.fromstring(book.read('OEBPS/nav.xhtml'))
+        chapter = ElementTree.fromstring(book.read('OEBPS/chapter_0002.xhtml'))
+        self.assertIn('Text of chapter 2', ElementTree.tostring(chapter, encoding='unicode'))
+
+    def test_abort(self):
+        recorder = Epub(self.dir)
+        recorder.start(self.fanfic)
+        recorder.add_chapter(self._chapter(1))
+        recorder.abort()
+        self.assertEqual(listdir(self.dir), [], 'Partial output is removed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from ff_scrape.testing.replay import Cassette, RecordingSession, ReplaySession
+from ff_scrape.testing.synthetic import SyntheticSession, synthetic_story
+from ff_scrape.sites.hpfanficarchive import HPFanficArchive
+from ff_scrape.fetch import Fetcher, DomainLimits
+from ff_scrape.errors import ReplayError
+from os import path
+import tempfile
+import time
+import unittest
+
+
+def scrape(transport, url):
+    processor = HPFanficArchive()
+    # the default pause between chapters is kept, replaying skips it
+    processor.fetcher = Fetcher(transport=transport)
+    processor.url = url
+    processor.get_story()
+    return processor.fanfic
+
+
+class ReplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = path.join(self.directory.name, 'story.zip')
+        self.story = synthetic_story('hpfanficarchive', chapters=6, words=200)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self):
+        with Cassette.recording(self.archive) as cassette:
+            recorded = scrape(RecordingSession(cassette, session=SyntheticSession(self.story)), self.story.url)
+        return recorded, cassette
+
+    def test_replay_matches_recording(self):
+        recorded, cassette = self.record()
+        self.assertEqual(len(cassette), 2, 'The index and the printable view are recorded')
+        started = time.monotonic()
+        replayed = scrape(ReplaySession.load(self.archive), self.story.url)
+        self.assertLess(time.monotonic() - started, 3, 'No pauses between chapters while replaying')
+        self.assertEqual(replayed.title, recorded.title)
+        self.assertEqual([chapter.processed_body for chapter in replayed.chapters],
+                         [chapter.processed_body for chapter in recorded.chapters])
+
+    def test_archive_is_deterministic(self):
+        self.record()
+        with open(self.archive, 'rb') as archive:
+            first = archive.read()
+        second_path = path.join(self.directory.name, 'again.zip')
+        Cassette.load(self.archive).save(second_path)
+        with open(second_path, 'rb') as archive:
+            self.assertEqual(archive.read(), first, 'The same traffic gives the same archive')
+
+    def test_unrecorded_request(self):
+        replay = ReplaySession(Cassette())
+        with self.assertRaises(ReplayError):
+            replay.get('http://www.hpfanficarchive.com/stories/viewstory.php?sid=2')
+        self.assertEqual(ReplaySession(Cassette(), strict=False).get('http://example.net/').status_code, 404)
+
+    def test_repeated_requests_in_order(self):
+        cassette = Cassette()
+        cassette.record('http://example.net/', 503, {'Retry-After': '1', 'Set-Cookie': 'a=b'}, b'busy')
+        cassette.record('http://example.net/', 200, {'Content-Type': 'text/html; charset=latin-1'}, b'caf\xe9')
+        replay = ReplaySession(cassette)
+        first = replay.get('http://example.net/')
+        self.assertEqual((first.status_code, first.headers), (503, {'retry-after': '1'}))
+        self.assertEqual(replay.get('http://example.net/').text, 'caf\xe9')
+        self.assertEqual(replay.get('http://example.net/').status_code, 200, 'The last response repeats')
+        replay.rewind()
+        self.assertEqual(replay.get('http://example.net/').status_code, 503)
+
+    def test_limits_skipped(self):
+        fetcher = Fetcher(limits=DomainLimits(interval=5), transport=SyntheticSession(self.story))
+        started = time.monotonic()
+        for url in self.story.urls():
+            fetcher.get(url)
+        self.assertLess(time.monotonic() - started, 3, 'Request spacing only applies to real requests')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import time
+from ff_scrape import scraper
+from ff_scrape.errors import DeadlineError
+from ff_scrape.fetch import Deadline, Fetcher
+from ff_scrape.storybase import Story, Chapter
+from tests.fakes import ExampleSite, register
+
+
+class SlowSite(ExampleSite):
+    """Site whose chapters each take a while to arrive"""
+    hostnames = ('slow.example.net',)
+
+    def __init__(self, site_params={}):
+        super().__init__(site_params=site_params)
+        self._chapter_sleep_time = 0.05
+        self.chapter_list = [{'link': str(number)} for number in range(1, 11)]
+
+    def get_meta(self) -> None:
+        if self._deadline is not None:
+            self._deadline.check()
+        self._fanfic = Story(self._url)
+        self._fanfic_set = True
+        self._got_meta = True
+
+    def record_story_chapters(self) -> None:
+        for chapter in self.chapter_list:
+            self._add_chapter(chapter, lambda: self._download_chapter(chapter))
+
+    def _download_chapter(self, chapter: dict) -> Chapter:
+        self._pause(self._chapter_sleep_time)
+        chapter_object = Chapter()
+        chapter_object.name = chapter['link']
+        return chapter_object
+
+
+class FakeResponse(object):
+    def __init__(self, url):
+        self.content = url.encode('utf-8')
+
+
+class FakeSession(object):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.timeouts = []
+
+    def get(self, url, cookies=None, timeout=None):
+        self.timeouts.append(timeout)
+        if self.delay > timeout[1]:
+            time.sleep(timeout[1])
+            raise TimeoutError("read timed out")
+        return FakeResponse(url)
+
+
+class DeadlineTests(unittest.TestCase):
+
+    def setUp(self):
+        register(self, 'SlowSite', SlowSite)
+
+    def test_deadline(self):
+        first = Deadline(60)
+        second = Deadline(0)
+        self.assertIs(Deadline.earliest(first, None, second), second)
+        self.assertIsNone(Deadline.earliest(None, None))
+        self.assertGreater(first.remaining(), 59)
+        self.assertEqual(second.remaining(), 0.0)
+        first.check()
+        with self.assertRaises(DeadlineError):
+            second.check()
+
+    def test_request_timeouts(self):
+        session = FakeSession()
+        fetcher = Fetcher(timeout=(5.0, 30.0), transport=session)
+        fetcher.get('https://slow.example.net/a')
+        fetcher.get('https://slow.example.net/b', deadline=Deadline(1.0))
+        self.assertEqual(session.timeouts[0], (5.0, 30.0))
+        self.assertLessEqual(session.timeouts[1][0], 1.0, 'The deadline shortens the connect timeout')
+        self.assertLessEqual(session.timeouts[1][1], 1.0, 'The deadline shortens the read timeout')
+
+        session.delay = 10.0
+        with self.assertRaises(DeadlineError):
+            fetcher.get('https://slow.example.net/c', deadline=Deadline(0.05))
+        with self.assertRaises(DeadlineError):
+            fetcher.get('https://slow.example.net/d', deadline=Deadline(0))
+        self.assertEqual(len(session.timeouts), 3, 'No request is sent once the deadline passed')
+
+    def test_partial_story(self):
+        site = SlowSite()
+        site.url = 'https://slow.example.net/s/1'
+        with self.assertRaises(DeadlineError):
+            site.get_story(deadline=Deadline(0.18))
+        self.assertEqual(site.fanfic.scrape_status, 'partial')
+        self.assertGreater(site.fanfic.chapter_count, 0)
+        self.assertLess(site.fanfic.chapter_count, 10)
+        self.assertIsNone(site.deadline, 'The deadline only applies to its story')
+
+        site.url = 'https://slow.example.net/s/2'
+        site._chapter_sleep_time = 0
+        site.get_story()
+        self.assertEqual(site.fanfic.scrape_status, 'complete')
+        self.assertEqual(site.fanfic.chapter_count, 10)
+
+    def test_batch_timeouts(self):
+        stories = scraper.ff_scrape(["https://slow.example.net/s/3"], story_timeout=0.18)
+        self.assertEqual(stories[0].scrape_status, 'partial')
+        self.assertLess(stories[0].chapter_count, 10)
+
+        started = time.monotonic()
+        stories = scraper.ff_scrape(["https://slow.example.net/s/%d" % number for number in range(4, 8)],
+                                    jobs=2, batch_timeout=0.18)
+        self.assertLess(time.monotonic() - started, 2.0, 'The batch stops at its deadline')
+        self.assertEqual([fanfic.scrape_status for fanfic in stories[0:2]], ['partial', 'partial'])
+        self.assertNotIn('complete', [fanfic.scrape_status for fanfic in stories])
+
+        stories = scraper.ff_scrape(["https://slow.example.net/s/8", "https://slow.example.net/s/9"], batch_timeout=0)
+        self.assertEqual([fanfic.scrape_status for fanfic in stories], ['cancelled', 'cancelled'])
+        self.assertEqual(stories[1].url, "https://slow.example.net/s/9")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import threading
+import time
+from ff_scrape import scraper
+from ff_scrape.errors import DeadlineError
+from ff_scrape.fetch import Deadline, SingleFlight
+from ff_scrape.storybase import Story
+from tests.fakes import ExampleSite, register
+
+
+class CountingSite(ExampleSite):
+    """Site that records how often each story is scraped"""
+    hostnames = ('example.org',)
+    scraped = []
+    lock = threading.Lock()
+
+    def get_story(self, recorders=None, deadline=None) -> None:
+        with self.lock:
+            self.scraped.append(self._url)
+        self._fanfic = Story(self._url)
+        self._fanfic_set = True
+
+
+class DedupTests(unittest.TestCase):
+
+    def setUp(self):
+        CountingSite.scraped = []
+        register(self, 'CountingSite', CountingSite)
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'page'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('url', work)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do('url', work))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while flight.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1, 'Overlapping calls run once')
+        self.assertEqual(results, ['page'] * 4, 'All callers get the result')
+        self.assertEqual(flight.do('url', lambda: 'again'), 'again', 'Finished calls are not cached')
+
+    def test_single_flight_error(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do('url', lambda: int('x'))
+
+    def test_single_flight_follower_deadline(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def work():
+            started.set()
+            release.wait(5)
+            return 'page'
+
+        leader = threading.Thread(target=lambda: flight.do('url', work))
+        leader.start()
+        started.wait(5)
+        begin = time.monotonic()
+        with self.assertRaises(DeadlineError):
+            flight.do('url', work, Deadline(0.05))
+        self.assertLess(time.monotonic() - begin, 2, 'The follower stops waiting at its own deadline')
+        release.set()
+        leader.join(5)
+
+    def test_single_flight_leader_deadline(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+        results = []
+
+        def expire():
+            started.set()
+            release.wait(5)
+            raise DeadlineError("Deadline exceeded")
+
+        def leader():
+            try:
+                flight.do('url', expire)
+            except DeadlineError as error:
+                errors.append(error)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flight.do('url', lambda: 'page', Deadline(5))))
+        follower.start()
+        while flight.coalesced < 1:
+            time.sleep(0.001)
+        release.set()
+        for waiting in [thread, follower]:
+            waiting.join(5)
+
+        self.assertEqual(len(errors), 1, 'The leader gets its own deadline error')
+        self.assertEqual(results, ['page'], 'A follower with time left runs the call again')
+
+    def test_batch_dedup(self):
+        for jobs in [1, 4]:
+            CountingSite.scraped = []
+            stories = scraper.ff_scrape([
+                "https://example.org/s/1/2/Title",
+                "http://example.org/s/1",
+                "https://www.example.org/s/2",
+                "example.org/s/1/5",
+                "https://unknown.example.com/s/1",
+            ], jobs=jobs)
+            self.assertEqual(sorted(CountingSite.scraped), ["https://example.org/s/1", "https://example.org/s/2"],
+                             'Each story is scraped once with {} jobs'.format(jobs))
+            self.assertEqual(len(stories), 4, 'Every usable URL gets a story')
+            self.assertIs(stories[0], stories[1], 'Duplicates share the result')
+            self.assertIs(stories[0], stories[3], 'Duplicates share the result')
+            self.assertEqual(stories[2].url, "https://example.org/s/2")
+
+
+if __name__ == '__main__':
+    unittest.main()
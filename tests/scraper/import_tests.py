@@ -0,0 +1,43 @@
+import unittest
+import subprocess
+import sys
+import json
+from os import environ
+from os.path import dirname
+
+# modules that must only be imported once a page is actually fetched or formatted
+HEAVY_MODULES = ['bs4', 'html5lib', 'requests', 'dateutil', 'html2bbcode', 'pkg_resources']
+
+# generous default so slow CI machines do not flap, tighten locally with the environment variable
+IMPORT_BUDGET_MS = float(environ.get('FF_SCRAPE_IMPORT_BUDGET_MS', '150'))
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True,
+                          cwd=dirname(dirname(dirname(__file__))))
+
+
+class ImportTests(unittest.TestCase):
+
+    def test_no_heavy_imports(self):
+        for module in ['ff_scrape.scraper', 'ff_scrape.cli']:
+            result = _run("import sys, json, {}; print(json.dumps({}))".format(
+                module, "[m for m in {} if m in sys.modules]".format(HEAVY_MODULES)))
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(json.loads(result.stdout), [], "{} imports no heavy dependencies".format(module))
+
+    def test_import_time(self):
+        result = _run("import ff_scrape.scraper")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        cumulative = None
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split('|')
+            if len(parts) == 3 and parts[2].strip() == 'ff_scrape.scraper':
+                cumulative = int(parts[1].strip()) / 1000
+        self.assertIsNotNone(cumulative, 'Import time was reported')
+        self.assertLess(cumulative, IMPORT_BUDGET_MS, 'ff_scrape.scraper imports within budget')
+
+
+if __name__ == '__main__':
+    unittest.main()
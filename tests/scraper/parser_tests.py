@@ -0,0 +1,87 @@
+import unittest
+from ff_scrape.sites.fanfiction import Fanfiction, chapter_options
+from ff_scrape.sites.archiveofourown import ArchiveofOurOwn
+from ff_scrape.sites.fanficauthors import FanficAuthors
+from ff_scrape.sites.hpfanficarchive import HPFanficArchive
+from ff_scrape.sites.animationsource import AnimationSource
+from ff_scrape.storybase import Story
+from bs4 import BeautifulSoup
+from glob import glob
+from os import path
+from types import SimpleNamespace
+
+TESTS = path.dirname(path.dirname(path.abspath(__file__)))
+
+# fixture directory: (site, URL the fixtures are read as)
+SITES = {
+    'fanfiction': (Fanfiction, 'https://www.fanfiction.net/s/1/1'),
+    'archiveofourown': (ArchiveofOurOwn, 'https://archiveofourown.org/works/1?view_full_work=true'),
+    'fanficauthors': (FanficAuthors, 'https://author.fanficauthors.net/Story/index'),
+    'hpfanficarchive': (HPFanficArchive, 'http://www.hpfanficarchive.com/stories/viewstory.php?sid=1'),
+    'animationsource': (AnimationSource, 'https://www.animationsource.org/fandom/en/view_fanfic/story/1.html'),
+}
+
+
+def read_fixture(file_path: str) -> str:
+    with open(file_path, 'rb') as page:
+        return page.read().decode('utf-8', errors='replace')
+
+
+def metadata(site_class, url: str, text: str, parser: str = None):
+    """The metadata the site reads from the page, parsed as an index page or with the given parser"""
+    site = site_class()
+    site.url = url
+    site._fanfic = Story(site.url)
+    site._soup = site._parse(text, lenient=False) if parser is None else BeautifulSoup(text, features=parser)
+    if not site.check_story_exists():
+        return None
+    site.record_story_metadata()
+    fanfic = site._fanfic
+    return {
+        'title': fanfic.title, 'authors': [(author.name, author.url) for author in fanfic.authors],
+        'summary': fanfic.summary, 'published': fanfic.published, 'updated': fanfic.updated,
+        'status': fanfic.status, 'rating': fanfic.rating, 'universe': fanfic.universe, 'genres': fanfic.genres,
+        'categories': fanfic.categories, 'warnings': fanfic.warnings, 'characters': fanfic.characters,
+        'pairings': fanfic.pairings, 'chapters': getattr(site, 'chapter_list', None),
+    }
+
+
+class ParserTests(unittest.TestCase):
+
+    def test_index_parser_parity(self):
+        for site, (site_class, url) in SITES.items():
+            for file_path in sorted(glob(path.join(TESTS, site, 'data', '*.html'))):
+                with self.subTest(site=site, fixture=path.basename(file_path)):
+                    text = read_fixture(file_path)
+                    self.assertEqual(metadata(site_class, url, text), metadata(site_class, url, text, 'html5lib'),
+                                     'The index parser reads what html5lib reads')
+
+    def test_missing_signatures(self):
+        for site, (site_class, url) in SITES.items():
+            for file_path in sorted(glob(path.join(TESTS, site, 'data', '*.html'))):
+                with self.subTest(site=site, fixture=path.basename(file_path)):
+                    with open(file_path, 'rb') as page:
+                        content = page.read()
+                    self.assertEqual(site_class().missing_story(SimpleNamespace(status_code=200, content=content)),
+                                     path.basename(file_path) == 'missing_story.html')
+        self.assertTrue(ArchiveofOurOwn().missing_story(SimpleNamespace(status_code=404, content=b'')))
+
+    def test_chapter_options(self):
+        for file_path in sorted(glob(path.join(TESTS, 'fanfiction', 'data', 'good_story*.html'))):
+            with self.subTest(fixture=path.basename(file_path)):
+                text = read_fixture(file_path)
+                chap_select = BeautifulSoup(text, features='html5lib').find(id='chap_select')
+                expected = [] if chap_select is None else [{'name': entry.text, 'link': entry.attrs['value']}
+                                                          for entry in chap_select.contents]
+                self.assertEqual(chapter_options(text), expected)
+
+    def test_chapter_options_markup(self):
+        text = ('<SELECT id="chap_select" Name=chapter><option  value=1 selected>1. Tom &amp; Jerry'
+                '<option value=\'2\' >2. Next</select><select id=chap_select><option value=9>9. Other</select>')
+        self.assertEqual(chapter_options(text), [{'name': '1. Tom & Jerry', 'link': '1'},
+                                                 {'name': '2. Next', 'link': '2'}])
+        self.assertEqual(chapter_options('<div id="storytext">One shot</div>'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
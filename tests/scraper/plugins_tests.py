@@ -0,0 +1,45 @@
+import unittest
+from ff_scrape.plugins import LazyPlugins
+from ff_scrape.sites.fanfiction import Fanfiction
+from ff_scrape.sites.ficwad import Ficwad
+
+
+class PluginsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+
+        def factory(name, plugin_class):
+            self.created.append(name)
+            return plugin_class(site_params={})
+
+        self.plugins = LazyPlugins('ff_scrape.tests.nothing_registered', factory=factory)
+        self.plugins.register('Fanfiction', Fanfiction)
+        self.plugins.register('Ficwad', Ficwad)
+
+    def test_lazy_instantiation(self):
+        self.assertEqual(sorted(self.plugins), ['Fanfiction', 'Ficwad'], 'Registered plugins are listed')
+        self.assertIs(self.plugins.load('Ficwad'), Ficwad, 'load returns the class')
+        self.assertEqual(self.created, [], 'Listing and loading does not instantiate')
+
+        site = self.plugins['Fanfiction']
+        self.assertIsInstance(site, Fanfiction)
+        self.assertIs(self.plugins['Fanfiction'], site, 'Instances are reused')
+        self.assertEqual(self.created, ['Fanfiction'], 'Only the requested site is instantiated')
+
+    def test_unregister(self):
+        site = self.plugins['Ficwad']
+        self.plugins.unregister('Ficwad')
+        self.assertNotIn('Ficwad', self.plugins)
+        self.plugins.register('Ficwad', Ficwad)
+        self.assertIsNot(self.plugins['Ficwad'], site, 'A registered plugin starts over')
+        self.assertEqual(sorted(self.plugins), ['Fanfiction', 'Ficwad'])
+
+    def test_unknown(self):
+        self.assertNotIn('Unknown', self.plugins)
+        with self.assertRaises(KeyError):
+            self.plugins['Unknown']
+
+
+if __name__ == '__main__':
+    unittest.main()
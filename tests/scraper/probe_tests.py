@@ -0,0 +1,72 @@
+import unittest
+import threading
+import time
+from datetime import datetime
+from ff_scrape import scraper
+from ff_scrape.errors import StoryError
+from ff_scrape.fetch import DomainLimits
+from ff_scrape.probe import Fingerprint
+from tests.fakes import ExampleSite, register
+
+
+class ProbedSite(ExampleSite):
+    """Site whose probe tracks how many requests overlap"""
+    hostnames = ('probe.example.org',)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def probe(self) -> Fingerprint:
+        story_id = int(self._url.split('/')[-1])
+        if story_id == 13:
+            raise StoryError("Story doesn't exist.")
+        with self._fetcher._limits.slot('probe.example.org'):
+            with self.lock:
+                ProbedSite.active += 1
+                ProbedSite.peak = max(ProbedSite.peak, ProbedSite.active)
+            time.sleep(0.01)
+            with self.lock:
+                ProbedSite.active -= 1
+        return Fingerprint(self._url, datetime(2020, 1, story_id % 28 + 1), story_id)
+
+
+class ProbeTests(unittest.TestCase):
+
+    def test_digest(self):
+        first = Fingerprint('url', datetime(2020, 1, 1), 3)
+        self.assertEqual(first.digest, Fingerprint('other', datetime(2020, 1, 1), 3).digest, 'Digest ignores the URL')
+        self.assertNotEqual(first.digest, Fingerprint('url', datetime(2020, 1, 1), 4).digest, 'New chapter changes it')
+        self.assertNotEqual(first.digest, Fingerprint('url', datetime(2020, 1, 2), 3).digest, 'Update changes it')
+        self.assertEqual(len(first.digest), 16)
+
+    def test_domain_interval(self):
+        limits = DomainLimits(concurrency=4, interval=0.05)
+        starts = []
+        start = time.monotonic()
+        for _ in range(3):
+            with limits.slot('example.org'):
+                starts.append(time.monotonic() - start)
+        with limits.slot('other.example.org'):
+            other = time.monotonic() - start
+        self.assertGreaterEqual(starts[2], 0.09, 'Requests to a host are spaced out')
+        self.assertLess(other - starts[2], 0.04, 'Other hosts are not delayed')
+
+    def test_probe_stories(self):
+        register(self, 'ProbedSite', ProbedSite)
+        urls = ["https://probe.example.org/s/%d" % story for story in range(1, 21)]
+        urls.append("https://probe.example.org/s/5/2")
+        urls.append("not a url")
+        report = scraper.probe_stories(urls, jobs=8, per_domain=3, interval=0)
+
+        self.assertEqual(len(report.fingerprints), 19, 'Every distinct story is probed once')
+        self.assertEqual(report.fingerprints[('ProbedSite', '5')].chapter_count, 5)
+        self.assertEqual(len(report.failures), 2, 'Missing stories and bad URLs are reported')
+        self.assertLessEqual(ProbedSite.peak, 3, 'Per domain concurrency is respected')
+
+        previous = {key: fingerprint.digest for key, fingerprint in report.fingerprints.items()}
+        previous[('ProbedSite', '7')] = 'outdated'
+        self.assertEqual(report.changed(previous), [('ProbedSite', '7')], 'Only changed stories are listed')
+
+
+if __name__ == '__main__':
+    unittest.main()
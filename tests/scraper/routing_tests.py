@@ -0,0 +1,98 @@
+import unittest
+import time
+from ff_scrape import scraper
+from ff_scrape.routing import Router, CanonicalURL
+from ff_scrape.errors import URLError
+from ff_scrape.sites.fanfiction import Fanfiction
+from ff_scrape.sites.archiveofourown import ArchiveofOurOwn
+from ff_scrape.sites.ficwad import Ficwad
+from ff_scrape.sites.fanficauthors import FanficAuthors
+from ff_scrape.sites.hpfanficarchive import HPFanficArchive
+from ff_scrape.sites.animationsource import AnimationSource
+from testfixtures import ShouldRaise
+from tests.fakes import ExampleSite, register
+
+SITES = {
+    'Fanfiction': Fanfiction,
+    'ArchiveofOurOwn': ArchiveofOurOwn,
+    'Ficwad': Ficwad,
+    'FanficAuthors': FanficAuthors,
+    'HPFanficArchive': HPFanficArchive,
+    'AnimationSource': AnimationSource,
+}
+
+
+class CachedSite(ExampleSite):
+    hostnames = ('cached.example.net',)
+
+
+class RoutingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router(SITES)
+
+    def test_route(self):
+        self.assertEqual(self.router.route('www.fanfiction.net'), 'Fanfiction')
+        self.assertEqual(self.router.route('M.FANFICTION.NET'), 'Fanfiction')
+        self.assertEqual(self.router.route('jeconais.fanficauthors.net'), 'FanficAuthors')
+        self.assertEqual(self.router.route('archiveofourown.org'), 'ArchiveofOurOwn')
+        self.assertIsNone(self.router.route('example.com'))
+        self.assertIsNone(self.router.route('fanfiction.net.example.com'))
+
+    def test_scraper_router(self):
+        router = scraper._router()
+        self.assertIs(scraper._router(), router, 'The site plugins are only loaded once')
+        register(self, 'CachedSite', CachedSite)
+        self.assertIsNot(scraper._router(), router, 'A registered site rebuilds the router')
+        self.assertEqual(scraper._router().route('cached.example.net'), 'CachedSite')
+
+    def test_canonicalize(self):
+        checks = [
+            ["https://www.fanfiction.net/s/7344530/20/Sealed-Legacy", ('Fanfiction', '7344530', 'https://www.fanfiction.net/s/7344530/1')],
+            ["http://m.fanfiction.net/s/7344530/3/", ('Fanfiction', '7344530', 'https://www.fanfiction.net/s/7344530/1')],
+            ["www.fanfiction.net/s/7344530", ('Fanfiction', '7344530', 'https://www.fanfiction.net/s/7344530/1')],
+            ["http://archiveofourown.org/works/21586099/chapters/51467572", ('ArchiveofOurOwn', '21586099', 'https://archiveofourown.org/works/21586099?view_full_work=true')],
+            ["https://archiveofourown.org/collections/fest/works/21586099", ('ArchiveofOurOwn', '21586099', 'https://archiveofourown.org/works/21586099?view_full_work=true')],
+            ["https://ficwad.com/story/12345", ('Ficwad', '12345', 'http://ficwad.com/story/12345')],
+            ["https://jeconais.fanficauthors.net/No_Good_Deed/No_Good_Deed/", ('FanficAuthors', 'jeconais/No_Good_Deed', 'https://jeconais.fanficauthors.net/No_Good_Deed/index')],
+            ["http://www.hpfanficarchive.com/stories/viewstory.php?sid=270&chapter=81", ('HPFanficArchive', '270', 'http://www.hpfanficarchive.com/stories/viewstory.php?sid=270')],
+            ["https://www.animationsource.org/balto/en/view_fanfic/Jenna-s-Journey/55497.html&deb=0&nsite=1", ('AnimationSource', '55497', 'https://www.animationsource.org/balto/en/view_fanfic/Jenna-s-Journey/55497.html')],
+        ]
+        for raw, expected in checks:
+            self.assertEqual(self.router.canonicalize(raw), CanonicalURL(*expected), 'Canonical form of ' + raw)
+
+        with ShouldRaise(URLError('Unknown site')):
+            self.router.canonicalize('https://example.com/s/1234')
+        with ShouldRaise(URLError('Unknown URL format')):
+            self.router.canonicalize('https://www.fanfiction.net/u/1234/')
+
+    def test_report(self):
+        report = self.router.canonicalize_all([
+            "https://www.fanfiction.net/s/7344530/20/Sealed-Legacy",
+            "",
+            "http://m.fanfiction.net/s/7344530/1",
+            "https://www.fanfiction.net/s/",
+            "https://example.com/story",
+            "http://[broken",
+            "https://archiveofourown.org/works/21586099",
+        ])
+        self.assertEqual(len(report.results), 3, 'Usable URLs are resolved')
+        self.assertEqual([c.key for c in report.unique], [('Fanfiction', '7344530'), ('ArchiveofOurOwn', '21586099')])
+        self.assertEqual(report.duplicates, 1)
+        self.assertEqual(report.errors, [
+            ("https://www.fanfiction.net/s/", 'No Story ID given'),
+            ("https://example.com/story", 'Unknown site'),
+            ("http://[broken", 'Unknown URL format'),
+        ], 'Malformed inputs are reported instead of raised')
+
+    def test_bulk_throughput(self):
+        urls = ["https://www.fanfiction.net/s/{}/{}/Title".format(story, story % 7 + 1) for story in range(50000)]
+        start = time.perf_counter()
+        report = self.router.canonicalize_all(urls)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(report.results), 50000)
+        self.assertLess(elapsed, 5, 'Bulk canonicalization is fast')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import threading
+import tempfile
+import shutil
+import socket
+import json
+import http.client
+import logging
+from os import path
+from ff_scrape import scraper
+from ff_scrape.server import ScrapeService, ScrapeHTTPServer, ScrapeUnixServer
+from ff_scrape.storybase import Story, Chapter
+from tests.fakes import ExampleSite, register
+
+
+class WarmSite(ExampleSite):
+    """Site counting its instances, story 0 does not exist"""
+    hostnames = ('warm.example.net',)
+    instances = 0
+    release = threading.Event()
+
+    def __init__(self, site_params={}):
+        super().__init__(site_params=site_params)
+        WarmSite.instances += 1
+
+    def get_meta(self) -> None:
+        story_id = self.story_key[1]
+        if story_id == '0':
+            raise ValueError("Story doesn't exist.")
+        if story_id == 'slow':
+            self.release.wait(5)
+        self._fanfic = Story(self._url)
+        self._fanfic.title = 'Story ' + story_id
+        self._fanfic_set = True
+        self._got_meta = True
+
+    def record_story_chapters(self) -> None:
+        chapter = Chapter()
+        chapter.processed_body = '<p>one two</p>'
+        chapter.word_count = 2
+        self._fanfic.add_chapter(chapter)
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self._socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._socket_path)
+
+
+class ServerTests(unittest.TestCase):
+
+    def setUp(self):
+        register(self, 'WarmSite', WarmSite)
+        WarmSite.instances = 0
+        WarmSite.release.clear()
+        self.service = ScrapeService(jobs=1)
+        self.servers = []
+
+    def tearDown(self):
+        WarmSite.release.set()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.service.shutdown()
+
+    def start(self, server):
+        self.servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def request(self, connection, method, url, body=None):
+        connection.request(method, url, body=json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def test_http(self):
+        server = self.start(ScrapeHTTPServer(('127.0.0.1', 0), self.service))
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+        self.addCleanup(connection.close)
+
+        self.assertEqual(self.request(connection, 'GET', '/health'), (200, b'{"status": "ok"}'))
+        status, body = self.request(connection, 'POST', '/batches', {'urls': [
+            'https://warm.example.net/s/1', 'warm.example.net/s/1/3', 'https://warm.example.net/s/0', 'nonsense']})
+        self.assertEqual(status, 202)
+        batch = json.loads(body)
+        self.assertEqual(batch['errors'], [{'url': 'nonsense', 'error': 'Unknown site'}])
+
+        status, body = self.request(connection, 'GET', '/batches/%s/results' % batch['id'])
+        results = sorted([json.loads(line) for line in body.decode('utf-8').splitlines()], key=lambda r: r['url'])
+        self.assertEqual([(result['url'], result['scrape_status']) for result in results],
+                         [('https://warm.example.net/s/0', 'failed'), ('https://warm.example.net/s/1', 'complete')])
+        self.assertEqual(results[1]['title'], 'Story 1')
+        self.assertEqual(results[1]['words'], 2)
+
+        status, body = self.request(connection, 'GET', '/batches/%s' % batch['id'])
+        self.assertEqual((status, json.loads(body)['pending'], json.loads(body)['finished']), (200, 0, 2))
+
+        status, body = self.request(connection, 'POST', '/batches', {'urls': ['https://warm.example.net/s/2']})
+        self.request(connection, 'GET', '/batches/%s/results' % json.loads(body)['id'])
+        self.assertEqual(WarmSite.instances, 1, 'The worker keeps its site instance between batches')
+
+        self.assertEqual(self.request(connection, 'GET', '/batches/unknown')[0], 404)
+        self.assertEqual(self.request(connection, 'POST', '/batches', {'url': 'x'})[0], 400)
+
+    def test_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        socket_path = path.join(directory, 'scrape.sock')
+        self.start(ScrapeUnixServer(socket_path, self.service))
+        connection = UnixConnection(socket_path)
+        self.addCleanup(connection.close)
+
+        status, body = self.request(connection, 'POST', '/batches', {'urls': ['https://warm.example.net/s/slow']})
+        batch = json.loads(body)
+        self.assertEqual(batch['pending'], 1)
+        status, body = self.request(connection, 'GET', '/batches/' + batch['id'])
+        self.assertEqual(json.loads(body)['finished'], 0, 'Polling does not wait for the batch')
+        WarmSite.release.set()
+        status, body = self.request(connection, 'GET', '/batches/%s/results' % batch['id'])
+        self.assertEqual(json.loads(body)['scrape_status'], 'complete')
+
+    def test_single_log_handler(self):
+        scraper._setup_logger()
+        scraper._setup_logger(logging.DEBUG)
+        self.assertEqual(len(logging.getLogger('ff_scrape').handlers), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+from ff_scrape.testing.synthetic import (STORIES, AnimationSourceStory, FanficAuthorsStory, FanfictionStory,
+                                         HPFanficArchiveStory, SyntheticSession, synthetic_story)
+from ff_scrape.fetch import Fetcher
+from ff_scrape.errors import StoryError
+from importlib import import_module
+import requests
+import unittest
+
+
+class _BareReadingStory(AnimationSourceStory):
+    """Reading views without the story details"""
+
+    def _reading_page(self, number: int) -> str:
+        return super()._reading_page(number).replace(self._details(), '')
+
+
+class _ShortPrintableStory(HPFanficArchiveStory):
+    """A printable view missing the last chapter"""
+
+    def _printable(self) -> str:
+        return self._page(''.join(self._chapter(number) for number in range(1, self.chapters)))
+
+
+class _BrokenEpubStory(FanficAuthorsStory):
+    """An epub that is not a zip archive"""
+
+    def _epub(self) -> bytes:
+        return b'<html><body>Please log in</body></html>'
+
+
+class _SwappedPrintableStory(HPFanficArchiveStory):
+    """A printable view with the last two chapters swapped"""
+
+    def _printable(self) -> str:
+        numbers = list(range(1, self.chapters - 1)) + [self.chapters, self.chapters - 1]
+        return self._page(''.join(self._chapter(number) for number in numbers))
+
+
+class _ShortEpubStory(FanficAuthorsStory):
+    """An epub without the text of the last chapter"""
+
+    def _epub_document(self, title: str, content: str) -> str:
+        return super()._epub_document(title, '' if title == self.chapter_name(self.chapters) else content)
+
+
+class _FailingEpubSession(SyntheticSession):
+    """A session whose epub download fails"""
+
+    def get(self, url: str, cookies=None, timeout=None, **kwargs):
+        if url == self._stories[0].epub_url:
+            self.requested.append(url)
+            raise requests.ConnectionError('Connection reset')
+        return super().get(url, cookies=cookies, timeout=timeout, **kwargs)
+
+
+class _OtherMobileStory(FanfictionStory):
+    """A mobile site serving other text than the desktop site"""
+
+    def _mobile_page(self, number: int) -> str:
+        return super()._mobile_page(number).replace('<p>', '<p>Advertisement ', 1)
+
+
+PLUGINS = {
+    'fanfiction': ('ff_scrape.sites.fanfiction', 'Fanfiction'),
+    'archiveofourown': ('ff_scrape.sites.archiveofourown', 'ArchiveofOurOwn'),
+    'ficwad': ('ff_scrape.sites.ficwad', 'Ficwad'),
+    'fanficauthors': ('ff_scrape.sites.fanficauthors', 'FanficAuthors'),
+    'hpfanficarchive': ('ff_scrape.sites.hpfanficarchive', 'HPFanficArchive'),
+    'animationsource': ('ff_scrape.sites.animationsource', 'AnimationSource'),
+}
+
+
+def scrape(story):
+    return scrape_url(story, story.url)
+
+
+def scrape_url(story, url, **site_params):
+    module, name = PLUGINS[story.site]
+    processor = getattr(import_module(module), name)(site_params=site_params)
+    processor._chapter_sleep_time = 0
+    session = SyntheticSession(story)
+    processor.fetcher = Fetcher(transport=session)
+    processor.url = url
+    processor.get_story()
+    return processor.fanfic, session
+
+
+class SyntheticStoryTests(unittest.TestCase):
+
+    def test_every_site_has_pages(self):
+        for site in STORIES:
+            story = synthetic_story(site, chapters=3, words=20)
+            self.assertIsNotNone(story.page(story.url), '%s serves its story URL' % site)
+            for url in story.urls():
+                self.assertIsNotNone(story.page(url), '%s serves %s' % (site, url))
+
+    def test_deterministic(self):
+        first = synthetic_story('fanfiction', chapters=2, words=500, seed=3)
+        second = synthetic_story('fanfiction', chapters=2, words=500, seed=3)
+        other = synthetic_story('fanfiction', chapters=2, words=500, seed=4)
+        self.assertEqual(first.page(first.url), second.page(second.url), 'Same parameters give the same pages')
+        self.assertNotEqual(first.page(first.url), other.page(other.url), 'The seed changes the text')
+
+    def test_word_count(self):
+        story = synthetic_story('archiveofourown', chapters=2, words=1234)
+        self.assertEqual(sum(len(paragraph.split()) for paragraph in story.paragraphs(2)), 1234)
+
+    def test_size_scales(self):
+        small = synthetic_story('archiveofourown', chapters=10, words=1000)
+        large = synthetic_story('archiveofourown', chapters=100, words=1000)
+        self.assertGreater(len(large.page(large.url)), 9 * len(small.page(small.url)),
+                           'The full work page grows with the chapters')
+
+    def test_unknown_pages(self):
+        story = synthetic_story('hpfanficarchive', chapters=2)
+        self.assertIsNone(story.page('http://www.hpfanficarchive.com/stories/viewstory.php?sid=999'))
+        response = SyntheticSession(story).get('http://www.hpfanficarchive.com/stories/viewstory.php?sid=999')
+        self.assertEqual(response.status_code, 404)
+
+    def test_url_variants(self):
+        story = synthetic_story('fanfiction', chapters=3)
+        self.assertEqual(story.page('https://www.fanfiction.net/s/1/2/Synthetic-Story'),
+                         story.page('http://fanfiction.net/s/1/2'), 'Slugs, hosts and schemes are ignored')
+        self.assertIn("id='storycontent'", story.page('https://m.fanfiction.net/s/1/2/'), 'The mobile site')
+        self.assertIsNone(story.page('https://m.fanfiction.net/s/1/4/'))
+
+    def test_ficwad_chapters(self):
+        story = synthetic_story('ficwad', chapters=4, story_id=5)
+        index = story.page(story.url)
+        for number in range(1, 5):
+            self.assertIn('/story/%d' % (5000 + number), index, 'The index links every chapter')
+            self.assertIn('name="chapterlist"', story.page('http://ficwad.com/story/%d' % (5000 + number)))
+
+
+class SyntheticScrapeTests(unittest.TestCase):
+
+    def test_scrape_every_site(self):
+        for site in PLUGINS:
+            story = synthetic_story(site, chapters=5, words=300, story_id=7)
+            fanfic, session = scrape(story)
+            self.assertEqual(fanfic.title, story.title, '%s title' % site)
+            self.assertEqual([author.name for author in fanfic.authors], [story.author], '%s author' % site)
+            self.assertEqual([chapter.name for chapter in fanfic.chapters],
+                             [story.chapter_name(number) for number in range(1, 6)], '%s chapter names' % site)
+            self.assertEqual([chapter.word_count for chapter in fanfic.chapters], [300] * 5,
+                             '%s word counts' % site)
+            self.assertEqual(fanfic.scrape_status, 'complete')
+
+    def test_large_story(self):
+        story = synthetic_story('fanfiction', chapters=200, words=50)
+        fanfic, session = scrape(story)
+        self.assertEqual(fanfic.chapter_count, 200)
+        self.assertEqual(fanfic.word_count, 200 * 50)
+        self.assertEqual(len(session.requested), 201, 'The index and every chapter are fetched once')
+
+    def test_ficwad_requests(self):
+        story = synthetic_story('ficwad', chapters=6, words=50, story_id=3)
+        fanfic, session = scrape(story)
+        self.assertEqual(len(session.requested), 7, 'The index and every chapter are fetched once')
+        self.assertEqual(len(set(session.requested)), 7)
+        self.assertEqual(fanfic.metrics.counts['requests'], 7)
+
+        # starting from a chapter the index is the only extra page
+        fanfic, session = scrape_url(story, 'http://ficwad.com/story/3004')
+        self.assertEqual(len(session.requested), 7)
+        self.assertEqual(fanfic.title, story.title)
+        self.assertEqual([chapter.name for chapter in fanfic.chapters],
+                         [story.chapter_name(number) for number in range(1, 7)])
+
+    def test_ficwad_one_shot(self):
+        story = synthetic_story('ficwad', chapters=1, words=50)
+        fanfic, session = scrape(story)
+        self.assertEqual(len(session.requested), 1, 'A one-shot is its own index and only chapter')
+        self.assertEqual([chapter.name for chapter in fanfic.chapters], [story.title])
+        self.assertEqual(fanfic.word_count, 50)
+
+    def test_animationsource_requests(self):
+        story = synthetic_story('animationsource', chapters=4, words=50)
+        fanfic, session = scrape(story)
+        self.assertEqual(session.requested[0], story.url + '&deb=0&nsite=1', 'The reading view is fetched first')
+        self.assertEqual(len(session.requested), 4, 'The story page is not needed')
+        self.assertEqual([author.name for author in fanfic.authors], [story.author])
+
+        bare = _BareReadingStory(chapters=4, words=50)
+        fanfic, session = scrape(bare)
+        self.assertEqual(len(session.requested), 5, 'The story page is read when the reading view lacks the details')
+        self.assertEqual(fanfic.title, bare.title)
+        self.assertEqual([chapter.word_count for chapter in fanfic.chapters], [50] * 4)
+
+    def test_hpfanficarchive_printable(self):
+        story = synthetic_story('hpfanficarchive', chapters=5, words=80)
+        fanfic, session = scrape(story)
+        self.assertEqual(session.requested, [story.url, story.printable_url], 'The index and the printable view')
+        by_chapter, session = scrape_url(story, story.url, printable='False')
+        self.assertEqual(len(session.requested), 6, 'Without the printable view every chapter is fetched')
+        self.assertEqual([(chapter.name, chapter.processed_body, chapter.word_count) for chapter in fanfic.chapters],
+                         [(chapter.name, chapter.processed_body, chapter.word_count)
+                          for chapter in by_chapter.chapters], 'Both ways give the same chapters')
+
+    def test_hpfanficarchive_printable_mismatch(self):
+        story = _ShortPrintableStory(chapters=4, words=80)
+        fanfic, session = scrape(story)
+        self.assertEqual(len(session.requested), 6, 'The chapters are fetched one by one after the printable view')
+        self.assertEqual([chapter.name for chapter in fanfic.chapters],
+                         [story.chapter_name(number) for number in range(1, 5)])
+
+    def test_hpfanficarchive_printable_swapped(self):
+        story = _SwappedPrintableStory(chapters=4, words=80)
+        fanfic, session = scrape(story)
+        self.assertEqual(session.requested[:2], [story.url, story.printable_url])
+        self.assertEqual(len(session.requested), 4, 'Only the chapters from the first mismatch on are fetched')
+        self.assertEqual([chapter.name for chapter in fanfic.chapters],
+                         [story.chapter_name(number) for number in range(1, 5)])
+        self.assertIn(story.paragraphs(3)[0], fanfic.chapters[2].processed_body)
+
+    def test_fanficauthors_epub(self):
+        story = synthetic_story('fanficauthors', chapters=5, words=120)
+        fanfic, session = scrape_url(story, story.url, epub='True')
+        self.assertEqual(session.requested, [story.url, story.epub_url], 'The index and the epub')
+        by_chapter, session = scrape(story)
+        self.assertEqual(len(session.requested), 6, 'Without the epub every chapter is fetched')
+        self.assertEqual([(chapter.name, chapter.word_count) for chapter in fanfic.chapters],
+                         [(chapter.name, chapter.word_count) for chapter in by_chapter.chapters])
+        self.assertIn(story.paragraphs(3)[0], fanfic.chapters[2].processed_body)
+
+    def test_fanficauthors_epub_fallback(self):
+        story = _BrokenEpubStory(chapters=3, words=120)
+        fanfic, session = scrape_url(story, story.url, epub='True')
+        self.assertEqual(len(session.requested), 5, 'The chapters are fetched one by one after the epub')
+        self.assertEqual([chapter.word_count for chapter in fanfic.chapters], [120] * 3)
+
+    def test_fanficauthors_short_epub(self):
+        story = _ShortEpubStory(chapters=3, words=120)
+        fanfic, session = scrape_url(story, story.url, epub='True')
+        self.assertEqual(session.requested[:2], [story.url, story.epub_url])
+        self.assertEqual(len(session.requested), 3, 'Only the chapter the epub lacks is fetched')
+        self.assertEqual([chapter.word_count for chapter in fanfic.chapters], [120] * 3)
+
+    def test_fanficauthors_epub_failed(self):
+        story = synthetic_story('fanficauthors', chapters=3, words=120)
+        processor = import_module('ff_scrape.sites.fanficauthors').FanficAuthors(site_params={'epub': 'True'})
+        processor._chapter_sleep_time = 0
+        session = _FailingEpubSession(story)
+        processor.fetcher = Fetcher(transport=session, retries=0)
+        processor.url = story.url
+        processor.get_story()
+        self.assertEqual(len(session.requested), 5, 'The chapters are fetched one by one after the epub')
+        self.assertEqual([chapter.word_count for chapter in processor.fanfic.chapters], [120] * 3)
+
+    def test_fanfiction_mobile(self):
+        story = synthetic_story('fanfiction', chapters=4, words=300)
+        desktop, _ = scrape(story)
+        mobile, session = scrape_url(story, story.url, mobile='True')
+        self.assertEqual(session.requested, [story.url] + ['https://m.fanfiction.net/s/1/%d' % number
+                                                           for number in range(1, 5)])
+        self.assertEqual([(chapter.name, chapter.word_count) for chapter in mobile.chapters],
+                         [(chapter.name, chapter.word_count) for chapter in desktop.chapters])
+        self.assertEqual([chapter.processed_body for chapter in mobile.chapters],
+                         [chapter.processed_body for chapter in desktop.chapters])
+        self.assertLess(mobile.metrics.bytes['in'], desktop.metrics.bytes['in'])
+        self.assertNotIn('mobile_fallbacks', mobile.metrics.counts)
+
+    def test_fanfiction_mobile_mismatch(self):
+        story = _OtherMobileStory(chapters=3, words=100)
+        desktop, _ = scrape(story)
+        fanfic, session = scrape_url(story, story.url, mobile='True')
+        self.assertEqual(session.requested, [story.url, 'https://m.fanfiction.net/s/1/1'] +
+                         ['https://www.fanfiction.net/s/1/%d' % number for number in range(1, 4)])
+        self.assertEqual(fanfic.metrics.counts['mobile_fallbacks'], 1)
+        self.assertEqual([chapter.processed_body for chapter in fanfic.chapters],
+                         [chapter.processed_body for chapter in desktop.chapters])
+
+        processor = import_module('ff_scrape.sites.fanfiction').Fanfiction(site_params={'mobile': 'True'})
+        processor.fetcher = Fetcher(transport=SyntheticSession(story))
+        pauses = []
+        processor.fetcher.sleep = pauses.append
+        processor.url = story.url
+        processor.get_story()
+        self.assertEqual(len(pauses), 4, 'The desktop fallback waits like every other chapter request')
+
+    def test_missing_story_not_parsed(self):
+        for site in ['archiveofourown', 'fanficauthors']:
+            with self.subTest(site=site):
+                story = synthetic_story(site, chapters=2, words=50)
+                module, name = PLUGINS[site]
+                processor = getattr(import_module(module), name)()
+                processor.fetcher = Fetcher(transport=SyntheticSession())
+                processor.url = story.url
+                with self.assertRaises(StoryError):
+                    processor.get_story()
+                self.assertEqual(processor.metrics.counts, {'requests': 1})
+                self.assertNotIn('parse', processor.metrics.timings, 'The 404 answer is not parsed')
+
+    def test_archiveofourown_parallel(self):
+        story = synthetic_story('archiveofourown', chapters=12, words=150)
+        serial, session = scrape(story)
+        parallel, session = scrape_url(story, story.url, parallel='3')
+        self.assertEqual(len(session.requested), 1, 'The full work is one request')
+        self.assertEqual([(chapter.name, chapter.processed_body, chapter.word_count) for chapter in parallel.chapters],
+                         [(chapter.name, chapter.processed_body, chapter.word_count) for chapter in serial.chapters])
+        self.assertEqual([chapter.word_count for chapter in serial.chapters], [150] * 12)
+        self.assertGreater(serial.metrics.timings['prettify'], 0, 'The serial chapters are timed as prettify')
+
+    def test_archiveofourown_adult_consent(self):
+        story = synthetic_story('archiveofourown', chapters=3, words=50)
+        fanfic, session = scrape(story)
+        self.assertEqual(session.requested, [story.url + '&view_adult=true'], 'No interstitial or redirect first')
+        self.assertEqual(fanfic.chapter_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime
+from ff_scrape.watchlist import Watchlist, RefreshDaemon, DAY
+from ff_scrape.routing import CanonicalizationReport, CanonicalURL
+from ff_scrape.probe import ProbeReport, Fingerprint
+from ff_scrape.storybase import Story
+
+NOW = datetime(2020, 6, 1).timestamp()
+
+
+def _report(*story_ids):
+    report = CanonicalizationReport()
+    for story_id in story_ids:
+        canonical = CanonicalURL('Site', story_id, 'https://example.org/s/' + story_id)
+        report.results.append((canonical.url, canonical))
+    return report
+
+
+class WatchlistTests(unittest.TestCase):
+
+    def setUp(self):
+        self.watchlist = Watchlist(':memory:', prior_interval=30 * DAY, min_interval=60, max_interval=365 * DAY)
+
+    def tearDown(self):
+        self.watchlist.close()
+
+    def test_rate_estimate(self):
+        self.watchlist.add(_report('active', 'abandoned'), now=NOW)
+        # weekly updates for a year against one update three years ago
+        for week in range(52):
+            self.watchlist.record_update(('Site', 'active'), datetime.fromtimestamp(NOW - week * 7 * DAY))
+        self.watchlist.record_update(('Site', 'abandoned'), datetime.fromtimestamp(NOW - 3 * 365 * DAY))
+        active = self.watchlist.update_rate(('Site', 'active'), NOW)
+        abandoned = self.watchlist.update_rate(('Site', 'abandoned'), NOW)
+        self.assertAlmostEqual(1 / active / DAY, 7.6, delta=0.5, msg='Active story updates about weekly')
+        self.assertGreater(1 / abandoned / DAY, 1000, 'Abandoned story is rarely checked')
+
+        self.watchlist.record_check(('Site', 'active'), 'a', NOW)
+        self.watchlist.record_check(('Site', 'abandoned'), 'b', NOW)
+        later = NOW + 10 * DAY
+        self.assertGreater(self.watchlist.change_probability(('Site', 'active'), later),
+                           self.watchlist.change_probability(('Site', 'abandoned'), later))
+        self.assertEqual(self.watchlist.pop_due(later), [('Site', 'active')], 'Only the active story is due')
+
+    def test_due_order(self):
+        self.watchlist.add(_report('1', '2'), now=NOW)
+        self.assertEqual(self.watchlist.add(_report('1'), now=NOW), 0, 'Stories are only added once')
+        self.assertEqual(len(self.watchlist.pop_due(NOW)), 2, 'New stories are due immediately')
+        self.assertEqual(self.watchlist.pop_due(NOW), [], 'Popped stories are not due again')
+        self.assertFalse(self.watchlist.record_check(('Site', '1'), 'first', NOW), 'First check sets a baseline')
+        self.assertTrue(self.watchlist.record_check(('Site', '1'), 'second', NOW + DAY), 'New digest is a change')
+
+
+class RefreshDaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.watchlist = Watchlist(':memory:')
+        self.watchlist.add(_report('1', '2', '3'), now=NOW)
+        self.digests = {'1': 'a', '2': 'b', '3': 'c'}
+        self.probed = []
+        self.rescraped = []
+
+    def probe(self, urls):
+        self.probed.extend(urls)
+        report = ProbeReport()
+        for url in urls:
+            story_id = url.split('/')[-1]
+            # the chapter count stands in for whatever changed on the site
+            report.fingerprints[('Site', story_id)] = Fingerprint(url, datetime(2020, 5, 1), ord(self.digests[story_id]))
+        return report
+
+    def rescrape(self, urls):
+        self.rescraped.extend(urls)
+        stories = [Story(url) for url in urls]
+        for fanfic in stories:
+            fanfic.scrape_status = 'complete'
+        return stories
+
+    def test_refresh(self):
+        daemon = RefreshDaemon(self.watchlist, self.probe, self.rescrape, budgets={'Site': 2}, retry_delay=60)
+        probed, changed = daemon.run_once(NOW)
+        self.assertEqual(probed, 2, 'Budget limits the checks')
+        self.assertEqual(changed, [], 'First checks only set baselines')
+
+        probed, changed = daemon.run_once(NOW + 3600)
+        self.assertEqual(probed, 1, 'Postponed story is checked once the budget refills')
+
+        self.digests['2'] = 'z'
+        probed, changed = daemon.run_once(NOW + 90 * DAY)
+        self.assertEqual(changed, [('Site', '2')], 'Changed story is detected')
+        self.assertEqual(self.rescraped, ['https://example.org/s/2'], 'Only the changed story is scraped')
+
+    def test_failed_rescrape(self):
+        daemon = RefreshDaemon(self.watchlist, self.probe, self.rescrape, retry_delay=60)
+        daemon.run_once(NOW)
+        self.digests['2'] = 'z'
+
+        def fail(urls):
+            raise IOError('site down')
+        daemon._rescrape = fail
+        probed, changed = daemon.run_once(NOW + 90 * DAY)
+        self.assertEqual(changed, [('Site', '2')])
+        self.assertEqual(self.watchlist.pop_due(NOW + 90 * DAY + 60), [('Site', '2')], 'Failed story is requeued')
+
+        daemon._rescrape = self.rescrape
+        self.watchlist.postpone(('Site', '2'), NOW + 91 * DAY)
+        probed, changed = daemon.run_once(NOW + 91 * DAY)
+        self.assertEqual(changed, [('Site', '2')], 'The change is found again')
+        self.assertEqual(self.rescraped, ['https://example.org/s/2'])
+        self.watchlist.postpone(('Site', '2'), NOW + 92 * DAY)
+        probed, changed = daemon.run_once(NOW + 92 * DAY)
+        self.assertEqual(changed, [], 'The change is stored once it was scraped')
+
+
+if __name__ == '__main__':
+    unittest.main()